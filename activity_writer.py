@@ -0,0 +1,153 @@
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, List
+
+from prometheus_client import Counter, Gauge
+
+# Records written per INSERT
+ACTIVITY_LOG_BATCH_SIZE = int(os.getenv('ACTIVITY_LOG_BATCH_SIZE', 100))
+
+# Milliseconds a record may wait before its batch is written
+ACTIVITY_LOG_FLUSH_MS = float(os.getenv('ACTIVITY_LOG_FLUSH_MS', 500))
+
+# Records held in memory before requests have to wait for the writer
+ACTIVITY_LOG_QUEUE_SIZE = int(os.getenv('ACTIVITY_LOG_QUEUE_SIZE', 10000))
+
+# Seconds a request waits for room in a full queue before its record is dropped
+ACTIVITY_LOG_ENQUEUE_TIMEOUT = float(os.getenv('ACTIVITY_LOG_ENQUEUE_TIMEOUT', 1.0))
+
+activity_log_queue_depth = Gauge('dbmonitor_activity_log_queue_depth', 'Activity log records waiting to be written')
+activity_log_written = Counter('dbmonitor_activity_log_written', 'Activity log records written')
+activity_log_dropped = Counter('dbmonitor_activity_log_dropped', 'Activity log records dropped, by reason', ['reason'])
+activity_log_enqueue_wait = Counter('dbmonitor_activity_log_enqueue_wait_seconds',
+                                    'Time requests spent waiting for room in a full activity log queue')
+
+
+class ActivityWriter:
+    """Writes activity log records from a background thread in bulk inserts.
+
+    Requests put records on a bounded queue and return without touching the
+    database. The writer thread inserts them every ``flush_interval`` seconds,
+    or as soon as ``batch_size`` records are waiting. A full queue makes
+    requests wait up to ``enqueue_timeout`` seconds, then drops the record.
+    """
+
+    def __init__(self, app, db, model, batch_size: int = ACTIVITY_LOG_BATCH_SIZE,
+                 flush_interval: float = ACTIVITY_LOG_FLUSH_MS / 1000.0,
+                 max_queue: int = ACTIVITY_LOG_QUEUE_SIZE, enqueue_timeout: float = ACTIVITY_LOG_ENQUEUE_TIMEOUT):
+        self.app = app
+        self.db = db
+        self.model = model
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        # Taking records off the queue and writing them happen under one lock,
+        # so flush() returns only after every earlier record is committed
+        self._write_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, record: Dict[str, Any]) -> bool:
+        """Queue one record (column values of the model); False if it was dropped"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            started = time.monotonic()
+            self._wake.set()
+            try:
+                self._queue.put(record, timeout=self.enqueue_timeout)
+            except queue.Full:
+                activity_log_dropped.labels(reason='queue_full').inc()
+                print("Activity log queue full, record dropped")
+                return False
+            finally:
+                activity_log_enqueue_wait.inc(time.monotonic() - started)
+
+        depth = self._queue.qsize()
+        activity_log_queue_depth.set(depth)
+        if depth >= self.batch_size:
+            self._wake.set()
+        return True
+
+    def flush(self) -> int:
+        """Write every queued record now; returns how many were written"""
+        with self._write_lock:
+            written = 0
+            while True:
+                batch = self._take()
+                if not batch:
+                    return written
+                written += self._write(batch)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Stop the writer thread and write what is left (registered with atexit)"""
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name='activity-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error writing activity logs: {str(e)}")
+
+    def _take(self) -> List[Dict[str, Any]]:
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        activity_log_queue_depth.set(self._queue.qsize())
+        return batch
+
+    def _write(self, batch: List[Dict[str, Any]]) -> int:
+        # A separate app context gets its own session, so a flush from inside
+        # a request never commits that request's pending changes
+        with self.app.app_context():
+            session = self.db.session
+            try:
+                session.bulk_insert_mappings(self.model, batch)
+                session.commit()
+                activity_log_written.inc(len(batch))
+                return len(batch)
+            except Exception as e:
+                session.rollback()
+                print(f"Error writing activity log batch, retrying records one by one: {str(e)}")
+
+            # One bad record (e.g. of a user deleted meanwhile) must not lose the batch
+            written = 0
+            for record in batch:
+                try:
+                    session.bulk_insert_mappings(self.model, [record])
+                    session.commit()
+                    written += 1
+                except Exception as e:
+                    session.rollback()
+                    activity_log_dropped.labels(reason='error').inc()
+                    print(f"Error writing activity log record: {str(e)}")
+            activity_log_written.inc(written)
+            return written
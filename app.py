@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, make_response
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
@@ -7,10 +7,29 @@ import os
 from dotenv import load_dotenv
 import bcrypt
 import json
-from db_monitor import DatabaseMonitor
-from datetime import datetime, timezone
-import csv
-from io import StringIO
+import time
+import atexit
+from connection_pool import pool as connection_pool
+from collector import collect_many, metric_tiers, capabilities
+from metric_tiers import tier_intervals
+from circuit_breaker import breaker
+from snapshot_cache import snapshots, DEFAULT_MAX_AGE, MIN_MAX_AGE
+from metric_store import MetricStore, STORED_METRICS, utcnow
+from ring_buffer import recent_history
+from query_fingerprint import fingerprint_query, normalize_query
+from statement_stats import StatementStore, ORDERINGS as STATEMENT_ORDERINGS
+from query_search import create_search_index, include_object as include_search_objects
+from history_queries import HistoryQueries
+from activity_writer import ActivityWriter
+from health_checker import HealthChecker
+from leader_election import LeaderElection
+from sharding import CollectorWatch
+from snapshot_store import SnapshotStore
+from metrics_exporter import SnapshotCollector
+from prometheus_client import REGISTRY, generate_latest, CONTENT_TYPE_LATEST
+from pagination import paginate_keyset, estimate_count, InvalidCursor
+from csv_export import csv_response
+from datetime import datetime, timedelta, timezone
 
 load_dotenv()
 
@@ -20,7 +39,7 @@ app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///dbm
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+migrate = Migrate(app, db, include_object=include_search_objects)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
@@ -28,6 +47,8 @@ login_manager.login_view = 'login'
 def init_db():
     with app.app_context():
         db.create_all()
+        with db.engine.begin() as connection:
+            create_search_index(connection)
         # Create admin user if it doesn't exist
         admin = User.query.filter_by(username='admin').first()
         if not admin:
@@ -72,11 +93,18 @@ class ActivityLog(db.Model):
     access_time = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now())  # Using access_time instead of timestamp
     user_agent = db.Column(db.String(255), nullable=False, default='Unknown')  # New field for user agent
     user = db.relationship('User', backref=db.backref('activity_logs', lazy=True))
+    __table_args__ = (
+        # Keyset pagination seeks on (access_time, id), optionally per user
+        db.Index('ix_activity_log_time_id', 'access_time', 'id'),
+        db.Index('ix_activity_log_user_time_id', 'user_id', 'access_time', 'id'),
+    )
 
 class QueryHistory(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     server_id = db.Column(db.Integer, db.ForeignKey('database_server.id'), nullable=False)
     query_text = db.Column(db.Text, nullable=False)
+    fingerprint = db.Column(db.String(16), index=True,
+                            default=lambda ctx: fingerprint_query(ctx.get_current_parameters().get('query_text')))
     execution_time = db.Column(db.Float)  # in seconds
     status = db.Column(db.String(50))  # active, completed, error
     start_time = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
@@ -86,6 +114,11 @@ class QueryHistory(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     user = db.relationship('User', backref=db.backref('query_history', lazy=True))
     server = db.relationship('DatabaseServer', backref=db.backref('query_history', lazy=True))
+    __table_args__ = (
+        # Keyset pagination seeks on (start_time, id), optionally per server
+        db.Index('ix_query_history_time_id', 'start_time', 'id'),
+        db.Index('ix_query_history_server_time_id', 'server_id', 'start_time', 'id'),
+    )
 
 class DatabaseServer(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -98,37 +131,155 @@ class DatabaseServer(db.Model):
     created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
     last_error = db.Column(db.String(500))
     last_check = db.Column(db.DateTime)
+    # Seconds between metric polls; None uses the monitoring service default
+    poll_interval = db.Column(db.Integer)
+    # JSON seconds per metric tier, e.g. {"slow": 3600}; unset tiers use the defaults
+    tier_intervals = db.Column(db.Text)
     
     @property
     def is_connected(self):
-        if not self.last_check or (datetime.now(timezone.utc) - self.last_check).total_seconds() > 300:
-            self.test_connection()
-        return not bool(self.last_error)
+        """Last known status from the health checker; never opens a connection"""
+        return health_checker.status_of(self)['status'] == 'connected'
+    
+    def monitor_config(self):
+        """Connection settings used by DatabaseMonitor for this server"""
+        config = {
+            'db_type': self.db_type,
+            'host': self.host,
+            'port': self.port,
+            'database': 'postgres' if self.db_type == 'postgresql' else 'mysql',
+            'username': self.username,
+            'password': self.password
+        }
+        if self.tier_intervals:
+            config['tiers'] = self.tier_overrides
+        return config
+
+    @property
+    def tier_overrides(self):
+        """Seconds per metric tier set for this server"""
+        return json.loads(self.tier_intervals) if self.tier_intervals else {}
     
     def test_connection(self):
         try:
-            config = {
-                'db_type': self.db_type,
-                'host': self.host,
-                'port': self.port,
-                'database': 'postgres' if self.db_type == 'postgresql' else 'master',
-                'username': self.username,
-                'password': self.password
-            }
-            monitor = DatabaseMonitor(config)
-            monitor.connect()
-            monitor.close()
+            with connection_pool.monitor(self.id, self.monitor_config(), validate=True):
+                pass
             
             self.last_error = None
             self.last_check = datetime.now(timezone.utc)
             db.session.commit()
+            # An unsaved server has no status or circuit to update
+            if self.id is not None:
+                health_checker.record(self.id, 'connected', checked_at=self.last_check)
+                # The server is reachable again; stop skipping it
+                breaker.success(self.id, self.monitor_config())
             return True
         except Exception as e:
             self.last_error = str(e)
             self.last_check = datetime.now(timezone.utc)
             db.session.commit()
+            if self.id is not None:
+                health_checker.record(self.id, 'error', self.last_error, checked_at=self.last_check)
             return False
 
+class MetricSample(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    server_id = db.Column(db.Integer, db.ForeignKey('database_server.id', ondelete='CASCADE'), nullable=False)
+    metric = db.Column(db.String(64), nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False)  # UTC
+    value = db.Column(db.Float, nullable=False)
+    __table_args__ = (
+        db.Index('ix_metric_sample_series', 'server_id', 'metric', 'timestamp'),
+        db.Index('ix_metric_sample_timestamp', 'timestamp'),
+    )
+
+class MetricRollup(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    resolution = db.Column(db.String(8), nullable=False)  # 1m, 1h, 1d
+    server_id = db.Column(db.Integer, db.ForeignKey('database_server.id', ondelete='CASCADE'), nullable=False)
+    metric = db.Column(db.String(64), nullable=False)
+    bucket_start = db.Column(db.DateTime, nullable=False)  # UTC
+    min_value = db.Column(db.Float, nullable=False)
+    max_value = db.Column(db.Float, nullable=False)
+    avg_value = db.Column(db.Float, nullable=False)
+    last_value = db.Column(db.Float, nullable=False)
+    sample_count = db.Column(db.Integer, nullable=False)
+    __table_args__ = (
+        db.Index('ix_metric_rollup_series', 'resolution', 'server_id', 'metric', 'bucket_start', unique=True),
+        db.Index('ix_metric_rollup_bucket', 'resolution', 'bucket_start'),
+    )
+
+class StatementSample(db.Model):
+    """Per-interval activity of one statement (pg_stat_statements / digest summary)"""
+    id = db.Column(db.Integer, primary_key=True)
+    server_id = db.Column(db.Integer, db.ForeignKey('database_server.id', ondelete='CASCADE'), nullable=False)
+    statement_key = db.Column(db.String(100), nullable=False)  # queryid or schema:digest
+    collected_at = db.Column(db.DateTime, nullable=False)  # UTC, end of the interval
+    interval_seconds = db.Column(db.Float, nullable=False)
+    calls = db.Column(db.BigInteger, nullable=False)
+    total_time_ms = db.Column(db.Float, nullable=False)
+    row_count = db.Column(db.BigInteger, nullable=False)
+    __table_args__ = (
+        db.Index('ix_statement_sample_server_time', 'server_id', 'collected_at'),
+        db.Index('ix_statement_sample_collected_at', 'collected_at'),
+    )
+
+class StatementText(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    server_id = db.Column(db.Integer, db.ForeignKey('database_server.id', ondelete='CASCADE'), nullable=False)
+    statement_key = db.Column(db.String(100), nullable=False)
+    fingerprint = db.Column(db.String(16), index=True)
+    database_name = db.Column(db.String(100))
+    query_text = db.Column(db.Text, nullable=False)
+    first_seen = db.Column(db.DateTime, nullable=False)
+    __table_args__ = (
+        db.Index('ix_statement_text_key', 'server_id', 'statement_key', unique=True),
+    )
+
+class CollectorLease(db.Model):
+    """Heartbeat row of a running collector; the live ones split the servers (sharding.py)"""
+    collector_id = db.Column(db.String(100), primary_key=True)
+    hostname = db.Column(db.String(255), nullable=False)
+    pid = db.Column(db.Integer, nullable=False)
+    started_at = db.Column(db.DateTime, nullable=False)
+    heartbeat_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+class LeaderLease(db.Model):
+    """Holder of an elected role when the database has no advisory locks (leader_election.py)"""
+    name = db.Column(db.String(50), primary_key=True)
+    holder = db.Column(db.String(100), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+class ServerSnapshot(db.Model):
+    """Latest collection result per server, shared by the collecting process with the others"""
+    server_id = db.Column(db.Integer, db.ForeignKey('database_server.id', ondelete='CASCADE'), primary_key=True)
+    status = db.Column(db.String(20), nullable=False)
+    error = db.Column(db.Text)
+    metrics = db.Column(db.Text)  # JSON
+    queries = db.Column(db.Text)  # JSON
+    duration_seconds = db.Column(db.Float)
+    collected_at = db.Column(db.Float, nullable=False, index=True)  # epoch seconds, as in SnapshotCache
+
+metric_store = MetricStore(db, MetricSample, MetricRollup)
+statement_store = StatementStore(db, StatementSample, StatementText)
+history_queries = HistoryQueries(db, ActivityLog, QueryHistory)
+activity_writer = ActivityWriter(app, db, ActivityLog)
+atexit.register(activity_writer.close)
+health_checker = HealthChecker(app, db, DatabaseServer)
+snapshot_store = SnapshotStore(app, db, ServerSnapshot)
+# Started per gunicorn worker (gunicorn.conf.py); the elected worker collects
+collector_election = LeaderElection(app, db, LeaderLease, 'collector')
+# Live collector leases mean the servers are polled by collectors (run_collector.py or the elected worker)
+collector_leases = CollectorWatch(app, db, CollectorLease)
+
+@app.before_request
+def start_health_checker():
+    """Probe servers in the background from the first request on"""
+    # Under an election only the elected process checks servers
+    if not app.testing and not collector_election.started and not health_checker.running:
+        health_checker.start()
+
 @login_manager.user_loader
 def load_user(user_id):
     user = User.query.get(int(user_id))
@@ -182,17 +333,15 @@ def log_activity(user_id, menu_accessed, details=None):
             if details:
                 action_details += f" - {details}"
         
-        activity = ActivityLog(
+        # Written in batches by the background writer, not in this request
+        activity_writer.submit(dict(
             user_id=user_id,
             access_ip=request.remote_addr,
             menu_accessed=action_details,
             access_time=datetime.now(),
             user_agent=user_agent
-        )
-        db.session.add(activity)
-        db.session.commit()
+        ))
     except Exception as e:
-        db.session.rollback()
         app.logger.error(f"Error logging activity: {str(e)}")
 
 @app.route('/')
@@ -243,143 +392,158 @@ def users():
 @app.route('/activity_logs')
 @login_required
 def activity_logs():
-    page = request.args.get('page', 1, type=int)
     export = request.args.get('export', False, type=bool)
     per_page = 20  # Increased from 10 to show more logs per page
 
-    # Create base query
-    query = ActivityLog.query
-
-    # If user is not admin, only show their own logs
-    if current_user.role != 'admin':
-        query = query.filter_by(user_id=current_user.id)
-
-    # Order by access_time descending
-    query = query.order_by(ActivityLog.access_time.desc())
+    query = _activity_log_query()
 
     if export:
-        # Get all logs for export
-        logs = query.all()
-        
-        # Create CSV in memory
-        si = StringIO()
-        cw = csv.writer(si)
-        
-        # Write headers with more details
-        headers = ['Time', 'User', 'IP Address', 'Action', 'Browser/Client']
-        cw.writerow(headers)
-        
-        # Write data
-        for log in logs:
-            row = [
-                log.access_time.strftime('%Y-%m-%d %H:%M:%S'),  # Local time
-                log.user.username,
-                log.access_ip,
-                log.menu_accessed,
-                log.user_agent
-            ]
-            cw.writerow(row)
-        
-        output = si.getvalue()
-        si.close()
-        
+        # Order by access_time descending
+        query = query.order_by(ActivityLog.access_time.desc())
+
         # Generate filename with timestamp
         filename = f'activity_logs_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-        
-        # Create the response
-        response = make_response(output)
-        response.headers['Content-Disposition'] = f'attachment; filename={filename}'
-        response.headers['Content-type'] = 'text/csv'
-        return response
+
+        # Stream the CSV in batches instead of building it in memory
+        headers = ['Time', 'User', 'IP Address', 'Action', 'Browser/Client']
+        return csv_response(query, headers, lambda log: [
+            log.access_time.strftime('%Y-%m-%d %H:%M:%S'),  # Local time
+            log.user.username,
+            log.access_ip,
+            log.menu_accessed,
+            log.user_agent
+        ], filename, compress=_accepts_gzip())
     
     # Paginate for normal view
-    pagination = query.paginate(
-        page=page, per_page=per_page, error_out=False
-    )
-    
-    logs = pagination.items
-    total_pages = pagination.pages
+    try:
+        pagination = _paginate_activity_logs(query, per_page, request.args.get('cursor'))
+    except InvalidCursor as e:
+        flash(str(e))
+        return redirect(url_for('activity_logs'))
 
     return render_template('activity_logs.html', 
-                         logs=logs, 
-                         page=page, 
-                         total_pages=total_pages,
-                         max=max,
-                         min=min)
+                         logs=pagination.items, 
+                         pagination=pagination)
+
+def _accepts_gzip():
+    """Whether exports may be gzip-encoded; disable with ?gzip=0"""
+    return request.args.get('gzip', 1, type=int) == 1 and 'gzip' in request.accept_encodings
+
+def _activity_log_query():
+    """Activity logs visible to the current user"""
+    # Include records still waiting for the background writer
+    activity_writer.flush()
+    # If user is not admin, only show their own logs
+    return history_queries.activity_logs(None if current_user.role == 'admin' else current_user.id)
+
+def _paginate_activity_logs(query, per_page, cursor):
+    """Newest logs first; ``?count=1`` adds an estimated total"""
+    page = paginate_keyset(query, [ActivityLog.access_time, ActivityLog.id], per_page, cursor)
+    if request.args.get('count', type=int):
+        page.total_estimate = estimate_count(query)
+    return page
+
+@app.template_global()
+def url_for_page(cursor):
+    """URL of the current page's view at ``cursor``, keeping its other arguments"""
+    args = {key: value for key, value in request.args.items() if key != 'cursor'}
+    return url_for(request.endpoint, cursor=cursor, **args)
 
 @app.route('/query_history')
 @login_required
 def query_history():
     # Get search parameters
     server_id = request.args.get('server', type=int)
-    status = request.args.get('status')
-    search = request.args.get('search')
     export = request.args.get('export', type=int)
 
-    # Base query
-    query = QueryHistory.query
-
-    # Apply filters
-    if server_id:
-        query = query.filter_by(server_id=server_id)
-    if status:
-        query = query.filter_by(status=status)
-    if search:
-        query = query.filter(QueryHistory.query_text.ilike(f'%{search}%'))
-
-    # Order by start time descending
-    query = query.order_by(QueryHistory.start_time.desc())
+    query, rank = _query_history_query()
 
     # Get all database servers for the filter dropdown
     servers = DatabaseServer.query.all()
 
     if export:
-        # Get all matching queries for export
-        queries = query.all()
-        
-        # Create CSV
-        si = StringIO()
-        cw = csv.writer(si)
-        
-        # Write headers
+        # Get all matching queries for export, best search matches first
+        if rank is not None:
+            query = query.order_by(rank, QueryHistory.start_time.desc())
+        else:
+            query = query.order_by(QueryHistory.start_time.desc())
+        # Stream the CSV in batches instead of building it in memory
         headers = ['Server', 'Database', 'Username', 'Query', 'Status', 'Start Time', 'End Time', 'Execution Time (s)']
-        cw.writerow(headers)
-        
-        # Write data
-        for query in queries:
-            row = [
-                query.server.name,
-                query.database_name,
-                query.username,
-                query.query_text,
-                query.status,
-                query.start_time.strftime('%Y-%m-%d %H:%M:%S'),
-                query.end_time.strftime('%Y-%m-%d %H:%M:%S') if query.end_time else '',
-                f'{query.execution_time:.2f}' if query.execution_time else ''
-            ]
-            cw.writerow(row)
-        
-        output = si.getvalue()
-        si.close()
-        
-        # Create the response
-        response = make_response(output)
-        response.headers['Content-Disposition'] = 'attachment; filename=query_history.csv'
-        response.headers['Content-type'] = 'text/csv'
-        return response
+        return csv_response(query, headers, lambda q: [
+            q.server.name,
+            q.database_name,
+            q.username,
+            q.query_text,
+            q.status,
+            q.start_time.strftime('%Y-%m-%d %H:%M:%S'),
+            q.end_time.strftime('%Y-%m-%d %H:%M:%S') if q.end_time else '',
+            f'{q.execution_time:.2f}' if q.execution_time else ''
+        ], 'query_history.csv', compress=_accepts_gzip())
     
     # Get paginated queries for display
-    page = request.args.get('page', 1, type=int)
-    queries = query.paginate(page=page, per_page=50)
+    try:
+        pagination = _paginate_query_history(query, rank, 50, request.args.get('cursor'))
+    except InvalidCursor as e:
+        flash(str(e))
+        return redirect(url_for('query_history'))
+    
+    # What is expensive right now, from the statement statistics snapshots
+    window = request.args.get('window', 15, type=int)
+    top_statements = statement_store.top(utcnow() - timedelta(minutes=window), server_id=server_id)
     
-    return render_template('query_history.html', queries=queries, servers=servers)
+    return render_template('query_history.html', queries=pagination.items, pagination=pagination,
+                           servers=servers, top_statements=top_statements, window=window,
+                           server_names={server.id: server.name for server in servers})
+
+def _query_history_query():
+    """Query history filtered by the request arguments, and the search rank column if searching"""
+    return history_queries.query_history(
+        server_id=request.args.get('server', type=int),
+        status=request.args.get('status'),
+        fingerprint=request.args.get('fingerprint'),
+        search=request.args.get('search')
+    )
+
+def _paginate_query_history(query, rank, per_page, cursor):
+    """Newest queries first, or best matches first when searching; ``?count=1`` adds an estimated total"""
+    if rank is None:
+        page = paginate_keyset(query, [QueryHistory.start_time, QueryHistory.id], per_page, cursor)
+    else:
+        # The rank is selected with each row so the cursor can seek on it
+        page = paginate_keyset(query.add_columns(rank), [rank, QueryHistory.id], per_page, cursor,
+                               descending=False, key_values=lambda row: [row[1], row[0].id])
+        page.items = [row[0] for row in page.items]
+    if request.args.get('count', type=int):
+        page.total_estimate = estimate_count(query)
+    return page
 
 @app.route('/database_servers')
 @login_required
 def database_servers():
     log_activity(current_user.id, 'database servers')
     servers = DatabaseServer.query.all()
-    return render_template('database_servers.html', servers=servers)
+    # Cached status only; the health checker does the connecting
+    health = {server.id: health_checker.status_of(server) for server in servers}
+    return render_template('database_servers.html', servers=servers, health=health)
+
+def _tier_intervals(values):
+    """JSON of a server's metric tier intervals from a dict; blank values use the defaults"""
+    overrides = {tier: float(seconds) for tier, seconds in (values or {}).items()
+                 if seconds is not None and str(seconds).strip() != ''}
+    tier_intervals(overrides)  # validates
+    return json.dumps(overrides) if overrides else None
+
+def _form_tier_intervals(form):
+    return _tier_intervals({tier: form.get(f'{tier}_tier_interval') for tier in ('medium', 'slow')})
+
+def _poll_interval(value):
+    """Seconds between metric polls of a server; blank means the service default"""
+    if value is None or str(value).strip() == '':
+        return None
+    interval = int(value)
+    if interval < 1:
+        raise ValueError('Poll interval must be at least 1 second')
+    return interval
 
 @app.route('/add_server', methods=['GET', 'POST'])
 @login_required
@@ -393,7 +557,9 @@ def add_server_page():
                 host=request.form['host'],
                 port=int(request.form['port']),
                 username=request.form['username'],
-                password=request.form['password']
+                password=request.form['password'],
+                poll_interval=_poll_interval(request.form.get('poll_interval')),
+                tier_intervals=_form_tier_intervals(request.form)
             )
             
             # Test connection
@@ -444,7 +610,9 @@ def add_server_api():
             host=data['host'].strip(),
             port=data['port'],
             username=data['username'].strip(),
-            password=data['password']  # In production, this should be encrypted
+            password=data['password'],  # In production, this should be encrypted
+            poll_interval=_poll_interval(data.get('poll_interval')),
+            tier_intervals=_tier_intervals(data.get('tier_intervals'))
         )
         
         # Test connection
@@ -463,7 +631,9 @@ def add_server_api():
             'host': server.host,
             'port': server.port,
             'username': server.username,
-            'db_type': server.db_type
+            'db_type': server.db_type,
+            'poll_interval': server.poll_interval,
+            'tier_intervals': server.tier_overrides
         }), 201
         
     except Exception as e:
@@ -490,6 +660,14 @@ def edit_server_page(server_id):
             server.username = request.form['username']
             if request.form['password']:  # Only update password if provided
                 server.password = request.form['password']
+            server.poll_interval = _poll_interval(request.form.get('poll_interval'))
+            server.tier_intervals = _form_tier_intervals(request.form)
+            
+            # Pooled connections and cached metrics still use the old settings
+            connection_pool.invalidate(server.id)
+            snapshots.discard(server.id)
+            metric_tiers.forget(server.id)
+            capabilities.forget(server.id)
             
             # Test connection with new credentials
             if not server.test_connection():
@@ -551,6 +729,16 @@ def edit_server_api(server_id):
             server.username = data['username'].strip()
         if 'password' in data:
             server.password = data['password']
+        if 'poll_interval' in data:
+            server.poll_interval = _poll_interval(data['poll_interval'])
+        if 'tier_intervals' in data:
+            server.tier_intervals = _tier_intervals(data['tier_intervals'])
+            
+        # Pooled connections and cached metrics still use the old settings
+        connection_pool.invalidate(server.id)
+        snapshots.discard(server.id)
+        metric_tiers.forget(server.id)
+        capabilities.forget(server.id)
             
         # Test connection with new credentials
         if not server.test_connection():
@@ -575,7 +763,9 @@ def edit_server_api(server_id):
             'name': server.name,
             'host': server.host,
             'port': server.port,
-            'username': server.username
+            'username': server.username,
+            'poll_interval': server.poll_interval,
+            'tier_intervals': server.tier_overrides
         })
         
     except Exception as e:
@@ -589,8 +779,16 @@ def delete_server(server_id):
         server = DatabaseServer.query.get_or_404(server_id)
         server_name = server.name
         
+        metric_store.purge_server(server_id)
+        statement_store.purge_server(server_id)
+        snapshot_store.discard(server_id)
         db.session.delete(server)
         db.session.commit()
+        connection_pool.invalidate(server_id)
+        snapshots.discard(server_id)
+        metric_tiers.forget(server_id)
+        capabilities.forget(server_id)
+        recent_history.discard(server_id)
         
         # Log the deletion
         log_activity(current_user.id, "servers", f"Deleted database server: {server_name}")
@@ -790,6 +988,77 @@ def get_users():
         'is_active': user.is_active
     } for user in users])
 
+# Seconds between keep-alive comments on idle metric streams
+SSE_HEARTBEAT = float(os.getenv('SSE_HEARTBEAT', 15))
+
+EMPTY_SNAPSHOT = {
+    'status': 'pending', 'error': None, 'metrics': None, 'queries': [],
+    'collected_at': None, 'age_seconds': None
+}
+
+def _query_bounds():
+    """``?query_limit=`` and ``?query_chars=`` of the current request; None leaves a bound as collected"""
+    limit = request.args.get('query_limit', type=int)
+    chars = request.args.get('query_chars', type=int)
+    return (None if limit is None else max(0, limit)), (None if chars is None else max(0, chars))
+
+def _bounded_queries(queries, limit=None, chars=None):
+    """The first ``limit`` queries (longest-running first) with texts cut to ``chars``; copies, never the cached ones"""
+    if limit is not None:
+        queries = queries[:limit]
+    if chars is not None:
+        queries = [dict(query, query=query['query'][:chars], query_truncated=True)
+                   if isinstance(query.get('query'), str) and len(query['query']) > chars else query
+                   for query in queries]
+    return queries
+
+def _server_entry(server, snapshot, bounds=(None, None)):
+    """One server item of the /api/metrics response"""
+    return {
+        'id': server['id'],
+        'name': server['name'],
+        'type': server['type'],
+        'host': server['host'],
+        'port': server['port'],
+        'status': snapshot['status'],
+        'error': snapshot['error'],
+        'metrics': snapshot['metrics'],
+        'queries': _bounded_queries(snapshot['queries'], *bounds),
+        'collected_at': snapshot['collected_at'],
+        'age_seconds': snapshot['age_seconds'],
+        'circuit': breaker.state(server['id'])
+    }
+
+def _max_ages(servers, requested=None):
+    """Snapshot age per server id at which a request re-collects it.
+
+    By default a server is re-collected once per poll interval. A request may
+    ask for fresher or older snapshots, but never fresher than MIN_MAX_AGE.
+    """
+    if requested is not None:
+        return dict.fromkeys((server.id for server in servers), max(requested, MIN_MAX_AGE))
+    return {server.id: server.poll_interval or DEFAULT_MAX_AGE for server in servers}
+
+def _refresh_snapshots(targets, max_age):
+    """Bring the cached snapshots of ``targets`` up to date; returns the results collected here.
+
+    Only a process without any collector polls on request. A MonitoringService
+    in this process keeps the snapshots current itself. While another process
+    is the elected collector, or any collector holds a lease, new snapshots
+    are read from the shared table instead, so web workers never poll the
+    servers.
+    """
+    if snapshots.has_collector():
+        return {}
+    if collector_election.following or collector_leases.active():
+        snapshot_store.sync_into(snapshots)
+        return {}
+    return snapshots.refresh(targets, max_age, collect_many)
+
+def _server_info(server):
+    return {'id': server.id, 'name': server.name, 'type': server.db_type,
+            'host': server.host, 'port': server.port}
+
 @app.route('/api/metrics')
 @login_required
 def get_metrics():
@@ -802,59 +1071,30 @@ def get_metrics():
         else:
             servers = [DatabaseServer.query.get_or_404(int(db_id))]
         
+        # Serve the latest snapshot written by MonitoringService and only
+        # re-collect servers whose snapshot is older than their poll interval
+        # (or max_age, if larger). Refreshes run concurrently so slow hosts
+        # time out on their own deadline.
+        max_ages = _max_ages(servers, request.args.get('max_age', type=float))
+        refreshed = _refresh_snapshots({server.id: server.monitor_config() for server in servers}, max_ages)
+        bounds = _query_bounds()
+        
         all_metrics = []
         
         for server in servers:
-            server_metrics = {
-                'id': server.id,
-                'name': server.name,
-                'type': server.db_type,
-                'host': server.host,
-                'port': server.port,
-                'status': 'error',
-                'error': None,
-                'metrics': None,
-                'queries': []
-            }
-            
-            try:
-                config = {
-                    'db_type': server.db_type,
-                    'host': server.host,
-                    'port': server.port,
-                    'database': 'postgres' if server.db_type == 'postgresql' else 'mysql',
-                    'username': server.username,
-                    'password': server.password
-                }
-                
-                print(f"Connecting to server {server.name} ({server.db_type})")
-                monitor = DatabaseMonitor(config)
-                monitor.connect()
-                
-                # Get metrics
-                metrics = monitor.get_performance_metrics()
-                active_queries = monitor.get_active_queries()
-                
-                server_metrics['status'] = 'connected'
-                server_metrics['metrics'] = metrics
-                server_metrics['queries'] = active_queries
-                
-                # Update server status in database
-                server.last_check = datetime.now(timezone.utc)
-                server.last_error = None
-                db.session.commit()
+            snapshot = snapshots.get(server.id) or EMPTY_SNAPSHOT
+            if server.id in refreshed:
+                if snapshot['error']:
+                    print(f"Error collecting metrics from {server.name}: {snapshot['error']}")
                 
-            except Exception as e:
-                error_msg = str(e)
-                print(f"Error collecting metrics from {server.name}: {error_msg}")
-                server_metrics['error'] = error_msg
-                
-                # Update server status in database
-                server.last_check = datetime.now(timezone.utc)
-                server.last_error = error_msg
-                db.session.commit()
+                # A metrics poll is also a health check
+                health_checker.record(server.id, snapshot['status'], snapshot['error'])
             
-            all_metrics.append(server_metrics)
+            all_metrics.append(_server_entry(_server_info(server), snapshot, bounds))
+        
+        if refreshed and not health_checker.running:
+            # Without the background checker nobody else stores the status
+            health_checker.write()
         
         return jsonify({
             'status': 'success',
@@ -868,38 +1108,237 @@ def get_metrics():
             'message': str(e)
         }), 500
 
+def _exported_servers():
+    """Servers for the Prometheus collector; also called outside requests"""
+    with app.app_context():
+        return [_server_info(server) for server in DatabaseServer.query.all()]
+
+# Rendered from the snapshot cache at scrape time, by /metrics and by the
+# standalone port MonitoringService starts
+REGISTRY.register(SnapshotCollector(snapshots, _exported_servers))
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus exposition of this process's metrics (no login, for scrapers)"""
+    return Response(generate_latest(REGISTRY), content_type=CONTENT_TYPE_LATEST)
+
+@app.route('/api/servers/health')
+@login_required
+def servers_health():
+    """Last known connection status of every server, from memory"""
+    servers = DatabaseServer.query.all()
+    result = []
+    for server in servers:
+        health = health_checker.status_of(server)
+        result.append({
+            'id': server.id,
+            'name': server.name,
+            'status': health['status'],
+            'error': health['error'],
+            'checked_at': health['checked_at'].isoformat() if health['checked_at'] else None,
+            'latency_ms': health['latency_ms'],
+            'circuit': breaker.state(server.id)
+        })
+    return jsonify(result)
+
+@app.route('/api/metrics/stream')
+@login_required
+def metrics_stream():
+    """Push snapshot updates to the dashboard as Server-Sent Events.
+
+    Every new snapshot is sent as a ``metrics`` event carrying the same item
+    as /api/metrics. All open streams share the collections written to the
+    snapshot cache, so the monitored servers are queried once per interval no
+    matter how many dashboards are open.
+    """
+    db_id = request.args.get('db_id', 'all')
+    if db_id == 'all':
+        servers = DatabaseServer.query.all()
+    else:
+        servers = [DatabaseServer.query.get_or_404(int(db_id))]
+    
+    # Plain dicts, so the generator never touches the ORM session
+    info = {server.id: _server_info(server) for server in servers}
+    targets = {server.id: server.monitor_config() for server in servers}
+    max_ages = _max_ages(servers, request.args.get('max_age', type=float))
+    bounds = _query_bounds()
+    
+    def events():
+        subscription = snapshots.subscribe(info)
+        try:
+            yield f"retry: {int(SSE_HEARTBEAT * 1000)}\n\n"
+            pending = list(info)
+            refresh_due = True
+            while True:
+                for server_id in pending:
+                    snapshot = snapshots.get(server_id)
+                    if snapshot is not None:
+                        payload = app.json.dumps(_server_entry(info[server_id], snapshot, bounds))
+                        yield f"event: metrics\nid: {server_id}\ndata: {payload}\n\n"
+                
+                if refresh_due:
+                    # Without a running MonitoringService somebody has to
+                    # collect (or read what the elected collector shared);
+                    # results arrive through the subscription like any
+                    # other put(), and concurrent streams share them.
+                    _refresh_snapshots(targets, max_ages)
+                
+                started = time.monotonic()
+                pending = subscription.get(SSE_HEARTBEAT)
+                if not pending:
+                    yield ": keepalive\n\n"
+                refresh_due = time.monotonic() - started >= SSE_HEARTBEAT
+        finally:
+            snapshots.unsubscribe(subscription)
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/api/server/<int:server_id>/metrics')
 @login_required
 def server_metrics(server_id):
     try:
         server = DatabaseServer.query.get_or_404(server_id)
         
-        # Get server metrics
-        config = {
-            'db_type': server.db_type,
-            'host': server.host,
-            'port': server.port,
-            'database': 'postgres' if server.db_type == 'postgresql' else 'master',
-            'username': server.username,
-            'password': server.password
-        }
-        
-        monitor = DatabaseMonitor(config)
-        monitor.connect()  # Need to connect first
-        metrics = monitor.get_performance_metrics()
-        active_queries = monitor.get_active_queries()
-        monitor.close()
+        # Get server metrics from the snapshot, refreshing it when too old
+        _refresh_snapshots({server.id: server.monitor_config()},
+                           _max_ages([server], request.args.get('max_age', type=float)))
+        snapshot = snapshots.get(server.id)
+        if snapshot is None or snapshot['status'] != 'connected':
+            error = snapshot['error'] if snapshot else 'No metrics collected yet'
+            return jsonify({'error': error}), 500
         
+        metrics = snapshot['metrics']
         return jsonify({
             'cpu_percent': metrics.get('cpu_percent', 0),
             'memory_percent': metrics.get('memory_percent', 0),
             'disk_usage': metrics.get('disk_usage', 0),
             'active_connections': metrics.get('active_connections', 0),
-            'active_queries': active_queries
+            'active_queries': _bounded_queries(snapshot['queries'], *_query_bounds()),
+            'collected_at': snapshot['collected_at'],
+            'age_seconds': snapshot['age_seconds']
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/server/<int:server_id>/queries/<int:pid>')
+@login_required
+def server_query_text(server_id, pid):
+    """Full text of the query one session is running, read from the server on demand"""
+    server = DatabaseServer.query.get_or_404(server_id)
+    try:
+        with connection_pool.monitor(server.id, server.monitor_config()) as monitor:
+            text = monitor.get_query_text(pid)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    if text is None:
+        return jsonify({'error': f'Session {pid} is not running a query'}), 404
+    return jsonify({'server_id': server.id, 'pid': pid, 'query': text})
+
+def _parse_time(value, default):
+    """Parse an ISO-8601 string or epoch seconds into a naive UTC datetime"""
+    if not value:
+        return default
+    try:
+        return datetime.fromtimestamp(float(value), timezone.utc).replace(tzinfo=None)
+    except ValueError:
+        moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if moment.tzinfo is not None:
+            moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+        return moment
+
+@app.route('/api/server/<int:server_id>/history')
+@login_required
+def server_history(server_id):
+    server = DatabaseServer.query.get_or_404(server_id)
+    metric = request.args.get('metric', 'active_connections')
+    if metric not in STORED_METRICS:
+        return jsonify({'error': f'Unknown metric: {metric}'}), 400
+    
+    try:
+        end = _parse_time(request.args.get('to'), utcnow())
+        start = _parse_time(request.args.get('from'), end - timedelta(hours=1))
+    except ValueError:
+        return jsonify({'error': 'from and to must be ISO-8601 timestamps or epoch seconds'}), 400
+    if start >= end:
+        return jsonify({'error': 'from must be before to'}), 400
+    
+    # Default to roughly 300 points across the requested range
+    step = request.args.get('step', type=float) or max(1.0, (end - start).total_seconds() / 300)
+    
+    return jsonify(metric_store.history(server.id, metric, start, end, step))
+
+@app.route('/api/server/<int:server_id>/recent')
+@login_required
+def server_recent(server_id):
+    """Recent samples from the in-memory ring buffer, for sparklines"""
+    server = DatabaseServer.query.get_or_404(server_id)
+    metrics = [name for name in request.args.get('metrics', 'active_connections').split(',') if name]
+    unknown = [name for name in metrics if name not in STORED_METRICS]
+    if unknown:
+        return jsonify({'error': f"Unknown metric: {', '.join(unknown)}"}), 400
+    
+    seconds = request.args.get('seconds', 900, type=float)
+    since_ms = int((datetime.now(timezone.utc).timestamp() - seconds) * 1000)
+    window = recent_history.window(server.id, since_ms, metrics)
+    window['server_id'] = server.id
+    return jsonify(window)
+
+@app.route('/api/query_history', methods=['GET'])
+@login_required
+def list_query_history():
+    """One page of query history; pass ``next_cursor``/``prev_cursor`` back as ``cursor``"""
+    per_page = max(1, min(request.args.get('per_page', 50, type=int), 500))
+    query, rank = _query_history_query()
+    try:
+        page = _paginate_query_history(query, rank, per_page, request.args.get('cursor'))
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({
+        'items': [{
+            'id': q.id,
+            'server_id': q.server_id,
+            'server': q.server.name,
+            'database': q.database_name,
+            'username': q.username,
+            'query_text': q.query_text,
+            'fingerprint': q.fingerprint,
+            'status': q.status,
+            'start_time': q.start_time.isoformat(),
+            'end_time': q.end_time.isoformat() if q.end_time else None,
+            'execution_time': q.execution_time
+        } for q in page.items],
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor,
+        'total_estimate': page.total_estimate
+    })
+
+@app.route('/api/activity_logs')
+@login_required
+def list_activity_logs():
+    """One page of activity logs; pass ``next_cursor``/``prev_cursor`` back as ``cursor``"""
+    per_page = max(1, min(request.args.get('per_page', 20, type=int), 500))
+    query = _activity_log_query()
+    try:
+        page = _paginate_activity_logs(query, per_page, request.args.get('cursor'))
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({
+        'items': [{
+            'id': log.id,
+            'user': log.user.username,
+            'access_ip': log.access_ip,
+            'menu_accessed': log.menu_accessed,
+            'access_time': log.access_time.isoformat(),
+            'user_agent': log.user_agent
+        } for log in page.items],
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor,
+        'total_estimate': page.total_estimate
+    })
+
 @app.route('/api/query_history', methods=['POST'])
 @login_required
 def add_query():
@@ -935,6 +1374,7 @@ def add_query():
         return jsonify({
             'id': query.id,
             'query_text': query.query_text,
+            'fingerprint': query.fingerprint,
             'execution_time': query.execution_time,
             'status': query.status,
             'error_message': query.error_message
@@ -944,6 +1384,53 @@ def add_query():
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
 
+@app.route('/api/top_statements')
+@login_required
+def top_statements():
+    """Statements with the most activity in the last ``minutes``"""
+    server_id = request.args.get('server', type=int)
+    minutes = request.args.get('minutes', 15, type=float)
+    order = request.args.get('order', 'total_time')
+    if order not in STATEMENT_ORDERINGS:
+        return jsonify({'error': f"order must be one of: {', '.join(STATEMENT_ORDERINGS)}"}), 400
+    limit = min(request.args.get('limit', 20, type=int), 500)
+    
+    return jsonify(statement_store.top(utcnow() - timedelta(minutes=minutes), server_id=server_id,
+                                       order=order, limit=limit))
+
+@app.route('/api/query_history/groups')
+@login_required
+def query_history_groups():
+    """Stored queries grouped by fingerprint, most frequent first"""
+    server_id = request.args.get('server', type=int)
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    
+    groups = db.session.query(
+        QueryHistory.fingerprint,
+        db.func.count(QueryHistory.id),
+        db.func.avg(QueryHistory.execution_time),
+        db.func.max(QueryHistory.execution_time),
+        db.func.max(QueryHistory.start_time),
+        db.func.min(QueryHistory.id)
+    ).filter(QueryHistory.fingerprint.isnot(None))
+    if server_id:
+        groups = groups.filter(QueryHistory.server_id == server_id)
+    groups = groups.group_by(QueryHistory.fingerprint).order_by(
+        db.func.count(QueryHistory.id).desc()).limit(limit).all()
+    
+    # One representative statement per group for the normalized text
+    samples = dict(db.session.query(QueryHistory.id, QueryHistory.query_text).filter(
+        QueryHistory.id.in_([group[5] for group in groups])).all()) if groups else {}
+    
+    return jsonify([{
+        'fingerprint': fingerprint,
+        'query': normalize_query(samples.get(sample_id)),
+        'count': count,
+        'avg_execution_time': avg_time,
+        'max_execution_time': max_time,
+        'last_seen': last_seen.isoformat() if last_seen else None
+    } for fingerprint, count, avg_time, max_time, last_seen, sample_id in groups])
+
 @app.route('/api/query_history/<int:query_id>', methods=['DELETE'])
 @login_required
 def delete_query(query_id):
@@ -0,0 +1,58 @@
+import threading
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from connection_pool import config_key
+
+
+class CapabilityCache:
+    """What each monitored server supports, probed once per connection settings.
+
+    ``attach`` probes a server on its first collection (see
+    DatabaseMonitor.probe_capabilities) and hands the result to the monitor,
+    which then only sends statements the server can answer. The result is
+    kept until the server's connection settings change, so a missing
+    extension or view costs one catalog query instead of a failed statement
+    on every poll.
+    """
+
+    def __init__(self):
+        self._entries: Dict[Any, Tuple[Tuple, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Probed capabilities of a server, None if not probed with these settings"""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or entry[0] != config_key(config):
+            return None
+        return entry[1]
+
+    def attach(self, key, config: Dict[str, Any], monitor) -> Dict[str, Any]:
+        """Set ``monitor.capabilities``, probing through its connection if needed"""
+        capabilities = self.get(key, config)
+        if capabilities is None:
+            capabilities = monitor.probe_capabilities()
+            with self._lock:
+                self._entries[key] = (config_key(config), capabilities)
+            missing = sorted(name for name, supported in capabilities['features'].items() if not supported)
+            if missing:
+                print(f"Server {key} ({capabilities['version']}) lacks: {', '.join(missing)}")
+        monitor.capabilities = capabilities
+        return capabilities
+
+    def supports(self, key, config: Dict[str, Any], feature: str) -> Optional[bool]:
+        """Whether a probed server has ``feature``; None until it has been probed"""
+        capabilities = self.get(key, config)
+        if capabilities is None:
+            return None
+        return bool(capabilities['features'].get(feature))
+
+    def forget(self, key) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def retain(self, keys: Iterable) -> None:
+        keep = set(keys)
+        with self._lock:
+            for key in [k for k in self._entries if k not in keep]:
+                del self._entries[key]
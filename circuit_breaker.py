@@ -0,0 +1,158 @@
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional
+
+from prometheus_client import Counter, Gauge
+
+from connection_pool import config_key
+
+# Consecutive failures after which a server's circuit opens
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', 3))
+
+# Seconds before the first retry of an open circuit; doubles after every failed retry
+BREAKER_BASE_DELAY = float(os.getenv('BREAKER_BASE_DELAY', 15))
+
+# Longest wait between retries of an open circuit
+BREAKER_MAX_DELAY = float(os.getenv('BREAKER_MAX_DELAY', 600))
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+circuit_state = Gauge('dbmonitor_circuit_state', 'Circuit breaker state per server (0 closed, 1 half-open, 2 open)',
+                      ['server_id'])
+circuit_opened = Counter('dbmonitor_circuit_opened', 'Times a server circuit opened', ['server_id'])
+circuit_rejected = Counter('dbmonitor_circuit_rejected', 'Collections skipped because the circuit was open',
+                           ['server_id'])
+
+
+def _remove_series(key) -> None:
+    """Drop a forgotten server's series; the counters only exist once incremented"""
+    for metric in (circuit_state, circuit_opened, circuit_rejected):
+        try:
+            metric.remove(str(key))
+        except KeyError:
+            pass
+
+
+class _Circuit:
+    def __init__(self, version):
+        self.version = version
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.retry_at = 0.0
+        self.last_error: Optional[str] = None
+
+
+class CircuitBreaker:
+    """Per-server circuit breaker for collections and health checks.
+
+    A circuit opens after ``threshold`` consecutive failures; while open,
+    callers are turned away without connecting. Once the retry delay has
+    passed, one caller is let through (half-open): success closes the
+    circuit, failure opens it again with twice the delay, up to
+    ``max_delay``. Delays are jittered so dead servers are not retried in
+    lockstep. Changed connection settings reset the circuit.
+    """
+
+    def __init__(self, threshold: int = BREAKER_FAILURE_THRESHOLD, base_delay: float = BREAKER_BASE_DELAY,
+                 max_delay: float = BREAKER_MAX_DELAY):
+        self.threshold = threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._circuits: Dict[Any, _Circuit] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _version(config: Optional[Dict[str, Any]]):
+        if config is None:
+            return None
+        return config_key(config)
+
+    def _circuit(self, key, config) -> _Circuit:
+        version = self._version(config)
+        circuit = self._circuits.get(key)
+        if circuit is None or (version is not None and circuit.version != version):
+            circuit = self._circuits[key] = _Circuit(version)
+            circuit_state.labels(server_id=str(key)).set(_STATE_VALUES[CLOSED])
+        return circuit
+
+    def allow(self, key, config: Optional[Dict[str, Any]] = None) -> bool:
+        """Whether a connection attempt to ``key`` may be made now"""
+        with self._lock:
+            circuit = self._circuit(key, config)
+            if circuit.state == CLOSED:
+                return True
+            now = time.monotonic()
+            if now >= circuit.retry_at:
+                # Let exactly one trial through; if its outcome is never
+                # reported, another one is allowed after base_delay
+                self._set_state(key, circuit, HALF_OPEN)
+                circuit.retry_at = now + self.base_delay
+                return True
+        circuit_rejected.labels(server_id=str(key)).inc()
+        return False
+
+    def success(self, key, config: Optional[Dict[str, Any]] = None) -> None:
+        with self._lock:
+            circuit = self._circuit(key, config)
+            circuit.failures = 0
+            circuit.trips = 0
+            circuit.last_error = None
+            self._set_state(key, circuit, CLOSED)
+
+    def failure(self, key, error: Optional[str] = None, config: Optional[Dict[str, Any]] = None) -> None:
+        with self._lock:
+            circuit = self._circuit(key, config)
+            circuit.failures += 1
+            circuit.last_error = error
+            if circuit.state == HALF_OPEN or (circuit.state == CLOSED and circuit.failures >= self.threshold):
+                circuit.trips += 1
+                delay = min(self.max_delay, self.base_delay * 2 ** (circuit.trips - 1))
+                # Equal jitter: between half and all of the delay
+                circuit.retry_at = time.monotonic() + delay * random.uniform(0.5, 1.0)
+                self._set_state(key, circuit, OPEN)
+                circuit_opened.labels(server_id=str(key)).inc()
+
+    def rejection(self, key) -> str:
+        """Error reported for a collection skipped by an open circuit"""
+        with self._lock:
+            circuit = self._circuits.get(key)
+            if circuit is None:
+                return 'Circuit open'
+            retry_in = max(0.0, circuit.retry_at - time.monotonic())
+            message = f'Circuit open after {circuit.failures} failures; next attempt in {retry_in:.0f} seconds'
+            if circuit.last_error:
+                message += f' (last error: {circuit.last_error})'
+            return message
+
+    def state(self, key) -> Dict[str, Any]:
+        with self._lock:
+            circuit = self._circuits.get(key)
+            if circuit is None:
+                return {'state': CLOSED, 'failures': 0, 'retry_in': None}
+            retry_in = max(0.0, circuit.retry_at - time.monotonic()) if circuit.state == OPEN else None
+            return {'state': circuit.state, 'failures': circuit.failures, 'retry_in': retry_in}
+
+    def retain(self, keys: Iterable) -> None:
+        keep = set(keys)
+        with self._lock:
+            for key in [k for k in self._circuits if k not in keep]:
+                del self._circuits[key]
+                _remove_series(key)
+
+    def reset(self) -> None:
+        with self._lock:
+            for key in list(self._circuits):
+                _remove_series(key)
+            self._circuits.clear()
+
+    @staticmethod
+    def _set_state(key, circuit: _Circuit, state: str) -> None:
+        circuit.state = state
+        circuit_state.labels(server_id=str(key)).set(_STATE_VALUES[state])
+
+
+breaker = CircuitBreaker()
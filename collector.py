@@ -0,0 +1,215 @@
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from functools import partial
+from typing import Dict, Any, Callable, Optional, Tuple
+
+from capabilities import CapabilityCache
+from circuit_breaker import breaker
+from connection_pool import pool as connection_pool
+from counter_deltas import CounterDeltaEngine, apply_rates
+from db_monitor import DatabaseMonitor
+from metric_tiers import TierCache, tier_intervals
+from statement_stats import StatementDiffer
+
+# Seconds a single server may take before it is reported as timed out
+METRICS_TIMEOUT = float(os.getenv('METRICS_TIMEOUT', 10))
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('COLLECTOR_MAX_WORKERS', 16)),
+    thread_name_prefix='collector'
+)
+
+# Previous counter sample per server, shared by every caller of collect_server
+counter_deltas = CounterDeltaEngine()
+
+# Previous statement statistics snapshot per server
+statement_diffs = StatementDiffer()
+
+# Last values of the medium and slow metric tiers per server
+metric_tiers = TierCache(DatabaseMonitor.METRIC_TIERS)
+
+# Optional features of each server, probed on its first collection
+capabilities = CapabilityCache()
+
+# Attempts still running per (collect function, server id); a server stuck
+# past its deadline holds at most one worker per kind of collection
+_running: Dict[Tuple[Callable, Any], Any] = {}
+_running_lock = threading.Lock()
+
+
+def collect_server(server_id, config: Dict[str, Any]) -> Dict[str, Any]:
+    """Collect performance metrics and active queries from one server.
+
+    Only the metric tiers that are due are queried; the others are filled in
+    from earlier polls, with their ages in ``metrics['tier_ages']``. Queries
+    are picked from the server's probed capabilities.
+    """
+    tiers = metric_tiers.due(server_id, tier_intervals(config.get('tiers')), time.monotonic())
+    with connection_pool.monitor(server_id, config) as monitor:
+        capabilities.attach(server_id, config, monitor)
+        metrics = monitor.get_performance_metrics(tiers)
+        sampled_at = time.monotonic()
+        queries = monitor.get_active_queries()
+    metric_tiers.apply(server_id, tiers, metrics, sampled_at)
+    apply_rates(counter_deltas, server_id, config['db_type'], metrics, sampled_at)
+    return {'metrics': metrics, 'queries': queries}
+
+
+def _fan_out(targets: Dict[Any, Dict[str, Any]], timeout: float,
+             collect: Callable[[Any, Dict[str, Any]], Any], record: bool = True,
+             durations: Optional[Dict[Any, float]] = None) -> Dict[Any, Tuple[str, Any]]:
+    """Run ``collect(server_id, config)`` for every target concurrently.
+
+    Every server gets its own deadline of ``timeout`` seconds. Returns
+    ``(status, value)`` per server id, where status is ``connected`` with the
+    collected value, ``error``/``timeout`` with an error message, or ``open``
+    when the server's circuit breaker turned the attempt away. The driver
+    gets the same deadline as connect and statement timeout; a server whose
+    previous attempt has still not returned is reported as timed out
+    without starting another one. With
+    ``record`` the outcomes are reported to the breaker. Seconds spent per
+    attempted server are stored in ``durations`` if given.
+    """
+    outcomes: Dict[Any, Tuple[str, Any]] = {}
+    deadlines = {}
+    started = {}
+    stuck = []
+    for server_id, config in targets.items():
+        if not breaker.allow(server_id, config):
+            # Fail fast instead of holding a worker for the connect timeout
+            outcomes[server_id] = ('open', breaker.rejection(server_id))
+            continue
+        with _running_lock:
+            previous = _running.get((collect, server_id))
+        if previous is not None and not previous.done():
+            outcomes[server_id] = ('timeout', 'Previous attempt has not returned yet')
+            stuck.append(server_id)
+            continue
+        # Let the driver give up on unreachable hosts and stalled statements
+        # so workers are not held long after the caller stopped waiting.
+        config = dict(config, connect_timeout=config.get('connect_timeout') or max(1, math.ceil(timeout)),
+                      query_timeout=config.get('query_timeout') or timeout)
+        started[server_id] = time.monotonic()
+        future = _executor.submit(collect, server_id, config)
+        with _running_lock:
+            _running[(collect, server_id)] = future
+        future.add_done_callback(partial(_finished, (collect, server_id)))
+        deadlines[future] = (server_id, started[server_id] + timeout)
+
+    pending = set(deadlines)
+    while pending:
+        now = time.monotonic()
+        for future in [f for f in pending if deadlines[f][1] <= now]:
+            pending.discard(future)
+            future.cancel()
+            outcomes[deadlines[future][0]] = ('timeout', f'No response within {timeout:g} seconds')
+            if durations is not None:
+                durations[deadlines[future][0]] = timeout
+        if not pending:
+            break
+
+        next_deadline = min(deadlines[f][1] for f in pending)
+        done, pending = wait(pending, timeout=max(0, next_deadline - now), return_when=FIRST_COMPLETED)
+        for future in done:
+            if durations is not None:
+                durations[deadlines[future][0]] = time.monotonic() - started[deadlines[future][0]]
+            try:
+                outcomes[deadlines[future][0]] = ('connected', future.result())
+            except Exception as e:
+                outcomes[deadlines[future][0]] = ('error', str(e))
+
+    if record:
+        for server_id in [server_id for server_id, _ in deadlines.values()] + stuck:
+            status, value = outcomes[server_id]
+            if status == 'connected':
+                breaker.success(server_id, targets[server_id])
+            else:
+                breaker.failure(server_id, value, targets[server_id])
+    return outcomes
+
+
+def _finished(key, future) -> None:
+    with _running_lock:
+        if _running.get(key) is future:
+            del _running[key]
+
+
+def collect_many(targets: Dict[Any, Dict[str, Any]], timeout: float = METRICS_TIMEOUT) -> Dict[Any, Dict[str, Any]]:
+    """Collect from several servers concurrently.
+
+    ``targets`` maps server id to its DatabaseMonitor config. Every server
+    gets its own deadline of ``timeout`` seconds; servers that have not
+    answered by then are reported with status ``timeout`` while the others
+    are returned as soon as they finish. Servers whose circuit breaker is
+    open are skipped. The result maps server id to a dict with ``status``
+    (connected, error, timeout or open), ``metrics``, ``queries``, ``error``
+    and ``duration_seconds`` (None for skipped servers).
+    """
+    results = {}
+    durations = {}
+    for server_id, (status, value) in _fan_out(targets, timeout, collect_server, durations=durations).items():
+        connected = status == 'connected'
+        results[server_id] = {
+            'status': status,
+            'metrics': value['metrics'] if connected else None,
+            'queries': value['queries'] if connected else [],
+            'error': None if connected else value,
+            'duration_seconds': durations.get(server_id)
+        }
+    return results
+
+
+def collect_statement_stats(server_id, config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Per-interval statement statistics of one server, None on its first snapshot"""
+    with connection_pool.monitor(server_id, config) as monitor:
+        capabilities.attach(server_id, config, monitor)
+        snapshot = monitor.get_statement_stats()
+    return statement_diffs.diff(server_id, snapshot, time.monotonic())
+
+
+def collect_statements(targets: Dict[Any, Dict[str, Any]], timeout: float = METRICS_TIMEOUT) -> Dict[Any, Dict[str, Any]]:
+    """Collect statement statistics from several servers concurrently.
+
+    Returns per server id a dict with ``status``, ``error`` and ``interval``
+    (the result of StatementDiffer.diff, None on the first snapshot). Errors
+    here usually mean the statistics view is not enabled, so they do not
+    count against the circuit breaker. Servers probed without the view are
+    not contacted and get status ``unsupported``.
+    """
+    unsupported = {server_id for server_id, config in targets.items()
+                   if capabilities.supports(server_id, config, 'statements') is False}
+    results = {server_id: {
+        'status': status,
+        'interval': value if status == 'connected' else None,
+        'error': None if status == 'connected' else value
+    } for server_id, (status, value) in _fan_out(
+        {server_id: config for server_id, config in targets.items() if server_id not in unsupported},
+        timeout, collect_statement_stats, record=False).items()}
+    for server_id in unsupported:
+        results[server_id] = {'status': 'unsupported', 'interval': None,
+                              'error': 'Statement statistics are not available on this server'}
+    return results
+
+
+def probe_server(server_id, config: Dict[str, Any]) -> float:
+    """Check out a validated connection; returns the round trip in milliseconds"""
+    started = time.monotonic()
+    with connection_pool.monitor(server_id, config, validate=True):
+        pass
+    return (time.monotonic() - started) * 1000.0
+
+
+def probe_many(targets: Dict[Any, Dict[str, Any]], timeout: float = METRICS_TIMEOUT) -> Dict[Any, Dict[str, Any]]:
+    """Health-check several servers concurrently.
+
+    Returns per server id a dict with ``status`` (connected, error, timeout
+    or open), ``error`` and ``latency_ms``.
+    """
+    return {server_id: {
+        'status': status,
+        'latency_ms': value if status == 'connected' else None,
+        'error': None if status == 'connected' else value
+    } for server_id, (status, value) in _fan_out(targets, timeout, probe_server).items()}
@@ -0,0 +1,225 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, List, Tuple
+
+from db_monitor import DatabaseMonitor
+
+# Config keys that tune a collection rather than the connection it uses
+COLLECTION_OPTIONS = ('connect_timeout', 'query_timeout', 'tiers')
+
+
+def config_key(config: Dict[str, Any]) -> Tuple:
+    """Hashable form of a server's connection settings, without the collection options"""
+    return tuple(sorted((k, str(v)) for k, v in config.items() if k not in COLLECTION_OPTIONS))
+
+
+class PoolTimeoutError(ConnectionError):
+    """Raised when no pooled connection becomes available in time"""
+
+
+class _ServerSlot:
+    """Connections belonging to a single DatabaseServer row"""
+
+    def __init__(self, config_key: Tuple):
+        self.config_key = config_key
+        self.idle: List[Tuple[DatabaseMonitor, float]] = []
+        self.in_use = 0
+
+
+class ConnectionPool:
+    """Thread-safe pool of connected DatabaseMonitor instances keyed by server id.
+
+    Every server gets at most ``max_size`` open connections. Connections that
+    sat idle longer than ``validate_after`` seconds are pinged before being
+    handed out, and connections idle longer than ``idle_timeout`` are closed.
+    Checkouts and checkins sweep every server's idle connections at most
+    every half ``idle_timeout``, so a process that never calls
+    ``evict_idle`` (one without a collector) closes them too. When the
+    connection settings of a server change, its old connections are
+    discarded on the next checkout.
+    """
+
+    def __init__(self, max_size: int = 4, idle_timeout: float = 300.0,
+                 checkout_timeout: float = 10.0, validate_after: float = 30.0):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.validate_after = validate_after
+        self._slots: Dict[Any, _ServerSlot] = {}
+        self._cond = threading.Condition()
+        self._last_sweep = time.monotonic()
+
+    @contextmanager
+    def monitor(self, key, config: Dict[str, Any], validate: bool = False):
+        """Borrow a connected DatabaseMonitor for the server identified by ``key``.
+
+        The monitor goes back to the pool when the block exits normally and is
+        closed if the block raises. A ``key`` of None (e.g. an unsaved server)
+        bypasses the pool entirely.
+        """
+        if key is None:
+            monitor = DatabaseMonitor(config)
+            monitor.connect()
+            try:
+                yield monitor
+            finally:
+                monitor.close()
+            return
+
+        slot, monitor = self._checkout(key, config, validate)
+        try:
+            # Callers with a different deadline may share the connection
+            monitor.set_query_timeout(config.get('query_timeout'))
+            yield monitor
+        except BaseException:
+            self._checkin(key, slot, monitor, discard=True)
+            raise
+        else:
+            self._checkin(key, slot, monitor)
+
+    def _checkout(self, key, config: Dict[str, Any], validate: bool) -> Tuple[_ServerSlot, DatabaseMonitor]:
+        # Callers using different timeouts still share the same connections
+        slot_key = config_key(config)
+        deadline = time.monotonic() + self.checkout_timeout
+        stale: List[DatabaseMonitor] = []
+
+        while True:
+            candidate = None
+            with self._cond:
+                slot = self._slots.get(key)
+                if slot is None or slot.config_key != slot_key:
+                    if slot is not None:
+                        stale.extend(monitor for monitor, _ in slot.idle)
+                    slot = self._slots[key] = _ServerSlot(slot_key)
+
+                while candidate is None:
+                    if slot.idle:
+                        candidate = slot.idle.pop()
+                        slot.in_use += 1
+                    elif slot.in_use < self.max_size:
+                        slot.in_use += 1
+                        break
+                    else:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._close_all(stale)
+                            raise PoolTimeoutError(f"No pooled connection available for server {key}")
+                        self._cond.wait(remaining)
+                        if self._slots.get(key) is not slot:
+                            break
+
+                if self._slots.get(key) is not slot:
+                    # Invalidated while waiting; start over with a fresh slot.
+                    continue
+                stale.extend(self._sweep_if_due(time.monotonic()))
+
+            self._close_all(stale)
+            stale = []
+
+            if candidate is not None:
+                monitor, last_used = candidate
+                idle_for = time.monotonic() - last_used
+                if (not validate and idle_for < self.validate_after) or monitor.ping():
+                    return slot, monitor
+                self._close_all([monitor])
+                self._release_slot(key, slot)
+                continue
+
+            monitor = DatabaseMonitor(config)
+            try:
+                monitor.connect()
+            except Exception:
+                self._release_slot(key, slot)
+                raise
+            return slot, monitor
+
+    def _checkin(self, key, slot: _ServerSlot, monitor: DatabaseMonitor, discard: bool = False) -> None:
+        now = time.monotonic()
+        expired: List[DatabaseMonitor] = []
+        with self._cond:
+            slot.in_use -= 1
+            if discard or self._slots.get(key) is not slot or not monitor.connection:
+                expired.append(monitor)
+            else:
+                slot.idle.append((monitor, now))
+            expired.extend(self._evict_expired(slot, now))
+            expired.extend(self._sweep_if_due(now))
+            self._cond.notify_all()
+        self._close_all(expired)
+
+    def _release_slot(self, key, slot: _ServerSlot) -> None:
+        with self._cond:
+            slot.in_use -= 1
+            self._cond.notify_all()
+
+    def _evict_expired(self, slot: _ServerSlot, now: float) -> List[DatabaseMonitor]:
+        expired = [monitor for monitor, last_used in slot.idle if now - last_used > self.idle_timeout]
+        if expired:
+            slot.idle = [(monitor, last_used) for monitor, last_used in slot.idle
+                         if now - last_used <= self.idle_timeout]
+        return expired
+
+    def _sweep_if_due(self, now: float) -> List[DatabaseMonitor]:
+        """Expired idle connections of every server, at most every half idle_timeout; holds _cond"""
+        if now - self._last_sweep < self.idle_timeout / 2:
+            return []
+        self._last_sweep = now
+        expired: List[DatabaseMonitor] = []
+        for slot in self._slots.values():
+            expired.extend(self._evict_expired(slot, now))
+        return expired
+
+    @staticmethod
+    def _close_all(monitors: List[DatabaseMonitor]) -> None:
+        for monitor in monitors:
+            try:
+                monitor.close()
+            except Exception:
+                pass
+
+    def evict_idle(self) -> int:
+        """Close connections that have been idle longer than idle_timeout"""
+        now = time.monotonic()
+        expired: List[DatabaseMonitor] = []
+        with self._cond:
+            self._last_sweep = now
+            for slot in self._slots.values():
+                expired.extend(self._evict_expired(slot, now))
+        self._close_all(expired)
+        return len(expired)
+
+    def invalidate(self, key) -> None:
+        """Drop every connection of a server, e.g. after it was edited or deleted.
+
+        Idle connections are closed right away; connections currently borrowed
+        are closed when they are returned.
+        """
+        with self._cond:
+            slot = self._slots.pop(key, None)
+            idle = [monitor for monitor, _ in slot.idle] if slot else []
+            self._cond.notify_all()
+        self._close_all(idle)
+
+    def close_all(self) -> None:
+        """Close every idle connection and forget all servers"""
+        with self._cond:
+            slots = list(self._slots.values())
+            self._slots.clear()
+            self._cond.notify_all()
+        for slot in slots:
+            self._close_all([monitor for monitor, _ in slot.idle])
+
+    def stats(self) -> Dict[Any, Dict[str, int]]:
+        with self._cond:
+            return {key: {'idle': len(slot.idle), 'in_use': slot.in_use}
+                    for key, slot in self._slots.items()}
+
+
+pool = ConnectionPool(
+    max_size=int(os.getenv('DB_POOL_MAX_SIZE', 4)),
+    idle_timeout=float(os.getenv('DB_POOL_IDLE_TIMEOUT', 300)),
+    checkout_timeout=float(os.getenv('DB_POOL_CHECKOUT_TIMEOUT', 10)),
+    validate_after=float(os.getenv('DB_POOL_VALIDATE_AFTER', 30))
+)
@@ -0,0 +1,112 @@
+import threading
+from typing import Dict, Any, Iterable, Optional
+
+# Counters read by DatabaseMonitor.get_performance_metrics for each dialect
+POSTGRES_COUNTERS = ['xact_commit', 'xact_rollback', 'blks_read', 'blks_hit']
+MYSQL_COUNTERS = ['com_commit', 'com_rollback', 'questions',
+                  'innodb_buffer_pool_reads', 'innodb_buffer_pool_read_requests', 'uptime']
+
+
+class CounterDeltaEngine:
+    """Keeps the previous raw counter sample per server and returns deltas.
+
+    Counters are cumulative since the server started or since statistics
+    were last reset. A sample whose ``epoch`` differs from the previous one
+    (e.g. a new ``stats_reset`` or postmaster start time) or in which any
+    counter went backwards starts a new baseline instead of yielding a
+    negative or wildly wrong rate.
+    """
+
+    def __init__(self):
+        self._samples: Dict[Any, tuple] = {}
+        self._lock = threading.Lock()
+
+    def update(self, key, counters: Dict[str, Any], timestamp: float, epoch=None) -> Optional[Dict[str, Any]]:
+        """Record a sample and return ``{'elapsed': seconds, 'deltas': {...}}``.
+
+        Returns None for the first sample of a server, after a reset, and for
+        samples older than the one already recorded (e.g. two collectors
+        racing on the same server).
+        """
+        with self._lock:
+            previous = self._samples.get(key)
+            if previous is not None and timestamp <= previous[1]:
+                return None
+            self._samples[key] = (counters, timestamp, epoch)
+
+        if previous is None:
+            return None
+        previous_counters, previous_timestamp, previous_epoch = previous
+        if epoch != previous_epoch:
+            return None
+
+        deltas = {}
+        for name, value in counters.items():
+            before = previous_counters.get(name)
+            if value is None or before is None:
+                continue
+            if value < before:
+                # Counter reset (FLUSH STATUS, restart, wrap-around)
+                return None
+            deltas[name] = value - before
+
+        return {'elapsed': timestamp - previous_timestamp, 'deltas': deltas}
+
+    def forget(self, key) -> None:
+        with self._lock:
+            self._samples.pop(key, None)
+
+    def retain(self, keys: Iterable) -> None:
+        keep = set(keys)
+        with self._lock:
+            for key in [k for k in self._samples if k not in keep]:
+                del self._samples[key]
+
+
+def _per_second(deltas: Dict[str, float], elapsed: float, *names) -> Optional[float]:
+    if not all(name in deltas for name in names):
+        return None
+    return sum(deltas[name] for name in names) / elapsed
+
+
+def _percent(part: Optional[float], total: Optional[float]) -> Optional[float]:
+    if part is None or total is None or total <= 0:
+        return None
+    return part / total * 100
+
+
+def apply_rates(engine: CounterDeltaEngine, key, db_type: str, metrics: Dict[str, Any], timestamp: float) -> None:
+    """Replace lifetime counters in ``metrics`` with rates over the last interval.
+
+    ``transaction_rate`` becomes transactions per second and the hit ratios
+    are computed over the interval; the lifetime ratios stay available as
+    ``*_lifetime``. Rates are None until a second sample is available.
+    """
+    counters = metrics.get('counters') or {}
+    sample = engine.update(key, counters, timestamp, metrics.get('counter_epoch'))
+    deltas = sample['deltas'] if sample else {}
+    elapsed = sample['elapsed'] if sample else 0
+
+    def rate(*names):
+        return _per_second(deltas, elapsed, *names) if sample else None
+
+    if db_type == 'postgresql':
+        # Both ratios are over pg_stat_database's block counters
+        metrics['cache_hit_ratio_lifetime'] = metrics.get('cache_hit_ratio')
+        hits, reads = deltas.get('blks_hit'), deltas.get('blks_read')
+        interval_ratio = _percent(hits, hits + reads) if hits is not None and reads is not None else None
+        if interval_ratio is not None:
+            metrics['cache_hit_ratio'] = interval_ratio
+        metrics['transaction_rate'] = rate('xact_commit', 'xact_rollback')
+        metrics['blocks_read_per_sec'] = rate('blks_read')
+        metrics['blocks_hit_per_sec'] = rate('blks_hit')
+
+    elif db_type in ['mysql', 'mariadb']:
+        metrics['buffer_pool_hit_ratio_lifetime'] = metrics.get('buffer_pool_hit_ratio')
+        requests, reads = deltas.get('innodb_buffer_pool_read_requests'), deltas.get('innodb_buffer_pool_reads')
+        interval_ratio = _percent(requests - reads, requests) if requests is not None and reads is not None else None
+        if interval_ratio is not None:
+            metrics['buffer_pool_hit_ratio'] = interval_ratio
+        metrics['transaction_rate'] = rate('com_commit', 'com_rollback')
+        metrics['queries_per_sec'] = rate('questions')
+        metrics['innodb_reads_per_sec'] = rate('innodb_buffer_pool_reads')
@@ -0,0 +1,52 @@
+import csv
+import os
+import zlib
+from io import StringIO
+from typing import Callable, Iterable, Iterator, List
+
+from flask import Response, stream_with_context
+
+# Rows fetched from the database and written per chunk of the response
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 1000))
+
+
+def csv_chunks(query, headers: List[str], to_row: Callable, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[str]:
+    """CSV text of ``query`` in chunks of ``batch_size`` rows.
+
+    Rows are read with ``yield_per``, which uses a server-side cursor where
+    the driver supports one, so only one batch is held in memory at a time.
+    """
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(headers)
+    for count, item in enumerate(query.yield_per(batch_size), 1):
+        writer.writerow(to_row(item))
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def gzip_chunks(chunks: Iterable[str], level: int = 6) -> Iterator[bytes]:
+    """Compress text chunks into one gzip stream as they arrive"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def csv_response(query, headers: List[str], to_row: Callable, filename: str, compress: bool = False) -> Response:
+    """Streamed CSV download of ``query``; sent with chunked transfer encoding.
+
+    With ``compress`` the body is gzip-encoded, for clients that accept it.
+    The generator keeps the request context, so the query may use the session.
+    """
+    chunks = csv_chunks(query, headers, to_row)
+    response_headers = {'Content-Disposition': f'attachment; filename={filename}', 'Vary': 'Accept-Encoding'}
+    if compress:
+        chunks = gzip_chunks(chunks)
+        response_headers['Content-Encoding'] = 'gzip'
+    return Response(stream_with_context(chunks), mimetype='text/csv', headers=response_headers)
@@ -2,6 +2,7 @@ import psycopg2
 import mysql.connector
 import time
 from datetime import datetime
+from query_fingerprint import fingerprint_query
 
 class DatabaseMonitor:
     def __init__(self, config):
@@ -134,6 +135,7 @@ class DatabaseMonitor:
                     'username': row[1],
                     'database': row[2],
                     'query': row[3],
+                    'fingerprint': fingerprint_query(row[3]),
                     'duration': float(row[4]) if row[4] else 0,
                     'state': row[5]
                 })
@@ -181,6 +183,7 @@ class DatabaseMonitor:
             for row in cursor.fetchall():
                 queries.append({
                     'query': row[0],
+                    'fingerprint': fingerprint_query(row[0]),
                     'calls': row[1],
                     'total_duration': row[2],
                     'avg_duration': row[3],
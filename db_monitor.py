@@ -1,36 +1,293 @@
 import psycopg2
 import mysql.connector
 import psutil
+import hashlib
 import json
+import os
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+from counter_deltas import POSTGRES_COUNTERS, MYSQL_COUNTERS
+from metric_tiers import TIERS
+from query_fingerprint import fingerprint_query
+
+# Prepare the collection statements once per connection and re-execute
+# them on later polls; set to 0 behind poolers that do not keep prepared
+# statements (e.g. PgBouncer before 1.21 in transaction mode)
+DB_PREPARED_STATEMENTS = os.getenv('DB_PREPARED_STATEMENTS', '1') != '0'
+
+# Longest-running active queries returned per server and poll
+ACTIVE_QUERY_LIMIT = int(os.getenv('ACTIVE_QUERY_LIMIT', 100))
+
+# Characters of each active query's text returned per poll; longer texts
+# are cut by the server and can be fetched in full for a single session
+ACTIVE_QUERY_TEXT_LIMIT = int(os.getenv('ACTIVE_QUERY_TEXT_LIMIT', 2048))
+
+
+def _text(value):
+    """Decode names and texts that MySQL prepared cursors may return as bytes"""
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8', 'replace')
+    return value if value is None else str(value)
 
 class DatabaseMonitor:
     def __init__(self, config: Dict[str, Any]):
         self.config = config
         self.connection = None
         self.db_type = config['db_type']
+        # Result of probe_capabilities, set by CapabilityCache; None sends
+        # every statement as if the server supported it
+        self.capabilities: Optional[Dict[str, Any]] = None
+        # Statement text -> PostgreSQL statement name or (text, MySQL prepared cursor)
+        self._prepared: Dict[str, Any] = {}
+        # Seconds after which the server cancels a statement, as last set
+        self._query_timeout: Optional[float] = None
 
     def connect(self) -> None:
+        self._prepared = {}
+        self._query_timeout = None
+        query_timeout = self.config.get('query_timeout')
         try:
             if self.db_type == 'postgresql':
+                options = {}
+                if self.config.get('connect_timeout'):
+                    options['connect_timeout'] = int(self.config['connect_timeout'])
+                if query_timeout:
+                    # The server cancels statements past the deadline, and
+                    # keepalives notice a peer that stopped answering at all
+                    options['options'] = f'-c statement_timeout={int(float(query_timeout) * 1000)}'
+                    options.update(keepalives=1, keepalives_idle=max(1, int(float(query_timeout))),
+                                   keepalives_interval=1, keepalives_count=3)
                 self.connection = psycopg2.connect(
                     host=self.config['host'],
                     port=self.config['port'],
                     database=self.config['database'],
                     user=self.config['username'],
-                    password=self.config['password']
+                    password=self.config['password'],
+                    **options
                 )
             elif self.db_type in ['mysql', 'mariadb']:
+                options = {}
+                if self.config.get('connect_timeout'):
+                    options['connection_timeout'] = int(self.config['connect_timeout'])
                 self.connection = mysql.connector.connect(
                     host=self.config['host'],
                     port=self.config['port'],
                     database=self.config['database'],
                     user=self.config['username'],
-                    password=self.config['password']
+                    password=self.config['password'],
+                    **options
                 )
+            # Pooled connections live for many polls; without autocommit the
+            # statistics views would stay frozen inside one long transaction.
+            if self.connection is not None:
+                self.connection.autocommit = True
         except Exception as e:
             raise ConnectionError(f"Failed to connect to {self.db_type}: {str(e)}")
+        if self.db_type == 'postgresql' and query_timeout:
+            self._query_timeout = float(query_timeout)
+        else:
+            self.set_query_timeout(query_timeout)
+
+    # Session variable bounding statement run time, and its unit in milliseconds
+    QUERY_TIMEOUT_SETTINGS = {
+        'postgresql': ('statement_timeout', 1),
+        'mysql': ('max_execution_time', 1),
+        'mariadb': ('max_statement_time', 1000)
+    }
+
+    def set_query_timeout(self, seconds: Optional[float]) -> None:
+        """Have the server cancel statements running longer than ``seconds``.
+
+        Only sends a statement when the timeout changes, so pooled
+        connections shared by callers with the same deadline pay nothing.
+        """
+        if not seconds or not self.connection or float(seconds) == self._query_timeout:
+            return
+        variable, unit_ms = self.QUERY_TIMEOUT_SETTINGS[self.db_type]
+        milliseconds = int(float(seconds) * 1000)
+        value = milliseconds if unit_ms == 1 else milliseconds / unit_ms
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(f"SET SESSION {variable} = {value}")
+        except Exception as e:
+            # Older MySQL has no max_execution_time; the driver's socket
+            # timeout (connection_timeout) still bounds reads there
+            print(f"Could not set {variable} on {self.config.get('host')}: {str(e)}")
+        finally:
+            cursor.close()
+        self._query_timeout = float(seconds)
+
+    def ping(self) -> bool:
+        """Return True if the connection is still usable"""
+        if not self.connection:
+            return False
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    # Catalog lookups every supported version answers, so the probe itself
+    # never fails on a server that lacks a feature
+    POSTGRES_CAPABILITIES_QUERY = """
+        SELECT current_setting('server_version'),
+               current_setting('server_version_num')::int,
+               ARRAY(SELECT extname::text FROM pg_extension ORDER BY extname),
+               to_regclass('pg_stat_statements') IS NOT NULL,
+               to_regclass('pg_stat_statements_info') IS NOT NULL,
+               EXISTS (SELECT 1 FROM pg_attribute
+                       WHERE attrelid = to_regclass('pg_stat_statements') AND attname = 'total_exec_time'),
+               ARRAY(SELECT rolname::text FROM pg_roles
+                     WHERE rolname IN ('pg_monitor', 'pg_read_all_stats')
+                       AND pg_has_role(current_user, oid, 'MEMBER')
+                     UNION ALL
+                     SELECT 'superuser' FROM pg_roles WHERE rolname = current_user AND rolsuper)
+    """
+    MYSQL_CAPABILITIES_QUERY = """
+        SELECT VERSION(),
+               @@performance_schema,
+               (SELECT COUNT(*) FROM information_schema.COLUMNS
+                WHERE TABLE_SCHEMA = 'information_schema' AND TABLE_NAME = 'PROCESSLIST'
+                  AND COLUMN_NAME = 'TIME_MS'),
+               (SELECT GROUP_CONCAT(CONCAT(LOWER(TABLE_SCHEMA), '.', LOWER(TABLE_NAME)))
+                FROM information_schema.TABLES
+                WHERE (TABLE_SCHEMA = 'performance_schema'
+                       AND TABLE_NAME IN ('global_status', 'events_statements_summary_by_digest'))
+                   OR (TABLE_SCHEMA = 'information_schema' AND TABLE_NAME = 'GLOBAL_STATUS')),
+               (SELECT GROUP_CONCAT(PRIVILEGE_TYPE) FROM information_schema.USER_PRIVILEGES
+                WHERE PRIVILEGE_TYPE IN ('PROCESS', 'SUPER')
+                  AND GRANTEE = CONCAT('''', SUBSTRING_INDEX(CURRENT_USER(), '@', 1), '''@''',
+                                       SUBSTRING_INDEX(CURRENT_USER(), '@', -1), ''''))
+    """
+
+    def probe_capabilities(self) -> Dict[str, Any]:
+        """Version, extensions, views and permissions of the server, in one round trip.
+
+        ``features`` says which optional statements the server can answer;
+        the other collection methods consult it once it is set as
+        ``self.capabilities``.
+        """
+        cursor = self.connection.cursor()
+        try:
+            if self.db_type == 'postgresql':
+                cursor.execute(self.POSTGRES_CAPABILITIES_QUERY)
+                (version, version_num, extensions, statements, statements_info,
+                 exec_time, roles) = cursor.fetchone()
+                return {
+                    'version': version,
+                    'version_num': int(version_num),
+                    'extensions': list(extensions or []),
+                    'views': [name for name, present in (('pg_stat_statements', statements),
+                                                         ('pg_stat_statements_info', statements_info)) if present],
+                    'permissions': list(roles or []),
+                    'features': {
+                        'statements': bool(statements),
+                        # total_time was split into plan/exec time in pg_stat_statements 1.8
+                        'statements_exec_time': bool(exec_time),
+                        'statements_info': bool(statements_info)
+                    }
+                }
+
+            cursor.execute(self.MYSQL_CAPABILITIES_QUERY)
+            version, performance_schema, time_ms, views, privileges = cursor.fetchone()
+            views = sorted(str(views).split(',')) if views else []
+            performance_schema = bool(int(performance_schema or 0))
+            status_tables = [table for table in (self.STATUS_TABLES[self.db_type], *self.STATUS_TABLES.values())
+                             if table.lower() in views
+                             and (performance_schema or not table.startswith('performance_schema'))]
+            return {
+                'version': version,
+                'version_num': None,
+                'extensions': [],
+                'views': views,
+                'permissions': sorted(str(privileges).split(',')) if privileges else [],
+                'features': {
+                    'statements': performance_schema
+                                  and 'performance_schema.events_statements_summary_by_digest' in views,
+                    'status_table': status_tables[0] if status_tables else None,
+                    # Only some builds (Percona Server, MariaDB) have TIME_MS
+                    'time_ms': bool(int(time_ms or 0))
+                }
+            }
+        finally:
+            cursor.close()
+
+    @contextmanager
+    def _execute(self, sql: str):
+        """Run a collection statement and yield the cursor holding its result.
+
+        Statements are prepared on first use and re-executed on later calls
+        over the same connection, so the server parses and plans them once.
+        On PostgreSQL the first call sends PREPARE and EXECUTE in one round
+        trip; MySQL keeps a prepared cursor per statement.
+        """
+        if not DB_PREPARED_STATEMENTS:
+            cursor = self.connection.cursor()
+            try:
+                cursor.execute(sql)
+                yield cursor
+            finally:
+                cursor.close()
+            return
+
+        if self.db_type == 'postgresql':
+            cursor = self.connection.cursor()
+            try:
+                self._execute_prepared(cursor, sql)
+                yield cursor
+            finally:
+                cursor.close()
+            return
+
+        prepared = self._prepared.get(sql)
+        if prepared is None:
+            prepared = self._prepared[sql] = (sql, self.connection.cursor(prepared=True))
+        operation, cursor = prepared
+        try:
+            # The cursor re-prepares unless it gets the very same string
+            cursor.execute(operation)
+            yield cursor
+        except BaseException:
+            # Its result may be half read; prepare afresh next time
+            self._prepared.pop(sql, None)
+            try:
+                cursor.close()
+            except Exception:
+                pass
+            raise
+
+    def _execute_prepared(self, cursor, sql: str) -> None:
+        name = self._prepared.get(sql)
+        if name is not None:
+            try:
+                cursor.execute(f'EXECUTE {name}')
+                return
+            except psycopg2.Error as e:
+                # invalid_sql_statement_name: dropped by DISCARD ALL or a pooler
+                if e.pgcode != '26000':
+                    raise
+                del self._prepared[sql]
+
+        name = 'dbmonitor_' + hashlib.blake2b(sql.encode(), digest_size=8).hexdigest()
+        try:
+            cursor.execute(f'PREPARE {name} AS {sql};\nEXECUTE {name}')
+        except psycopg2.Error as e:
+            # duplicate_prepared_statement: prepared by an earlier, failed call
+            if e.pgcode != '42P05':
+                raise
+            cursor.execute(f'EXECUTE {name}')
+        self._prepared[sql] = name
+
+    def supports(self, feature: str) -> bool:
+        """Whether the probed server has ``feature``; assumed before probing"""
+        if self.capabilities is None:
+            return True
+        return bool(self.capabilities['features'].get(feature))
 
     def get_active_connections(self) -> int:
         queries = {
@@ -83,56 +340,124 @@ class DatabaseMonitor:
         except Exception as e:
             return -1
 
-    def get_performance_metrics(self) -> Dict[str, Any]:
+    # One statement per dialect returning every scalar metric, so a poll
+    # costs a single round trip instead of one per metric. Each part belongs
+    # to a tier (metric_tiers.py) and is only included when its tier is due:
+    # database sizes stat every file or sum the whole catalog, and the table
+    # cache hit ratio sums over every user table.
+    POSTGRES_METRICS = [
+        ('active_connections', "(SELECT count(*) FROM pg_stat_activity WHERE state = 'active')", 'fast'),
+        ('database_size_mb', 'pg_database_size(current_database())/1024/1024', 'slow'),
+        ('table_cache_hit_ratio', """(SELECT sum(heap_blks_hit) / nullif(sum(heap_blks_hit) + sum(heap_blks_read), 0) * 100
+             FROM pg_statio_user_tables)""", 'medium'),
+        ('transaction_rate', 'd.xact_commit + d.xact_rollback', 'fast'),
+        ('xact_commit', 'd.xact_commit', 'fast'),
+        ('xact_rollback', 'd.xact_rollback', 'fast'),
+        ('blks_read', 'd.blks_read', 'fast'),
+        ('blks_hit', 'd.blks_hit', 'fast'),
+        ('stats_reset', 'extract(epoch FROM d.stats_reset)', 'fast'),
+        ('server_start_time', 'extract(epoch FROM pg_postmaster_start_time())', 'fast')
+    ]
+
+    # MySQL/MariaDB return (name, value) rows; MariaDB exposes the status
+    # counters through information_schema instead of performance_schema.
+    MYSQL_METRICS = [
+        ("""SELECT 'active_connections', COUNT(*)
+        FROM information_schema.processlist
+        WHERE command != 'Sleep'""", 'fast'),
+        ("""SELECT 'database_size_mb', SUM(data_length + index_length) / 1024 / 1024
+        FROM information_schema.tables
+        WHERE table_schema = DATABASE()""", 'slow'),
+        ("""SELECT VARIABLE_NAME, VARIABLE_VALUE
+        FROM {status_table}
+        WHERE VARIABLE_NAME IN ('Innodb_buffer_pool_reads', 'Innodb_buffer_pool_read_requests',
+                                'Com_commit', 'Com_rollback', 'Questions', 'Uptime')""", 'fast')
+    ]
+    STATUS_TABLES = {
+        'mysql': 'performance_schema.global_status',
+        'mariadb': 'information_schema.GLOBAL_STATUS'
+    }
+
+    # Metrics collected less often than every poll, by tier (see TierCache)
+    METRIC_TIERS = {'database_size_mb': 'slow', 'table_cache_hit_ratio': 'medium'}
+
+    def _metrics_query(self, tiers) -> Tuple[str, List[str]]:
+        """Statement for the metrics of ``tiers`` and, on PostgreSQL, its column names"""
+        if self.db_type == 'postgresql':
+            columns = [(name, expression) for name, expression, tier in self.POSTGRES_METRICS if tier in tiers]
+            sql = ('SELECT ' + ',\n    '.join(f'{expression} AS {name}' for name, expression in columns)
+                   + '\nFROM pg_stat_database d\nWHERE d.datname = current_database()')
+            return sql, [name for name, _ in columns]
+        status_table = self.STATUS_TABLES[self.db_type]
+        if self.capabilities is not None:
+            status_table = self.capabilities['features'].get('status_table')
+        parts = [part for part, tier in self.MYSQL_METRICS
+                 if tier in tiers and (status_table or '{status_table}' not in part)]
+        return '\nUNION ALL\n'.join(parts).format(status_table=status_table), []
+
+    def _fetch_scalar_metrics(self, tiers) -> Dict[str, Any]:
+        """Fetch the database-side scalar metrics of ``tiers`` in a single round trip"""
+        sql, columns = self._metrics_query(tiers)
+        with self._execute(sql) as cursor:
+            if self.db_type == 'postgresql':
+                row = cursor.fetchone() or []
+                return dict(zip(columns, row))
+            return {_text(name).lower(): value for name, value in cursor.fetchall()}
+
+    def get_performance_metrics(self, tiers: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """Metrics of the given tiers (all by default); metrics of other tiers are left out"""
+        tiers = set(TIERS if tiers is None else tiers)
+        values = self._fetch_scalar_metrics(tiers)
+
+        def number(name, default=-1):
+            value = values.get(name)
+            return default if value is None else float(value)
+
         metrics = {
             'cpu_percent': psutil.cpu_percent(),
             'memory_percent': psutil.virtual_memory().percent,
             'disk_usage': psutil.disk_usage('/').percent,
-            'active_connections': self.get_active_connections(),
-            'database_size_mb': self.get_database_size(),
+            'active_connections': int(number('active_connections')),
             'timestamp': datetime.now().isoformat()
         }
+        if 'slow' in tiers:
+            metrics['database_size_mb'] = number('database_size_mb')
         
         # Get database-specific metrics
         if self.db_type == 'postgresql':
-            cursor = self.connection.cursor()
-            
-            # Cache hit ratio
-            cursor.execute("""
-                SELECT 
-                    sum(heap_blks_hit) / (sum(heap_blks_hit) + sum(heap_blks_read)) * 100
-                FROM pg_statio_user_tables
-            """)
-            metrics['cache_hit_ratio'] = cursor.fetchone()[0]
-            
-            # Transaction rate
-            cursor.execute("""
-                SELECT xact_commit + xact_rollback 
-                FROM pg_stat_database 
-                WHERE datname = current_database()
-            """)
-            metrics['transaction_rate'] = cursor.fetchone()[0]
-            
-            cursor.close()
+            if 'medium' in tiers:
+                # Heap blocks of user tables only
+                metrics['table_cache_hit_ratio'] = number('table_cache_hit_ratio', None)
+            # Every relation of the database, from the same pg_stat_database
+            # counters apply_rates turns into the per-interval ratio
+            hits, reads = number('blks_hit', 0), number('blks_read', 0)
+            metrics['cache_hit_ratio'] = hits / (hits + reads) * 100 if hits + reads > 0 else None
+            metrics['transaction_rate'] = number('transaction_rate', None)
+            # Raw cumulative counters for CounterDeltaEngine; a new stats
+            # reset or server start time marks a new counter epoch
+            metrics['counters'] = {name: number(name, None) for name in POSTGRES_COUNTERS}
+            metrics['counter_epoch'] = [number('stats_reset', None), number('server_start_time', None)]
             
         elif self.db_type in ['mysql', 'mariadb']:
-            cursor = self.connection.cursor()
-            
+            metrics['counters'] = {name: number(name, None) for name in MYSQL_COUNTERS}
+
             # Buffer pool hit ratio
-            cursor.execute("""
-                SHOW GLOBAL STATUS 
-                WHERE Variable_name IN ('Innodb_buffer_pool_reads', 'Innodb_buffer_pool_read_requests')
-            """)
-            results = dict(cursor.fetchall())
-            reads = float(results['Innodb_buffer_pool_reads'])
-            requests = float(results['Innodb_buffer_pool_read_requests'])
+            reads = number('innodb_buffer_pool_reads', 0)
+            requests = number('innodb_buffer_pool_read_requests', 0)
             metrics['buffer_pool_hit_ratio'] = ((requests - reads) / requests) * 100 if requests > 0 else 0
-            
-            cursor.close()
 
         return metrics
 
-    def get_active_queries(self) -> List[Dict[str, Any]]:
+    def get_active_queries(self, limit: int = ACTIVE_QUERY_LIMIT,
+                           text_limit: int = ACTIVE_QUERY_TEXT_LIMIT) -> List[Dict[str, Any]]:
+        """The ``limit`` longest-running queries, texts cut to ``text_limit`` characters.
+
+        Both bounds are applied by the server, so a busy server cannot blow
+        up the payload; ``query_truncated`` marks cut texts, whose full text
+        get_query_text returns. Cut statements are fingerprinted from an MD5
+        of their full text computed by the server, so statements sharing a
+        long prefix stay apart; those only group when identical.
+        """
         queries = {
             'postgresql': """
                 SELECT 
@@ -141,7 +466,9 @@ class DatabaseMonitor:
                     application_name,
                     client_addr as ip_address,
                     datname as database_name,
-                    query,
+                    left(query, {text_limit}) as query,
+                    length(query) > {text_limit} as query_truncated,
+                    CASE WHEN length(query) > {text_limit} THEN md5(query) END as query_digest,
                     state,
                     query_start as access_time,
                     EXTRACT(EPOCH FROM now() - query_start)::INT as duration_seconds,
@@ -157,7 +484,9 @@ class DatabaseMonitor:
                 WHERE state NOT IN ('idle', 'idle in transaction')
                   AND query != '<IDLE>'
                   AND query NOT ILIKE '%pg_stat_activity%'
-                ORDER BY duration_seconds DESC
+                  AND pid <> pg_backend_pid()
+                ORDER BY duration_seconds DESC NULLS LAST
+                LIMIT {limit}
             """,
             'mysql': """
                 SELECT 
@@ -166,7 +495,9 @@ class DatabaseMonitor:
                     HOST as ip_address,
                     DB as database_name,
                     COMMAND as application_name,
-                    INFO as query,
+                    LEFT(INFO, {text_limit}) as query,
+                    CHAR_LENGTH(INFO) > {text_limit} as query_truncated,
+                    IF(CHAR_LENGTH(INFO) > {text_limit}, MD5(INFO), NULL) as query_digest,
                     STATE,
                     TIME_MS/1000 as duration_seconds,
                     CASE 
@@ -182,6 +513,7 @@ class DatabaseMonitor:
                 WHERE command != 'Sleep'
                   AND INFO IS NOT NULL
                 ORDER BY TIME DESC
+                LIMIT {limit}
             """,
             'mariadb': """
                 SELECT 
@@ -190,7 +522,9 @@ class DatabaseMonitor:
                     HOST as ip_address,
                     DB as database_name,
                     COMMAND as application_name,
-                    INFO as query,
+                    LEFT(INFO, {text_limit}) as query,
+                    CHAR_LENGTH(INFO) > {text_limit} as query_truncated,
+                    IF(CHAR_LENGTH(INFO) > {text_limit}, MD5(INFO), NULL) as query_digest,
                     STATE,
                     TIME as duration_seconds,
                     CASE 
@@ -206,29 +540,122 @@ class DatabaseMonitor:
                 WHERE command != 'Sleep'
                   AND INFO IS NOT NULL
                 ORDER BY TIME DESC
+                LIMIT {limit}
             """
         }
         
+        query_type = self.db_type
+        if self.capabilities is not None and self.db_type in ['mysql', 'mariadb']:
+            query_type = 'mysql' if self.supports('time_ms') else 'mariadb'
+
+        # Integers only, so the statement text (and its prepared statement)
+        # is the same on every poll
+        sql = queries[query_type].format(limit=max(1, int(limit)), text_limit=max(1, int(text_limit)))
         try:
-            cursor = self.connection.cursor()
-            cursor.execute(queries[self.db_type])
-            columns = [desc[0] for desc in cursor.description]
+            with self._execute(sql) as cursor:
+                columns = [_text(desc[0]) for desc in cursor.description]
+                rows = cursor.fetchall()
             results = []
-            for row in cursor.fetchall():
-                result = dict(zip(columns, row))
+            for row in rows:
+                result = {column: _text(value) if isinstance(value, (bytes, bytearray)) else value
+                          for column, value in zip(columns, row)}
                 # Convert access_time to string if it's a datetime object
                 if isinstance(result.get('access_time'), datetime):
                     result['access_time'] = result['access_time'].isoformat()
                 # Extract IP from HOST for MySQL/MariaDB (format: ip:port)
                 if self.db_type in ['mysql', 'mariadb'] and 'ip_address' in result:
                     result['ip_address'] = result['ip_address'].split(':')[0]
+                result['query_truncated'] = bool(result.get('query_truncated'))
+                digest = result.pop('query_digest', None)
+                # Group identical statements that differ only in literals
+                result['fingerprint'] = digest[:16] if digest else fingerprint_query(result.get('query'))
                 results.append(result)
-            cursor.close()
             return results
         except Exception as e:
             print(f"Error getting active queries: {str(e)}")
             return []
 
+    QUERY_TEXT_QUERIES = {
+        'postgresql': "SELECT query FROM pg_stat_activity WHERE pid = %s",
+        'mysql': "SELECT INFO FROM information_schema.processlist WHERE ID = %s",
+        'mariadb': "SELECT INFO FROM information_schema.processlist WHERE ID = %s"
+    }
+
+    def get_query_text(self, pid: int) -> Optional[str]:
+        """Full text of the statement session ``pid`` is running, None if there is none"""
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(self.QUERY_TEXT_QUERIES[self.db_type], (int(pid),))
+            row = cursor.fetchone()
+            return _text(row[0]) if row else None
+        finally:
+            cursor.close()
+
+    # Cumulative per-statement counters. Keys identify a statement across
+    # snapshots: (dbid, userid, queryid) on PostgreSQL, (schema, digest) on MySQL.
+    POSTGRES_STATEMENTS_QUERY = """
+        SELECT s.dbid || ':' || s.userid || ':' || s.queryid AS statement_key,
+               d.datname, s.query, s.calls, s.{time_column} AS total_time_ms, s.rows,
+               {stats_reset} AS stats_reset
+        FROM pg_stat_statements s
+        LEFT JOIN pg_database d ON d.oid = s.dbid
+        WHERE s.calls > 0 AND s.queryid IS NOT NULL
+    """
+    MYSQL_STATEMENTS_QUERY = """
+        SELECT CONCAT(IFNULL(SCHEMA_NAME, ''), ':', DIGEST) AS statement_key,
+               SCHEMA_NAME, DIGEST_TEXT, COUNT_STAR,
+               SUM_TIMER_WAIT / 1000000000 AS total_time_ms,
+               SUM_ROWS_SENT + SUM_ROWS_AFFECTED AS row_count,
+               NULL AS stats_reset
+        FROM performance_schema.events_statements_summary_by_digest
+        WHERE COUNT_STAR > 0 AND DIGEST IS NOT NULL
+    """
+
+    def _statements_query(self) -> str:
+        if self.db_type != 'postgresql':
+            return self.MYSQL_STATEMENTS_QUERY
+        if self.capabilities is not None:
+            return self.POSTGRES_STATEMENTS_QUERY.format(
+                time_column='total_exec_time' if self.supports('statements_exec_time') else 'total_time',
+                stats_reset=('(SELECT extract(epoch FROM stats_reset) FROM pg_stat_statements_info)'
+                             if self.supports('statements_info') else 'NULL')
+            )
+        version = getattr(self.connection, 'server_version', 0)
+        version = version if isinstance(version, int) else 0
+        # total_time was split into plan/exec time in 13; the reset time is exposed from 14
+        return self.POSTGRES_STATEMENTS_QUERY.format(
+            time_column='total_exec_time' if version == 0 or version >= 130000 else 'total_time',
+            stats_reset=('(SELECT extract(epoch FROM stats_reset) FROM pg_stat_statements_info)'
+                         if version == 0 or version >= 140000 else 'NULL')
+        )
+
+    def get_statement_stats(self) -> Dict[str, Any]:
+        """Snapshot of pg_stat_statements / the MySQL digest summary.
+
+        Returns ``{'epoch': stats reset time or None, 'statements': {key: {...}}}``
+        with lifetime ``calls``, ``total_time_ms`` and ``rows`` per statement.
+        Raises if the extension or performance_schema is not available.
+        """
+        if not self.supports('statements'):
+            raise RuntimeError('pg_stat_statements is not installed' if self.db_type == 'postgresql'
+                               else 'performance_schema statement digests are not available')
+        with self._execute(self._statements_query()) as cursor:
+            fetched = cursor.fetchall()
+        epoch = None
+        statements = {}
+        for key, database, query, calls, total_time, rows, stats_reset in fetched:
+            epoch = float(stats_reset) if stats_reset is not None else epoch
+            statements[_text(key)] = {
+                'query': _text(query),
+                'database': _text(database),
+                'calls': int(calls or 0),
+                'total_time_ms': float(total_time or 0),
+                'rows': int(rows or 0)
+            }
+        return {'epoch': epoch, 'statements': statements}
+
     def close(self) -> None:
+        self._prepared = {}
         if self.connection:
             self.connection.close()
+            self.connection = None
@@ -0,0 +1,32 @@
+"""Gunicorn settings, read by ``gunicorn`` when started from this directory.
+
+Every worker takes part in the collector election once it has started:
+the elected worker polls the monitored servers and the others serve the
+snapshots it shares, so adding workers does not add load on the servers.
+"""
+import os
+
+wsgi_app = 'app:app'
+
+# Every open dashboard holds a request thread for its /api/metrics/stream
+# connection, so requests are served from a thread pool per worker instead
+# of one request per sync worker
+worker_class = 'gthread'
+workers = int(os.getenv('WEB_CONCURRENCY', 4))
+threads = int(os.getenv('GUNICORN_THREADS', 32))
+
+collector = None
+
+
+def post_worker_init(worker):
+    global collector
+    from app import app, collector_election
+    from monitor_service import ElectedCollector
+    collector = ElectedCollector(app, collector_election)
+    collector.start()
+
+
+def worker_exit(server, worker):
+    # Step down at once, so another worker takes over without waiting for the lease
+    if collector is not None:
+        collector.stop()
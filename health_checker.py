@@ -0,0 +1,174 @@
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import sqlalchemy as sa
+
+from collector import probe_many
+
+# Seconds between checks of a healthy server
+HEALTH_CHECK_INTERVAL = float(os.getenv('HEALTH_CHECK_INTERVAL', 60))
+
+# Failing servers are re-checked with doubling delays up to this many seconds
+HEALTH_CHECK_MAX_INTERVAL = float(os.getenv('HEALTH_CHECK_MAX_INTERVAL', 600))
+
+# Seconds a single check may take before the server is reported as timed out
+HEALTH_CHECK_TIMEOUT = float(os.getenv('HEALTH_CHECK_TIMEOUT', 5))
+
+
+class HealthChecker:
+    """Keeps the connection status of every server in memory.
+
+    A background thread probes each server when it is due: every
+    ``interval`` seconds while it answers, backing off up to
+    ``max_interval`` while it fails. Results from other collections (metrics
+    polls, explicit connection tests) are recorded too and postpone the next
+    probe. Changed statuses are written to ``last_check``/``last_error`` in
+    one bulk UPDATE per round. Reading a status never opens a connection.
+    """
+
+    def __init__(self, app, db, model, probe: Callable = probe_many, interval: float = HEALTH_CHECK_INTERVAL,
+                 max_interval: float = HEALTH_CHECK_MAX_INTERVAL, timeout: float = HEALTH_CHECK_TIMEOUT):
+        self.app = app
+        self.db = db
+        self.model = model
+        self.probe = probe
+        self.interval = interval
+        self.max_interval = max_interval
+        self.timeout = timeout
+        self._health: Dict[Any, Dict[str, Any]] = {}
+        self._due: Dict[Any, float] = {}
+        self._failures: Dict[Any, int] = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def status_of(self, server) -> Dict[str, Any]:
+        """Health of a DatabaseServer row; falls back to its stored columns until checked"""
+        with self._lock:
+            health = self._health.get(server.id)
+            if health is not None:
+                return dict(health)
+        if server.last_check is None:
+            status = 'unknown'
+        else:
+            status = 'error' if server.last_error else 'connected'
+        return {'status': status, 'error': server.last_error, 'checked_at': server.last_check, 'latency_ms': None}
+
+    def get(self, server_id) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            health = self._health.get(server_id)
+            return dict(health) if health is not None else None
+
+    def record(self, server_id, status: str, error: Optional[str] = None,
+               latency_ms: Optional[float] = None, checked_at: Optional[datetime] = None) -> None:
+        """Store the outcome of a check and schedule the next one"""
+        with self._lock:
+            failures = 0 if status == 'connected' else self._failures.get(server_id, 0) + 1
+            delay = self.interval if not failures else min(self.max_interval, self.interval * 2 ** (failures - 1))
+            self._health[server_id] = {
+                'status': status,
+                'error': error,
+                'checked_at': checked_at or datetime.now(timezone.utc),
+                'latency_ms': latency_ms
+            }
+            self._failures[server_id] = failures
+            self._due[server_id] = time.monotonic() + delay
+            self._dirty.add(server_id)
+
+    def check(self, targets: Dict[Any, Dict[str, Any]], force: bool = False) -> Dict[Any, Dict[str, Any]]:
+        """Probe the targets that are due (all of them with ``force``) and record the results"""
+        now = time.monotonic()
+        with self._lock:
+            due = {server_id: config for server_id, config in targets.items()
+                   if force or self._due.get(server_id, 0) <= now}
+        if not due:
+            return {}
+        results = self.probe(due, self.timeout)
+        for server_id, result in results.items():
+            self.record(server_id, result['status'], result['error'], result.get('latency_ms'))
+        return results
+
+    def retain(self, server_ids: Iterable) -> None:
+        """Forget servers that no longer exist"""
+        keep = set(server_ids)
+        with self._lock:
+            for server_id in [s for s in self._health if s not in keep]:
+                self._health.pop(server_id, None)
+                self._failures.pop(server_id, None)
+                self._dirty.discard(server_id)
+            for server_id in [s for s in self._due if s not in keep]:
+                del self._due[server_id]
+
+    def write(self) -> int:
+        """Store changed statuses in one bulk UPDATE; returns how many rows"""
+        with self._lock:
+            rows = []
+            for server_id in self._dirty:
+                health = self._health.get(server_id)
+                if health is not None:
+                    error = health['error']
+                    rows.append({'id': server_id, 'last_check': health['checked_at'],
+                                 'last_error': error[:500] if error else None})
+            self._dirty.clear()
+        if not rows:
+            return 0
+        # Its own app context, so the write never commits a request's session
+        with self.app.app_context():
+            session = self.db.session
+            try:
+                existing = {server_id for (server_id,) in session.query(self.model.id).filter(
+                    self.model.id.in_([row['id'] for row in rows]))}
+                rows = [row for row in rows if row['id'] in existing]
+                if rows:
+                    session.execute(sa.update(self.model), rows)
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+        return len(rows)
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='health-checker', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.write()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                with self.app.app_context():
+                    servers = self.model.query.all()
+                    targets = {server.id: server.monitor_config() for server in servers}
+                self.retain(targets)
+                self.check(targets)
+                self.write()
+            except Exception as e:
+                print(f"Error checking server health: {str(e)}")
+            self._wake.wait(self._next_wait())
+            self._wake.clear()
+
+    def _next_wait(self) -> float:
+        with self._lock:
+            next_due = min(self._due.values(), default=None)
+        if next_due is None:
+            return self.interval
+        # New servers are found on the next wake-up at the latest
+        return max(0.5, min(self.interval, next_due - time.monotonic()))
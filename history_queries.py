@@ -0,0 +1,42 @@
+from typing import Optional
+
+from sqlalchemy.orm import joinedload
+
+from query_search import search_queries
+
+
+class HistoryQueries:
+    """Queries behind the activity log and query history lists.
+
+    Every list shows the user or server of its rows, so those many-to-one
+    relationships are loaded in the same statement instead of lazily once
+    per row. Callers add ordering and paging.
+    """
+
+    def __init__(self, db, activity_model, history_model):
+        self.db = db
+        self.activity_model = activity_model
+        self.history_model = history_model
+
+    def activity_logs(self, user_id=None):
+        """Activity logs, of one user when ``user_id`` is given"""
+        query = self.activity_model.query.options(joinedload(self.activity_model.user))
+        if user_id is not None:
+            query = query.filter_by(user_id=user_id)
+        return query
+
+    def query_history(self, server_id=None, status: Optional[str] = None,
+                      fingerprint: Optional[str] = None, search: Optional[str] = None):
+        """Filtered query history, and the search rank column when ``search`` is given"""
+        model = self.history_model
+        query = model.query.options(joinedload(model.server))
+        if server_id:
+            query = query.filter_by(server_id=server_id)
+        if status:
+            query = query.filter_by(status=status)
+        if fingerprint:
+            query = query.filter_by(fingerprint=fingerprint)
+        if search:
+            # Ranked matches from the text search index
+            return search_queries(query, model, self.db.session, search)
+        return query, None
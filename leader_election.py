@@ -0,0 +1,214 @@
+import hashlib
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import timedelta
+from typing import Callable, Optional
+
+import sqlalchemy as sa
+from sqlalchemy.exc import IntegrityError
+
+from metric_store import utcnow
+
+# Seconds a lease row stays valid without renewal (not used on PostgreSQL)
+LEADER_LEASE_TTL = float(os.getenv('LEADER_LEASE_TTL', 10))
+
+# Seconds between attempts to become leader, and between renewals
+LEADER_RETRY_INTERVAL = float(os.getenv('LEADER_RETRY_INTERVAL', 2))
+
+
+class LeaderElection:
+    """Elects one process among all that share the metadata database.
+
+    On PostgreSQL the leader holds a session advisory lock on a connection
+    of its own; the server releases it when the process or its connection
+    dies, so another process takes over at its next attempt. Elsewhere
+    (SQLite) the leader renews a lease row every ``interval`` seconds, and
+    another process takes over ``ttl`` seconds after the last renewal. A
+    leader that stops cleanly gives up the lock or lease at once.
+
+    ``on_elected`` and ``on_deposed`` are called from the election thread.
+    """
+
+    def __init__(self, app, db, model, name: str, on_elected: Optional[Callable[[], None]] = None,
+                 on_deposed: Optional[Callable[[], None]] = None, ttl: float = LEADER_LEASE_TTL,
+                 interval: float = LEADER_RETRY_INTERVAL, holder: Optional[str] = None):
+        if interval >= ttl:
+            raise ValueError('interval must be shorter than the lease ttl')
+        self.app = app
+        self.db = db
+        self.model = model
+        self.name = name
+        self.on_elected = on_elected
+        self.on_deposed = on_deposed
+        self.ttl = ttl
+        self.interval = interval
+        self.holder = holder or f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self._lock_key = int.from_bytes(hashlib.blake2b(f'dbmonitor:{name}'.encode(), digest_size=8).digest(),
+                                        'big', signed=True)
+        self._leader = False
+        self._renewed_at = 0.0
+        # PostgreSQL connection holding the advisory lock while leader
+        self._connection = None
+        self._poll_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._leader
+
+    @property
+    def started(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def following(self) -> bool:
+        """Whether another process is (or will be) elected to do the work"""
+        return self.started and not self._leader
+
+    def start(self) -> None:
+        if self.started:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name=f'{self.name}-election', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop taking part; a leader steps down and lets another process take over"""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        with self._poll_lock:
+            if self._leader:
+                self._set_leader(False)
+            try:
+                self._release()
+            except Exception as e:
+                print(f"Error giving up {self.name} leadership: {str(e)}")
+
+    def poll(self) -> bool:
+        """Try to become (or stay) leader once; returns whether this process leads"""
+        with self._poll_lock:
+            try:
+                elected = self._try_acquire()
+            except Exception as e:
+                print(f"Error in {self.name} leader election: {str(e)}")
+                # A leader keeps working through short database outages but
+                # steps down before its lease can have run out
+                elected = self._leader and time.monotonic() - self._renewed_at < self.ttl - self.interval
+            if elected:
+                self._renewed_at = time.monotonic()
+            if elected != self._leader:
+                self._set_leader(elected)
+            return elected
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self.poll()
+            self._stopping.wait(self.interval)
+
+    def _set_leader(self, leader: bool) -> None:
+        self._leader = leader
+        callback = self.on_elected if leader else self.on_deposed
+        print(f"{'Elected' if leader else 'No longer'} {self.name} leader: {self.holder}")
+        if callback is not None:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Error handling {self.name} leadership change: {str(e)}")
+
+    def _dialect(self) -> str:
+        with self.app.app_context():
+            return self.db.engine.dialect.name
+
+    def _try_acquire(self) -> bool:
+        if self._dialect() == 'postgresql':
+            return self._try_advisory_lock()
+        return self._try_lease()
+
+    def _try_advisory_lock(self) -> bool:
+        if self._connection is not None:
+            try:
+                # The lock lives as long as this connection
+                self._connection.execute(sa.text('SELECT 1'))
+                self._connection.commit()
+                return True
+            except Exception:
+                self._close_connection()
+                return False
+
+        with self.app.app_context():
+            connection = self.db.engine.connect()
+        try:
+            acquired = connection.execute(sa.text('SELECT pg_try_advisory_lock(:key)'),
+                                          {'key': self._lock_key}).scalar()
+            connection.commit()
+        except Exception:
+            connection.close()
+            raise
+        if acquired:
+            self._connection = connection
+        else:
+            connection.close()
+        return bool(acquired)
+
+    def _try_lease(self) -> bool:
+        now = utcnow()
+        model = self.model
+        with self.app.app_context():
+            session = self.db.session
+            try:
+                # Renews our own lease or takes over an expired one in one statement
+                taken = session.execute(
+                    sa.update(model)
+                    .where(model.name == self.name, sa.or_(model.holder == self.holder, model.expires_at <= now))
+                    .values(holder=self.holder, expires_at=now + timedelta(seconds=self.ttl))
+                    .execution_options(synchronize_session=False)
+                ).rowcount
+                if not taken:
+                    if session.get(model, self.name) is not None:
+                        session.rollback()
+                        return False
+                    session.add(model(name=self.name, holder=self.holder,
+                                      expires_at=now + timedelta(seconds=self.ttl)))
+                session.commit()
+                return True
+            except IntegrityError:
+                # Another process created the row first
+                session.rollback()
+                return False
+            except Exception:
+                session.rollback()
+                raise
+
+    def _release(self) -> None:
+        if self._connection is not None:
+            try:
+                self._connection.execute(sa.text('SELECT pg_advisory_unlock(:key)'), {'key': self._lock_key})
+                self._connection.commit()
+            finally:
+                self._close_connection()
+            return
+        if self._dialect() == 'postgresql':
+            return
+        with self.app.app_context():
+            session = self.db.session
+            try:
+                session.query(self.model).filter_by(name=self.name, holder=self.holder).delete(
+                    synchronize_session=False)
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+
+    def _close_connection(self) -> None:
+        connection, self._connection = self._connection, None
+        try:
+            # Never hand a connection that may hold the lock back to the pool
+            connection.invalidate()
+        except Exception:
+            pass
@@ -0,0 +1,265 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, List, Optional
+
+# Metrics persisted from every collection result
+STORED_METRICS = [
+    'active_connections', 'database_size_mb', 'cpu_percent', 'memory_percent', 'disk_usage',
+    'cache_hit_ratio', 'buffer_pool_hit_ratio', 'transaction_rate',
+    'blocks_read_per_sec', 'queries_per_sec', 'innodb_reads_per_sec'
+]
+
+# Rollup tiers, finest first: name -> bucket size in seconds
+RESOLUTIONS = [('1m', 60), ('1h', 3600), ('1d', 86400)]
+
+# Days of history kept per tier ('raw' is the MetricSample table)
+RETENTION_DAYS = {
+    'raw': float(os.getenv('METRIC_RETENTION_RAW_DAYS', 2)),
+    '1m': float(os.getenv('METRIC_RETENTION_1M_DAYS', 14)),
+    '1h': float(os.getenv('METRIC_RETENTION_1H_DAYS', 180)),
+    '1d': float(os.getenv('METRIC_RETENTION_1D_DAYS', 1825))
+}
+
+# Raw samples arriving this late are still included in their minute rollup
+ROLLUP_GRACE_SECONDS = 120
+
+# Upper bound on buckets aggregated per tier in one maintenance run
+MAX_BUCKETS_PER_RUN = 60
+
+
+def utcnow() -> datetime:
+    """Naive UTC timestamp as stored in the metric tables"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _floor(moment: datetime, seconds: int) -> datetime:
+    epoch = datetime(1970, 1, 1)
+    return epoch + timedelta(seconds=int((moment - epoch).total_seconds()) // seconds * seconds)
+
+
+class MetricStore:
+    """Batched writer, rollup job and range reader for metric history.
+
+    Raw samples are buffered in memory and inserted in batches. ``maintain_if_due``
+    aggregates completed buckets into the 1-minute, 1-hour and 1-day tiers
+    (min/max/avg/last) and deletes rows past each tier's retention. ``history``
+    reads from the cheapest tier that still has the requested resolution.
+    """
+
+    def __init__(self, db, sample_model, rollup_model, batch_size: int = 500,
+                 flush_interval: float = 10.0, maintain_interval: float = 60.0):
+        self.db = db
+        self.sample_model = sample_model
+        self.rollup_model = rollup_model
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.maintain_interval = maintain_interval
+        self._buffer: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._last_maintain = 0.0
+
+    def add(self, server_id, metrics: Dict[str, Any], timestamp: Optional[datetime] = None) -> None:
+        """Queue the numeric metrics of one collection result"""
+        timestamp = timestamp or utcnow()
+        rows = []
+        for name in STORED_METRICS:
+            value = metrics.get(name)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                rows.append({'server_id': server_id, 'metric': name, 'timestamp': timestamp, 'value': float(value)})
+        with self._lock:
+            self._buffer.extend(rows)
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._buffer)
+
+    def flush_if_due(self) -> int:
+        with self._lock:
+            due = (len(self._buffer) >= self.batch_size
+                   or time.monotonic() - self._last_flush >= self.flush_interval)
+        return self.flush() if due else 0
+
+    def flush(self) -> int:
+        """Insert all buffered samples in one batch; requires an app context"""
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+            self._last_flush = time.monotonic()
+        if not rows:
+            return 0
+        try:
+            self.db.session.bulk_insert_mappings(self.sample_model, rows)
+            self.db.session.commit()
+        except Exception:
+            self.db.session.rollback()
+            raise
+        return len(rows)
+
+    def maintain_if_due(self, now: Optional[datetime] = None) -> None:
+        if time.monotonic() - self._last_maintain >= self.maintain_interval:
+            self._last_maintain = time.monotonic()
+            self.rollup(now)
+            self.prune(now)
+
+    def rollup(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """Aggregate completed buckets into every tier, finest first"""
+        now = now or utcnow()
+        written = {}
+        source_end = now - timedelta(seconds=ROLLUP_GRACE_SECONDS)
+        source = None
+        for resolution, seconds in RESOLUTIONS:
+            end = _floor(source_end, seconds)
+            start = self._rollup_start(resolution, seconds, source)
+            if start is not None and start < end:
+                end = min(end, start + timedelta(seconds=seconds * MAX_BUCKETS_PER_RUN))
+                written[resolution] = self._rollup_range(resolution, seconds, source, start, end)
+                self.db.session.flush()
+            # The next tier may only cover what this tier has completed
+            source_end = self._latest_bucket_end(resolution, seconds) or datetime(1970, 1, 1)
+            source = resolution
+        self.db.session.commit()
+        return written
+
+    def _rollup_start(self, resolution: str, seconds: int, source: Optional[str]) -> Optional[datetime]:
+        """First bucket that still needs aggregating, skipping gaps without data"""
+        if source is None:
+            query = self.db.session.query(self.db.func.min(self.sample_model.timestamp))
+            moment = self.sample_model.timestamp
+        else:
+            query = self.db.session.query(self.db.func.min(self.rollup_model.bucket_start)).filter(
+                self.rollup_model.resolution == source)
+            moment = self.rollup_model.bucket_start
+        latest = self._latest_bucket_end(resolution, seconds)
+        if latest is not None:
+            query = query.filter(moment >= latest)
+        first = query.scalar()
+        return _floor(first, seconds) if first is not None else None
+
+    def _latest_bucket_end(self, resolution: str, seconds: int) -> Optional[datetime]:
+        latest = self.db.session.query(self.db.func.max(self.rollup_model.bucket_start)).filter(
+            self.rollup_model.resolution == resolution).scalar()
+        return latest + timedelta(seconds=seconds) if latest is not None else None
+
+    def _rollup_range(self, resolution: str, seconds: int, source: Optional[str],
+                      start: datetime, end: datetime) -> int:
+        buckets: Dict[tuple, Dict[str, Any]] = {}
+        if source is None:
+            model = self.sample_model
+            rows = self.db.session.query(
+                model.server_id, model.metric, model.timestamp,
+                model.value, model.value, model.value, model.value, self.db.literal(1)
+            ).filter(model.timestamp >= start, model.timestamp < end)
+        else:
+            model = self.rollup_model
+            rows = self.db.session.query(
+                model.server_id, model.metric, model.bucket_start,
+                model.min_value, model.max_value, model.avg_value, model.last_value, model.sample_count
+            ).filter(model.resolution == source, model.bucket_start >= start, model.bucket_start < end)
+
+        for server_id, metric, moment, low, high, avg, last, count in rows.yield_per(5000):
+            key = (server_id, metric, _floor(moment, seconds))
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = {'min': low, 'max': high, 'sum': avg * count, 'count': count,
+                                'last': last, 'last_at': moment}
+                continue
+            bucket['min'] = min(bucket['min'], low)
+            bucket['max'] = max(bucket['max'], high)
+            bucket['sum'] += avg * count
+            bucket['count'] += count
+            if moment >= bucket['last_at']:
+                bucket['last'], bucket['last_at'] = last, moment
+
+        self.db.session.bulk_insert_mappings(self.rollup_model, [{
+            'resolution': resolution,
+            'server_id': server_id,
+            'metric': metric,
+            'bucket_start': bucket_start,
+            'min_value': bucket['min'],
+            'max_value': bucket['max'],
+            'avg_value': bucket['sum'] / bucket['count'],
+            'last_value': bucket['last'],
+            'sample_count': bucket['count']
+        } for (server_id, metric, bucket_start), bucket in buckets.items()])
+        return len(buckets)
+
+    def prune(self, now: Optional[datetime] = None) -> None:
+        """Delete samples and rollups older than their tier's retention"""
+        now = now or utcnow()
+        self.sample_model.query.filter(
+            self.sample_model.timestamp < now - timedelta(days=RETENTION_DAYS['raw'])
+        ).delete(synchronize_session=False)
+        for resolution, _ in RESOLUTIONS:
+            self.rollup_model.query.filter(
+                self.rollup_model.resolution == resolution,
+                self.rollup_model.bucket_start < now - timedelta(days=RETENTION_DAYS[resolution])
+            ).delete(synchronize_session=False)
+        self.db.session.commit()
+
+    def purge_server(self, server_id) -> None:
+        """Remove all history of a server (called before the server is deleted)"""
+        self.sample_model.query.filter_by(server_id=server_id).delete(synchronize_session=False)
+        self.rollup_model.query.filter_by(server_id=server_id).delete(synchronize_session=False)
+
+    @staticmethod
+    def choose_resolution(start: datetime, step: float, now: Optional[datetime] = None) -> str:
+        """Pick the coarsest tier that is no coarser than ``step`` and still covers ``start``"""
+        now = now or utcnow()
+        for resolution, seconds in reversed(RESOLUTIONS):
+            if seconds <= step and start >= now - timedelta(days=RETENTION_DAYS[resolution]):
+                return resolution
+        if step < RESOLUTIONS[0][1] and start >= now - timedelta(days=RETENTION_DAYS['raw']):
+            return 'raw'
+        # Nothing has both the resolution and the range; prefer the range
+        for resolution, seconds in RESOLUTIONS:
+            if start >= now - timedelta(days=RETENTION_DAYS[resolution]):
+                return resolution
+        return RESOLUTIONS[-1][0]
+
+    def history(self, server_id, metric: str, start: datetime, end: datetime, step: float) -> Dict[str, Any]:
+        """Return points of ``metric`` between start and end, one per ``step`` seconds"""
+        resolution = self.choose_resolution(start, step)
+        if resolution == 'raw':
+            model = self.sample_model
+            rows = self.db.session.query(
+                model.timestamp, model.value, model.value, model.value, model.value, self.db.literal(1)
+            ).filter(model.server_id == server_id, model.metric == metric,
+                     model.timestamp >= start, model.timestamp < end).order_by(model.timestamp)
+        else:
+            model = self.rollup_model
+            rows = self.db.session.query(
+                model.bucket_start, model.min_value, model.max_value, model.avg_value,
+                model.last_value, model.sample_count
+            ).filter(model.resolution == resolution, model.server_id == server_id, model.metric == metric,
+                     model.bucket_start >= start, model.bucket_start < end).order_by(model.bucket_start)
+
+        points = []
+        step = max(1, int(step))
+        for moment, low, high, avg, last, count in rows:
+            bucket_start = _floor(moment, step)
+            if points and points[-1]['_start'] == bucket_start:
+                point = points[-1]
+                point['min'] = min(point['min'], low)
+                point['max'] = max(point['max'], high)
+                point['_sum'] += avg * count
+                point['_count'] += count
+                point['last'] = last
+            else:
+                points.append({'_start': bucket_start, 'min': low, 'max': high,
+                               '_sum': avg * count, '_count': count, 'last': last})
+
+        return {
+            'server_id': server_id,
+            'metric': metric,
+            'resolution': resolution,
+            'step': step,
+            'points': [{
+                'time': point['_start'].replace(tzinfo=timezone.utc).isoformat(),
+                'min': point['min'],
+                'max': point['max'],
+                'avg': point['_sum'] / point['_count'] if point['_count'] else None,
+                'last': point['last']
+            } for point in points]
+        }
@@ -0,0 +1,76 @@
+import os
+import threading
+from typing import Any, Dict, Iterable, Optional, Set
+
+# Metrics are collected in tiers by cost on the monitored server: fast ones
+# on every poll, the others only every few minutes (see DatabaseMonitor)
+TIERS = ('fast', 'medium', 'slow')
+
+# Seconds between collections per tier; 0 collects on every poll
+DEFAULT_TIER_INTERVALS = {
+    'fast': 0.0,
+    'medium': float(os.getenv('METRIC_TIER_MEDIUM_INTERVAL', 60)),
+    'slow': float(os.getenv('METRIC_TIER_SLOW_INTERVAL', 900))
+}
+
+
+def tier_intervals(overrides: Optional[Dict[str, Any]] = None) -> Dict[str, float]:
+    """Default intervals with a server's overrides applied; unknown tiers are rejected"""
+    intervals = dict(DEFAULT_TIER_INTERVALS)
+    for tier, seconds in (overrides or {}).items():
+        if tier not in TIERS:
+            raise ValueError(f'Unknown metric tier: {tier}')
+        if tier == 'fast':
+            raise ValueError('The fast tier runs on every poll; change the poll interval instead')
+        seconds = float(seconds)
+        if seconds < 0:
+            raise ValueError(f'Interval of the {tier} tier must not be negative')
+        intervals[tier] = seconds
+    return intervals
+
+
+class TierCache:
+    """Last values of each metric tier per server, with when they were collected.
+
+    ``due`` picks the tiers a poll has to query; ``apply`` remembers what it
+    returned and fills in the other tiers' metrics from earlier polls.
+    """
+
+    def __init__(self, metric_tiers: Dict[str, str]):
+        # Metric name -> tier; metrics not listed are fast
+        self.metric_tiers = metric_tiers
+        self._entries: Dict[Any, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def due(self, key, intervals: Dict[str, float], now: float) -> Set[str]:
+        with self._lock:
+            collected = dict(self._entries.get(key, {}))
+        return {tier for tier in TIERS
+                if intervals.get(tier, 0) <= 0 or tier not in collected
+                or now - collected[tier][0] >= intervals[tier]}
+
+    def apply(self, key, tiers: Iterable[str], metrics: Dict[str, Any], now: float) -> None:
+        """Cache the metrics of the collected ``tiers`` and add the others with ``tier_ages``"""
+        tiers = set(tiers)
+        ages = {}
+        with self._lock:
+            entry = self._entries.setdefault(key, {})
+            for tier in tiers:
+                entry[tier] = (now, {name: metrics[name] for name, metric_tier in self.metric_tiers.items()
+                                     if metric_tier == tier and name in metrics})
+            for tier, (collected_at, values) in entry.items():
+                if tier not in tiers:
+                    metrics.update(values)
+                ages[tier] = round(now - collected_at, 3)
+        # Seconds since each tier's values were collected
+        metrics['tier_ages'] = ages
+
+    def forget(self, key) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def retain(self, keys: Iterable) -> None:
+        keep = set(keys)
+        with self._lock:
+            for key in [k for k in self._entries if k not in keep]:
+                del self._entries[key]
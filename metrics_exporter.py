@@ -0,0 +1,72 @@
+import time
+from typing import Any, Callable, Dict, List
+
+from prometheus_client.core import GaugeMetricFamily
+
+# Snapshot metric key, Prometheus name, help text
+SNAPSHOT_METRICS = [
+    ('active_connections', 'db_active_connections', 'Number of active database connections'),
+    ('database_size_mb', 'db_size_mb', 'Database size in MB'),
+    ('cpu_percent', 'db_cpu_usage', 'Database CPU usage percentage'),
+    ('memory_percent', 'db_memory_usage', 'Database memory usage percentage'),
+    ('disk_usage', 'db_disk_usage', 'Database disk usage percentage'),
+    ('cache_hit_ratio', 'db_cache_hit_ratio', 'Database cache hit ratio'),
+    ('transaction_rate', 'db_transaction_rate', 'Database transactions per second'),
+]
+
+LABELS = ['db_name', 'db_type']
+
+
+class SnapshotCollector:
+    """Prometheus collector that renders the snapshot cache at scrape time.
+
+    ``servers()`` returns the servers that exist now as dicts with ``id``,
+    ``name`` and ``type``, so series of deleted or renamed servers disappear
+    on the next scrape. Samples carry the time their snapshot was collected.
+    A scrape never polls a server; it reports what the collectors last
+    stored, and ``dbmonitor_snapshot_age_seconds`` shows how old that is.
+    """
+
+    def __init__(self, cache, servers: Callable[[], List[Dict[str, Any]]]):
+        self.cache = cache
+        self.servers = servers
+
+    def describe(self):
+        # Nothing to describe up front; avoids a collection on registration
+        return []
+
+    def collect(self):
+        try:
+            servers = self.servers()
+        except Exception as e:
+            print(f"Error listing servers for Prometheus: {str(e)}")
+            return
+        families = {key: GaugeMetricFamily(name, description, labels=LABELS)
+                    for key, name, description in SNAPSHOT_METRICS}
+        up = GaugeMetricFamily('dbmonitor_server_up', 'Whether the last collection from the server succeeded',
+                               labels=LABELS)
+        duration = GaugeMetricFamily('dbmonitor_collection_duration_seconds',
+                                     'Seconds the last collection from the server took', labels=LABELS)
+        age = GaugeMetricFamily('dbmonitor_snapshot_age_seconds', 'Seconds since the server was last collected',
+                                labels=LABELS)
+
+        now = time.time()
+        for server in servers:
+            entry = self.cache.get(server['id'])
+            if entry is None:
+                continue
+            labels = [server['name'], server['type']]
+            collected_at = now - entry['age_seconds']
+            age.add_metric(labels, entry['age_seconds'])
+            up.add_metric(labels, 1.0 if entry['status'] == 'connected' else 0.0, timestamp=collected_at)
+            if entry.get('duration_seconds') is not None:
+                duration.add_metric(labels, entry['duration_seconds'], timestamp=collected_at)
+            for key, value in (entry['metrics'] or {}).items():
+                # Rates are None until a second sample exists for the server
+                if key in families and value is not None:
+                    families[key].add_metric(labels, float(value), timestamp=collected_at)
+
+        yield from families.values()
+        yield up
+        yield duration
+        yield age
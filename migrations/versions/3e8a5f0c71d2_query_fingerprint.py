@@ -0,0 +1,52 @@
+"""query fingerprint
+
+Revision ID: 3e8a5f0c71d2
+Revises: 7c1d9e4a2b63
+Create Date: 2026-10-17 11:02:37.551930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from query_fingerprint import fingerprint_query
+
+
+# revision identifiers, used by Alembic.
+revision = '3e8a5f0c71d2'
+down_revision = '7c1d9e4a2b63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('query_history', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('fingerprint', sa.String(length=16), nullable=True))
+        batch_op.create_index(batch_op.f('ix_query_history_fingerprint'), ['fingerprint'], unique=False)
+
+    # Backfill existing rows in batches
+    query_history = sa.table('query_history',
+                             sa.column('id', sa.Integer),
+                             sa.column('query_text', sa.Text),
+                             sa.column('fingerprint', sa.String))
+    connection = op.get_bind()
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(query_history.c.id, query_history.c.query_text)
+            .where(query_history.c.id > last_id)
+            .order_by(query_history.c.id)
+            .limit(1000)
+        ).fetchall()
+        if not rows:
+            break
+        connection.execute(
+            query_history.update().where(query_history.c.id == sa.bindparam('row_id')),
+            [{'row_id': row_id, 'fingerprint': fingerprint_query(text)} for row_id, text in rows]
+        )
+        last_id = rows[-1][0]
+
+
+def downgrade():
+    with op.batch_alter_table('query_history', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_query_history_fingerprint'))
+        batch_op.drop_column('fingerprint')
@@ -0,0 +1,55 @@
+"""metric history
+
+Revision ID: 7c1d9e4a2b63
+Revises: 25f9fb5f214d
+Create Date: 2026-10-17 09:12:44.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c1d9e4a2b63'
+down_revision = '25f9fb5f214d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('metric_sample',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('server_id', sa.Integer(), nullable=False),
+    sa.Column('metric', sa.String(length=64), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=False),
+    sa.Column('value', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['server_id'], ['database_server.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_metric_sample_series', 'metric_sample', ['server_id', 'metric', 'timestamp'], unique=False)
+    op.create_index('ix_metric_sample_timestamp', 'metric_sample', ['timestamp'], unique=False)
+    op.create_table('metric_rollup',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('resolution', sa.String(length=8), nullable=False),
+    sa.Column('server_id', sa.Integer(), nullable=False),
+    sa.Column('metric', sa.String(length=64), nullable=False),
+    sa.Column('bucket_start', sa.DateTime(), nullable=False),
+    sa.Column('min_value', sa.Float(), nullable=False),
+    sa.Column('max_value', sa.Float(), nullable=False),
+    sa.Column('avg_value', sa.Float(), nullable=False),
+    sa.Column('last_value', sa.Float(), nullable=False),
+    sa.Column('sample_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['server_id'], ['database_server.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_metric_rollup_series', 'metric_rollup', ['resolution', 'server_id', 'metric', 'bucket_start'], unique=True)
+    op.create_index('ix_metric_rollup_bucket', 'metric_rollup', ['resolution', 'bucket_start'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_metric_rollup_bucket', table_name='metric_rollup')
+    op.drop_index('ix_metric_rollup_series', table_name='metric_rollup')
+    op.drop_table('metric_rollup')
+    op.drop_index('ix_metric_sample_timestamp', table_name='metric_sample')
+    op.drop_index('ix_metric_sample_series', table_name='metric_sample')
+    op.drop_table('metric_sample')
@@ -0,0 +1,55 @@
+"""statement statistics
+
+Revision ID: 9b4f2c6d8e15
+Revises: 3e8a5f0c71d2
+Create Date: 2026-10-17 12:24:09.102846
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b4f2c6d8e15'
+down_revision = '3e8a5f0c71d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('statement_sample',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('server_id', sa.Integer(), nullable=False),
+    sa.Column('statement_key', sa.String(length=100), nullable=False),
+    sa.Column('collected_at', sa.DateTime(), nullable=False),
+    sa.Column('interval_seconds', sa.Float(), nullable=False),
+    sa.Column('calls', sa.BigInteger(), nullable=False),
+    sa.Column('total_time_ms', sa.Float(), nullable=False),
+    sa.Column('row_count', sa.BigInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['server_id'], ['database_server.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_statement_sample_server_time', 'statement_sample', ['server_id', 'collected_at'], unique=False)
+    op.create_index('ix_statement_sample_collected_at', 'statement_sample', ['collected_at'], unique=False)
+    op.create_table('statement_text',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('server_id', sa.Integer(), nullable=False),
+    sa.Column('statement_key', sa.String(length=100), nullable=False),
+    sa.Column('fingerprint', sa.String(length=16), nullable=True),
+    sa.Column('database_name', sa.String(length=100), nullable=True),
+    sa.Column('query_text', sa.Text(), nullable=False),
+    sa.Column('first_seen', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['server_id'], ['database_server.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_statement_text_key', 'statement_text', ['server_id', 'statement_key'], unique=True)
+    op.create_index(op.f('ix_statement_text_fingerprint'), 'statement_text', ['fingerprint'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_statement_text_fingerprint'), table_name='statement_text')
+    op.drop_index('ix_statement_text_key', table_name='statement_text')
+    op.drop_table('statement_text')
+    op.drop_index('ix_statement_sample_collected_at', table_name='statement_sample')
+    op.drop_index('ix_statement_sample_server_time', table_name='statement_sample')
+    op.drop_table('statement_sample')
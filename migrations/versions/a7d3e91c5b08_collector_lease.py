@@ -0,0 +1,37 @@
+"""collector lease
+
+Revision ID: a7d3e91c5b08
+Revises: f4c8a1d3b527
+Create Date: 2026-10-17 21:48:15.204117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d3e91c5b08'
+down_revision = 'f4c8a1d3b527'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('collector_lease',
+    sa.Column('collector_id', sa.String(length=100), nullable=False),
+    sa.Column('hostname', sa.String(length=255), nullable=False),
+    sa.Column('pid', sa.Integer(), nullable=False),
+    sa.Column('started_at', sa.DateTime(), nullable=False),
+    sa.Column('heartbeat_at', sa.DateTime(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('collector_id')
+    )
+    with op.batch_alter_table('collector_lease', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_collector_lease_expires_at'), ['expires_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('collector_lease', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_collector_lease_expires_at'))
+
+    op.drop_table('collector_lease')
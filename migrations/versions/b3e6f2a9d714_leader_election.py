@@ -0,0 +1,46 @@
+"""leader lease and shared snapshots
+
+Revision ID: b3e6f2a9d714
+Revises: a7d3e91c5b08
+Create Date: 2026-10-17 22:31:52.640218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3e6f2a9d714'
+down_revision = 'a7d3e91c5b08'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('leader_lease',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('holder', sa.String(length=100), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.create_table('server_snapshot',
+    sa.Column('server_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('metrics', sa.Text(), nullable=True),
+    sa.Column('queries', sa.Text(), nullable=True),
+    sa.Column('duration_seconds', sa.Float(), nullable=True),
+    sa.Column('collected_at', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['server_id'], ['database_server.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('server_id')
+    )
+    with op.batch_alter_table('server_snapshot', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_server_snapshot_collected_at'), ['collected_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('server_snapshot', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_server_snapshot_collected_at'))
+
+    op.drop_table('server_snapshot')
+    op.drop_table('leader_lease')
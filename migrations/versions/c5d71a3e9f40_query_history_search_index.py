@@ -0,0 +1,27 @@
+"""query history search index
+
+Revision ID: c5d71a3e9f40
+Revises: 9b4f2c6d8e15
+Create Date: 2026-10-17 13:40:51.664213
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from query_search import create_search_index, drop_search_index
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5d71a3e9f40'
+down_revision = '9b4f2c6d8e15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # FTS5 table and triggers on SQLite, tsvector/trigram indexes on PostgreSQL
+    create_search_index(op.get_bind())
+
+
+def downgrade():
+    drop_search_index(op.get_bind())
@@ -0,0 +1,26 @@
+"""server metric tier intervals
+
+Revision ID: d8f1b4c62e93
+Revises: b3e6f2a9d714
+Create Date: 2026-10-17 23:41:09.218734
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8f1b4c62e93'
+down_revision = 'b3e6f2a9d714'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('database_server', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('tier_intervals', sa.Text(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('database_server', schema=None) as batch_op:
+        batch_op.drop_column('tier_intervals')
@@ -0,0 +1,36 @@
+"""keyset pagination indexes
+
+Revision ID: e2a9b7c4d610
+Revises: c5d71a3e9f40
+Create Date: 2026-10-17 15:12:08.318402
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a9b7c4d610'
+down_revision = 'c5d71a3e9f40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('activity_log', schema=None) as batch_op:
+        batch_op.create_index('ix_activity_log_time_id', ['access_time', 'id'], unique=False)
+        batch_op.create_index('ix_activity_log_user_time_id', ['user_id', 'access_time', 'id'], unique=False)
+
+    with op.batch_alter_table('query_history', schema=None) as batch_op:
+        batch_op.create_index('ix_query_history_time_id', ['start_time', 'id'], unique=False)
+        batch_op.create_index('ix_query_history_server_time_id', ['server_id', 'start_time', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('query_history', schema=None) as batch_op:
+        batch_op.drop_index('ix_query_history_server_time_id')
+        batch_op.drop_index('ix_query_history_time_id')
+
+    with op.batch_alter_table('activity_log', schema=None) as batch_op:
+        batch_op.drop_index('ix_activity_log_user_time_id')
+        batch_op.drop_index('ix_activity_log_time_id')
@@ -0,0 +1,26 @@
+"""server poll interval
+
+Revision ID: f4c8a1d3b527
+Revises: e2a9b7c4d610
+Create Date: 2026-10-17 21:04:37.512903
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4c8a1d3b527'
+down_revision = 'e2a9b7c4d610'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('database_server', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('poll_interval', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('database_server', schema=None) as batch_op:
+        batch_op.drop_column('poll_interval')
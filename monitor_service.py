@@ -1,25 +1,61 @@
-from db_monitor import DatabaseMonitor
-from app import DatabaseServer, db
+from connection_pool import pool as connection_pool
+from collector import (collect_many, collect_statements, counter_deltas, statement_diffs, metric_tiers, capabilities,
+                       METRICS_TIMEOUT)
+from circuit_breaker import breaker
+from snapshot_cache import snapshots
+from ring_buffer import recent_history
+from scheduler import Scheduler
+from app import DatabaseServer, CollectorLease, db, metric_store, statement_store, health_checker, snapshot_store
+from sharding import ShardCoordinator
+import os
 import threading
 import time
+from functools import partial
 from datetime import datetime
 import json
 from prometheus_client import start_http_server, Gauge
 
-# Prometheus metrics
-db_active_connections = Gauge('db_active_connections', 'Number of active database connections', ['db_name', 'db_type'])
-db_size = Gauge('db_size_mb', 'Database size in MB', ['db_name', 'db_type'])
-db_cpu_usage = Gauge('db_cpu_usage', 'Database CPU usage percentage', ['db_name', 'db_type'])
-db_memory_usage = Gauge('db_memory_usage', 'Database memory usage percentage', ['db_name', 'db_type'])
-db_disk_usage = Gauge('db_disk_usage', 'Database disk usage percentage', ['db_name', 'db_type'])
-db_cache_hit_ratio = Gauge('db_cache_hit_ratio', 'Database cache hit ratio', ['db_name', 'db_type'])
-db_transaction_rate = Gauge('db_transaction_rate', 'Database transaction rate', ['db_name', 'db_type'])
+# Per-server metrics are rendered from the snapshot cache at scrape time (metrics_exporter)
+ring_buffer_bytes = Gauge('dbmonitor_ring_buffer_bytes', 'Memory held by the recent-history ring buffers')
+
+# Port of the standalone Prometheus endpoint; the app also serves /metrics
+PROMETHEUS_PORT = int(os.getenv('PROMETHEUS_PORT', 9090))
+
+# Seconds between pg_stat_statements / digest summary snapshots
+STATEMENT_SNAPSHOT_INTERVAL = float(os.getenv('STATEMENT_SNAPSHOT_INTERVAL', 60))
+
+# Seconds between re-reads of the server list (new, edited and deleted servers)
+SERVER_SYNC_INTERVAL = float(os.getenv('SERVER_SYNC_INTERVAL', 30))
+
+# Seconds between reads of the shared snapshots by processes that do not collect
+SNAPSHOT_SYNC_INTERVAL = float(os.getenv('SNAPSHOT_SYNC_INTERVAL', 2))
+
+# Seconds between writes of the queued snapshots, one transaction each
+SNAPSHOT_FLUSH_INTERVAL = float(os.getenv('SNAPSHOT_FLUSH_INTERVAL', 1))
 
 class MonitoringService:
-    def __init__(self, app, interval=60):
+    def __init__(self, app, interval=60, history=None, statement_interval=STATEMENT_SNAPSHOT_INTERVAL,
+                 sync_interval=SERVER_SYNC_INTERVAL, scheduler=None, shard=None, prometheus_port=PROMETHEUS_PORT,
+                 snapshot_flush_interval=SNAPSHOT_FLUSH_INTERVAL):
         self.app = app
+        # Default seconds between polls; DatabaseServer.poll_interval overrides it per server
         self.interval = interval
-        self.monitors = {}
+        self.statement_interval = statement_interval
+        self.sync_interval = sync_interval
+        self.snapshot_flush_interval = snapshot_flush_interval
+        # Recent samples per server for sparklines and short-window queries
+        self.history = history if history is not None else recent_history
+        self.scheduler = scheduler if scheduler is not None else Scheduler()
+        # ShardCoordinator when several collectors split the servers; None polls all of them
+        self.shard = shard
+        # 0 leaves the standalone Prometheus endpoint off
+        self.prometheus_port = prometheus_port
+        self._prometheus_started = False
+        # Name and connection settings per server id, as of the last sync
+        self._servers = {}
+        self._servers_lock = threading.Lock()
+        # The sync and heartbeat tasks may both resync; one at a time
+        self._sync_lock = threading.Lock()
         self.running = False
         self.thread = None
         
@@ -29,75 +65,246 @@ class MonitoringService:
             return
             
         self.running = True
-        self.thread = threading.Thread(target=self._monitor_loop)
-        self.thread.daemon = True
-        self.thread.start()
+        # Requests in this process now serve what the service collects
+        snapshots.add_collector(self)
+        if self.shard is not None:
+            # Join the ring before the first sync, so a new collector does not
+            # start out polling every server
+            try:
+                self.shard.heartbeat()
+            except Exception as e:
+                print(f"Error renewing collector lease: {str(e)}")
+        # The sync task schedules one metrics and one statements task per server
+        self.scheduler.schedule('sync', self._sync, self.sync_interval, group='sync')
+        self.scheduler.schedule('snapshots', self._flush_snapshots, self.snapshot_flush_interval, group='sync')
+        if self.shard is not None:
+            self.scheduler.schedule('heartbeat', self._heartbeat, self.shard.heartbeat_interval, group='sync')
+        self.scheduler.start()
+        self.thread = self.scheduler.thread
         
         # Start Prometheus metrics server
-        start_http_server(9090)
+        # Once per process; a re-elected service keeps the port it has
+        if self.prometheus_port and not self._prometheus_started:
+            try:
+                start_http_server(self.prometheus_port)
+                self._prometheus_started = True
+            except OSError as e:
+                # Collection does not depend on the port; /metrics of the app still works
+                self.app.logger.error(f"Could not serve Prometheus metrics on port {self.prometheus_port}: {e}")
         
     def stop(self):
         """Stop the monitoring service"""
         self.running = False
-        if self.thread:
-            self.thread.join()
+        # Returns as soon as collections in progress are done; those never
+        # take much longer than the collection timeout
+        self.scheduler.stop(timeout=METRICS_TIMEOUT + 5)
+        if self.shard is not None:
+            try:
+                self.shard.release()
+            except Exception as e:
+                print(f"Error releasing collector lease: {str(e)}")
+        snapshots.remove_collector(self)
+        
+        # Write out samples still waiting for the next batch
+        self._flush_snapshots()
+        with self.app.app_context():
+            try:
+                metric_store.flush()
+            except Exception as e:
+                print(f"Error storing metric history: {str(e)}")
+    
+    def _sync(self):
+        """Schedule every registered server and do the periodic housekeeping"""
+        with self._sync_lock, self.app.app_context():
+            servers = self._load_servers()
+            keys = {'sync', 'heartbeat', 'snapshots'}
+            for server in servers:
+                interval = server.poll_interval or self.interval
+                self.scheduler.schedule(('metrics', server.id), partial(self._collect_metrics, [server.id]),
+                                        interval, group='metrics')
+                # Half a poll apart, so both tasks can share one pooled connection
+                self.scheduler.schedule(('statements', server.id), partial(self._collect_statements, [server.id]),
+                                        self.statement_interval, group='statements', delay=interval / 2)
+                keys.update((('metrics', server.id), ('statements', server.id)))
+            self.scheduler.retain(keys)
             
-    def _monitor_loop(self):
-        """Main monitoring loop"""
-        while self.running:
-            with self.app.app_context():
-                try:
-                    self._collect_metrics()
-                except Exception as e:
-                    print(f"Error collecting metrics: {str(e)}")
-            time.sleep(self.interval)
+            server_ids = [server.id for server in servers]
+            snapshots.retain(server_ids)
+            snapshot_store.retain(server_ids)
+            breaker.retain(server_ids)
+            if not health_checker.running:
+                # Without the background checker nobody else stores the status
+                health_checker.write()
+            counter_deltas.retain(server_ids)
+            metric_tiers.retain(server_ids)
+            capabilities.retain(server_ids)
+            statement_diffs.retain(server_ids)
+            self.history.retain(server_ids)
+            ring_buffer_bytes.set(self.history.memory_bytes())
             
-    def _collect_metrics(self):
-        """Collect metrics from all registered database servers"""
-        servers = DatabaseServer.query.all()
-        
-        for server in servers:
             try:
-                # Create monitor if it doesn't exist
-                if server.id not in self.monitors:
-                    config = {
-                        'db_type': server.db_type,
-                        'host': server.host,
-                        'port': server.port,
-                        'database': 'postgres' if server.db_type == 'postgresql' else 'master',  # Default databases
-                        'username': server.username,
-                        'password': server.password
-                    }
-                    self.monitors[server.id] = DatabaseMonitor(config)
-                
-                monitor = self.monitors[server.id]
-                
-                # Connect if not connected
-                if not monitor.connection:
-                    monitor.connect()
-                
-                # Collect metrics
-                metrics = monitor.get_performance_metrics()
-                
-                # Update Prometheus metrics
-                labels = {'db_name': server.name, 'db_type': server.db_type}
+                # Each collector writes the samples it buffered itself
+                metric_store.flush_if_due()
+                # Rollups and pruning cover every server; two collectors would
+                # write the same rollup rows
+                if self.shard is None or self.shard.owns_maintenance():
+                    metric_store.maintain_if_due()
+                    statement_store.prune()
+            except Exception as e:
+                print(f"Error storing metric history: {str(e)}")
+        connection_pool.evict_idle()
+    
+    def _heartbeat(self):
+        """Renew the collector lease; take over or hand off servers when collectors come or go"""
+        try:
+            changed = self.shard.heartbeat()
+        except Exception as e:
+            # Keep polling the current share; the other collectors take it
+            # over if the lease expires meanwhile
+            print(f"Error renewing collector lease: {str(e)}")
+            return
+        if changed:
+            print(f"Collectors changed, now {len(self.shard.members())}; rebalancing servers")
+            self._sync()
+    
+    def _load_servers(self):
+        servers = [server for server in DatabaseServer.query.all()
+                   if self.shard is None or self.shard.owns(server.id)]
+        with self._servers_lock:
+            self._servers = {server.id: (server.name, server.monitor_config()) for server in servers}
+        return servers
+    
+    def _targets(self, server_ids=None):
+        """Name and config per server id; all registered servers when ``server_ids`` is None"""
+        if server_ids is None:
+            self._load_servers()
+        with self._servers_lock:
+            if server_ids is None:
+                return dict(self._servers)
+            return {server_id: self._servers[server_id] for server_id in server_ids if server_id in self._servers}
+            
+    def _collect_metrics(self, server_ids=None):
+        """Collect metrics from the given (by default all) registered database servers"""
+        targets = self._targets(server_ids)
+        results = collect_many({server_id: config for server_id, (_, config) in targets.items()})
+        collected_at = time.time()
+        # Shared with web workers and other processes that do not collect
+        # by the next snapshot flush; servers skipped by their open circuit
+        # keep the snapshot last shared
+        snapshot_store.add({server_id: result for server_id, result in results.items()
+                            if result['status'] != 'open'}, collected_at)
+        
+        with self.app.app_context():
+            for server_id, (name, _) in targets.items():
+                result = results[server_id]
                 
-                db_active_connections.labels(**labels).set(metrics['active_connections'])
-                db_size.labels(**labels).set(metrics['database_size_mb'])
-                db_cpu_usage.labels(**labels).set(metrics['cpu_percent'])
-                db_memory_usage.labels(**labels).set(metrics['memory_percent'])
-                db_disk_usage.labels(**labels).set(metrics['disk_usage'])
+                # Publish to the snapshot cache read by the dashboard API and /metrics
+                snapshots.put(server_id, result, collected_at)
+                # A metrics poll is also a health check
+                health_checker.record(server_id, result['status'], result['error'])
                 
-                if 'cache_hit_ratio' in metrics:
-                    db_cache_hit_ratio.labels(**labels).set(metrics['cache_hit_ratio'])
-                if 'transaction_rate' in metrics:
-                    db_transaction_rate.labels(**labels).set(metrics['transaction_rate'])
+                if result['status'] != 'connected':
+                    print(f"Error monitoring server {name}: {result['error']}")
+                    continue
                 
+                metrics = result['metrics']
+                metric_store.add(server_id, metrics)
+                self.history.append(server_id, metrics, int(time.time() * 1000))
+
+    def _flush_snapshots(self):
+        """Write the snapshots queued since the previous flush in one transaction"""
+        try:
+            snapshot_store.flush()
+        except Exception as e:
+            print(f"Error sharing metrics snapshots: {str(e)}")
+
+    def _collect_statements(self, server_ids=None):
+        """Store what each server's statements did since the previous snapshot"""
+        targets = self._targets(server_ids)
+        # Servers that just failed the metrics poll would only time out again
+        reachable = {server_id: target for server_id, target in targets.items()
+                     if (snapshots.get(server_id) or {}).get('status', 'connected') == 'connected'}
+        results = collect_statements({server_id: config for server_id, (_, config) in reachable.items()})
+        
+        with self.app.app_context():
+            for server_id, (name, _) in reachable.items():
+                result = results[server_id]
+                if result['status'] == 'unsupported':
+                    continue  # reported once when the server was probed
+                if result['status'] != 'connected':
+                    # Usually pg_stat_statements or performance_schema is not enabled
+                    print(f"Error reading statement statistics from {name}: {result['error']}")
+                    continue
+                interval = result['interval']
+                if interval is None:
+                    continue  # first snapshot is the baseline
+                if interval['reset']:
+                    print(f"Statement statistics were reset on {name}")
+                statement_store.record(server_id, interval['changes'], interval['elapsed'])
+
+
+class ElectedCollector:
+    """Runs collection in whichever process wins ``election``.
+
+    The leader runs the MonitoringService and the health checker; when it
+    exits or loses the election another process takes over. The service
+    joins the collectors' hash ring, so next to dedicated collectors
+    (run_collector.py) the leader polls only its share of the servers. The
+    other processes, and a leader that shares the servers, copy the shared
+    snapshots into their own cache every ``sync_interval`` seconds, so
+    however many processes serve the web app, each monitored server is
+    polled once per interval.
+    """
+
+    def __init__(self, app, election, service=None, sync_interval=SNAPSHOT_SYNC_INTERVAL):
+        self.app = app
+        self.election = election
+        if service is None:
+            # Every worker serves /metrics from the shared snapshots; a port
+            # of its own would still be held by the previous leader when
+            # leadership moves
+            service = MonitoringService(app, shard=ShardCoordinator(app, db, CollectorLease), prometheus_port=0)
+        self.service = service
+        self.sync_interval = sync_interval
+        election.on_elected = self._lead
+        election.on_deposed = self._follow
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stopping.clear()
+        self.election.start()
+        self._thread = threading.Thread(target=self._sync_loop, name='snapshot-sync', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        # A leader steps down here, which stops its collection
+        self.election.stop()
+
+    def _lead(self):
+        health_checker.start()
+        self.service.start()
+
+    def _follow(self):
+        self.service.stop()
+        health_checker.stop()
+
+    def _reads_shared(self):
+        """Whether other processes collect servers this one shows"""
+        if self.election.following:
+            return True
+        shard = self.service.shard
+        return self.election.is_leader and shard is not None and len(shard.members()) > 1
+
+    def _sync_loop(self):
+        while not self._stopping.wait(self.sync_interval):
+            if not self._reads_shared():
+                continue
+            try:
+                snapshot_store.sync_into(snapshots)
             except Exception as e:
-                print(f"Error monitoring server {server.name}: {str(e)}")
-                if server.id in self.monitors:
-                    try:
-                        self.monitors[server.id].close()
-                    except:
-                        pass
-                    del self.monitors[server.id]
+                print(f"Error reading shared snapshots: {str(e)}")
@@ -0,0 +1,126 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Sequence
+
+import sqlalchemy as sa
+
+# Counts are estimated from at most this many rows where the database has no planner estimate
+COUNT_ESTIMATE_CAP = 10000
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and 'dt' in value:
+        return datetime.fromisoformat(value['dt'])
+    return value
+
+
+def encode_cursor(direction: str, values: Sequence[Any]) -> str:
+    """Opaque token for the page after (``next``) or before (``prev``) a row"""
+    payload = json.dumps([direction, [_encode_value(v) for v in values]], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token: str, size: int):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        direction, values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        values = [_decode_value(v) for v in values]
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f'Invalid cursor: {str(e)}')
+    if direction not in ('next', 'prev') or len(values) != size:
+        raise InvalidCursor('Invalid cursor')
+    return direction, values
+
+
+class KeysetPage:
+    """One page of a keyset-paginated query plus the tokens of its neighbours"""
+
+    def __init__(self, items: List[Any], next_cursor: Optional[str], prev_cursor: Optional[str],
+                 total_estimate: Optional[int] = None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total_estimate = total_estimate
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self) -> bool:
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+
+def paginate_keyset(query, keys: Sequence, per_page: int, cursor: Optional[str] = None,
+                    descending: bool = True, key_values=None) -> KeysetPage:
+    """Seek to the page after/before ``cursor`` instead of using OFFSET.
+
+    ``keys`` are the sort columns, ending with a unique one (the id), all
+    sorted in the same direction. ``key_values(row)`` returns the key values
+    of a result row; by default they are read from the attributes named like
+    the key columns. The page is found through an index on the keys, so its
+    cost does not grow with its position.
+    """
+    if key_values is None:
+        names = [key.key for key in keys]
+        key_values = lambda row: [getattr(row, name) for name in names]
+
+    direction, values = decode_cursor(cursor, len(keys)) if cursor else ('next', None)
+    # Walking backwards runs the query in the opposite order and flips the page
+    forward = (direction == 'next') == descending
+    if values is not None:
+        position = sa.tuple_(*keys)
+        query = query.filter(position < sa.tuple_(*values) if forward else position > sa.tuple_(*values))
+    query = query.order_by(*[key.desc() if forward else key.asc() for key in keys])
+
+    rows = query.limit(per_page + 1).all()
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if direction == 'prev':
+        rows.reverse()
+
+    if direction == 'next':
+        has_next, has_prev = more, values is not None
+    else:
+        has_next, has_prev = True, more
+    return KeysetPage(
+        rows,
+        encode_cursor('next', key_values(rows[-1])) if rows and has_next else None,
+        encode_cursor('prev', key_values(rows[0])) if rows and has_prev else None
+    )
+
+
+def estimate_count(query) -> int:
+    """Approximate number of rows of ``query`` without a full COUNT(*).
+
+    PostgreSQL answers from the planner's row estimate. Elsewhere rows are
+    counted up to COUNT_ESTIMATE_CAP, so the result is exact for small sets
+    and a lower bound for large ones.
+    """
+    session = query.session
+    statement = query.order_by(None).statement
+    if session.connection().dialect.name == 'postgresql':
+        compiled = statement.compile(dialect=session.connection().dialect, compile_kwargs={'literal_binds': True})
+        plan = session.execute(sa.text(f'EXPLAIN (FORMAT JSON) {compiled}')).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+    capped = statement.limit(COUNT_ESTIMATE_CAP).subquery()
+    return session.execute(sa.select(sa.func.count()).select_from(capped)).scalar()
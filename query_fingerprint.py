@@ -0,0 +1,133 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+# Normalized queries remembered by the LRU cache
+CACHE_SIZE = int(os.getenv('QUERY_FINGERPRINT_CACHE_SIZE', 4096))
+
+# One alternation per token kind; the group name tells the normalizer what to do
+_TOKEN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<comment>--[^\n]*|\#(?![>-])[^\n]*|/\*.*?(?:\*/|$))
+  | (?P<dollar>\$\$.*?(?:\$\$|$)|\$(?P<tag>[A-Za-z_]\w*)\$.*?(?:\$(?P=tag)\$|$))
+  | (?P<string>[EeNnBbXx]?'(?:[^'\\]|\\.|'')*(?:'|$))
+  | (?P<quoted>"(?:[^"]|"")*(?:"|$)|`(?:[^`]|``)*(?:`|$))
+  | (?P<param>\$\d+|\?|%(?:\([^)]*\))?s|(?<!:):[A-Za-z_]\w*)
+  | (?P<number>0[xX][0-9A-Fa-f]+|(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<word>[A-Za-z_][\w$]*)
+  | (?P<punct>\.\.\.|::|:=|<=|>=|<>|!=|\|\||->>|->|\#>>|\#>|@>|<@|<<|>>|[^\s\w])
+""", re.VERBOSE | re.DOTALL)
+
+# Tokens after which a minus sign is unary and belongs to the literal
+_UNARY_CONTEXT = {
+    None, '(', ',', '=', '<', '>', '<=', '>=', '<>', '!=', '+', '-', '*', '/',
+    'select', 'where', 'and', 'or', 'not', 'when', 'then', 'else', 'in', 'values',
+    'by', 'limit', 'offset', 'between', 'like', 'is', 'return', 'set', 'interval'
+}
+
+_IN_LIST = re.compile(r'\bin \(\?(?:, \?)*\)')
+_VALUES_LIST = re.compile(r'\bvalues \((?:\?|\.\.\.)(?:, (?:\?|\.\.\.))*\)(?:, \((?:\?|\.\.\.)(?:, (?:\?|\.\.\.))*\))*')
+
+
+def _tokens(sql: str):
+    """Normalized tokens; literals and placeholders become '?'"""
+    tokens = []
+    for match in _TOKEN.finditer(sql):
+        kind = match.lastgroup
+        if kind in ('space', 'comment'):
+            continue
+        text = match.group()
+        if kind in ('string', 'dollar', 'tag', 'param', 'number'):
+            if tokens and tokens[-1] == '-' and (tokens[-2] if len(tokens) > 1 else None) in _UNARY_CONTEXT:
+                # Fold the unary minus into the literal: "= -5" -> "= ?"
+                tokens.pop()
+            tokens.append('?')
+        elif kind == 'quoted':
+            # "Name" and `name` are the same identifier for grouping
+            tokens.append(text[1:-1].lower() if len(text) > 1 else text)
+        else:
+            tokens.append(text.lower())
+    while tokens and tokens[-1] == ';':
+        tokens.pop()
+    return tokens
+
+
+def _join(tokens) -> str:
+    parts = []
+    for token in tokens:
+        if parts and token not in (')', ',', '.', ';') and parts[-1] not in ('(', '.'):
+            parts.append(' ')
+        parts.append(token)
+    return ''.join(parts)
+
+
+def _normalize(sql: str) -> str:
+    text = _join(_tokens(sql))
+    # Variable-length lists would otherwise give one fingerprint per length
+    text = _IN_LIST.sub('in (...)', text)
+    text = _VALUES_LIST.sub('values (...)', text)
+    return text
+
+
+class FingerprintCache:
+    """LRU of (normalized text, fingerprint) keyed by a digest of the raw text.
+
+    Keys are 16-byte digests rather than the raw statements, so the cache
+    does not keep large query texts alive.
+    """
+
+    def __init__(self, size: int = CACHE_SIZE):
+        self.size = size
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, sql: str) -> Tuple[str, str]:
+        key = hashlib.blake2b(sql.encode('utf-8', 'replace'), digest_size=16).digest()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        normalized = _normalize(sql)
+        fingerprint = hashlib.blake2b(normalized.encode('utf-8'), digest_size=8).hexdigest()
+        entry = (normalized, fingerprint)
+        with self._lock:
+            self._entries[key] = entry
+            if len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'capacity': self.size,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+_cache = FingerprintCache()
+
+
+def normalize_query(sql: Optional[str]) -> Optional[str]:
+    """Query text with literals replaced by '?', lists collapsed and case/whitespace normalized"""
+    if not sql:
+        return None
+    return _cache.lookup(sql)[0]
+
+
+def fingerprint_query(sql: Optional[str]) -> Optional[str]:
+    """Stable 64-bit fingerprint of the normalized query as 16 hex characters"""
+    if not sql:
+        return None
+    return _cache.lookup(sql)[1]
@@ -0,0 +1,139 @@
+import re
+from typing import Optional
+
+import sqlalchemy as sa
+
+from query_fingerprint import fingerprint_query
+
+FTS_TABLE = 'query_history_fts'
+TRIGRAM_INDEX = 'ix_query_history_text_trgm'
+TSVECTOR_INDEX = 'ix_query_history_text_tsv'
+
+# Tokens are words of SQL text; '_' is part of a token so user_id stays whole
+SQLITE_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        query_text, content='query_history', content_rowid='id', tokenize="unicode61 tokenchars '_'")""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON query_history BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, query_text) VALUES (new.id, new.query_text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON query_history BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, query_text) VALUES ('delete', old.id, old.query_text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF query_text ON query_history BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, query_text) VALUES ('delete', old.id, old.query_text);
+        INSERT INTO {FTS_TABLE}(rowid, query_text) VALUES (new.id, new.query_text);
+    END""",
+]
+
+# Expression indexes are maintained by PostgreSQL itself on every write
+POSTGRES_TSVECTOR_DDL = (f"CREATE INDEX IF NOT EXISTS {TSVECTOR_INDEX} ON query_history "
+                         f"USING gin (to_tsvector('simple', query_text))")
+POSTGRES_TRIGRAM_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS {TRIGRAM_INDEX} ON query_history USING gin (query_text gin_trgm_ops)",
+]
+
+# Fingerprint matches have the same shape as the searched statement; list them first
+FINGERPRINT_RANK = -1e9
+
+_HEX_FINGERPRINT = re.compile(r'^[0-9a-fA-F]{16}$')
+_WORD = re.compile(r'\w+')
+
+
+def create_search_index(connection) -> None:
+    """Create the text search index for the connection's dialect, if supported"""
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        exists = _sqlite_has_index(connection)
+        for statement in SQLITE_DDL:
+            connection.execute(sa.text(statement))
+        if not exists:
+            # Index the rows written before the table existed
+            connection.execute(sa.text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+    elif dialect == 'postgresql':
+        connection.execute(sa.text(POSTGRES_TSVECTOR_DDL))
+        try:
+            # pg_trgm may not be installable without superuser rights
+            with connection.begin_nested():
+                for statement in POSTGRES_TRIGRAM_DDL:
+                    connection.execute(sa.text(statement))
+        except sa.exc.DBAPIError as e:
+            print(f"Trigram index not created, substring search will scan: {str(e)}")
+
+
+def drop_search_index(connection) -> None:
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        for suffix in ('ai', 'ad', 'au'):
+            connection.execute(sa.text(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}"))
+        connection.execute(sa.text(f"DROP TABLE IF EXISTS {FTS_TABLE}"))
+    elif dialect == 'postgresql':
+        connection.execute(sa.text(f"DROP INDEX IF EXISTS {TRIGRAM_INDEX}"))
+        connection.execute(sa.text(f"DROP INDEX IF EXISTS {TSVECTOR_INDEX}"))
+
+
+def include_object(object, name, type_, reflected, compare_to) -> bool:
+    """Alembic filter: the search index is managed here, not by the models"""
+    if type_ == 'table' and name and name.startswith(FTS_TABLE):
+        return False
+    if type_ == 'index' and name in (TRIGRAM_INDEX, TSVECTOR_INDEX):
+        return False
+    return True
+
+
+def _sqlite_has_index(connection) -> bool:
+    return connection.execute(sa.text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"
+    ), {'name': FTS_TABLE}).first() is not None
+
+
+def _fts_query(text: str) -> Optional[str]:
+    """FTS5 MATCH expression: every token must appear, the last one as a prefix"""
+    tokens = _WORD.findall(text)
+    if not tokens:
+        return None
+    quoted = [f'"{token}"' for token in tokens]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def search_queries(query, model, session, text: str):
+    """Restrict a QueryHistory query to rows matching ``text``.
+
+    Matches are rows whose text contains the search tokens (FTS5 on SQLite,
+    tsvector/trigram on PostgreSQL, ILIKE elsewhere) plus rows with the same
+    fingerprint as the search text, or with the fingerprint itself when a
+    16-digit hex value is searched. Returns the query and its rank column;
+    lower ranks are better matches.
+    """
+    text = text.strip()
+    connection = session.connection()
+    dialect = connection.dialect.name
+    matches = []
+
+    if dialect == 'sqlite' and _sqlite_has_index(connection):
+        match = _fts_query(text)
+        if match is not None:
+            fts = sa.text(
+                f"SELECT rowid AS id, bm25({FTS_TABLE}) AS rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match"
+            ).bindparams(match=match).columns(id=sa.Integer, rank=sa.Float).subquery()
+            matches.append(sa.select(fts.c.id, fts.c.rank))
+    elif dialect == 'postgresql':
+        document = sa.func.to_tsvector('simple', model.query_text)
+        terms = sa.func.plainto_tsquery('simple', text)
+        matches.append(sa.select(model.id.label('id'), (-sa.func.ts_rank(document, terms)).label('rank')).where(
+            sa.or_(document.op('@@')(terms), model.query_text.ilike(f'%{text}%'))))
+    else:
+        matches.append(sa.select(model.id.label('id'), sa.literal(0.0).label('rank')).where(
+            model.query_text.ilike(f'%{text}%')))
+
+    fingerprint = text.lower() if _HEX_FINGERPRINT.match(text) else fingerprint_query(text)
+    if fingerprint:
+        matches.append(sa.select(model.id.label('id'), sa.literal(FINGERPRINT_RANK).label('rank')).where(
+            model.fingerprint == fingerprint))
+
+    if not matches:
+        return query.filter(sa.false()), sa.literal(0.0)
+    combined = sa.union_all(*matches).subquery()
+    ranked = sa.select(combined.c.id, sa.func.min(combined.c.rank).label('rank')).group_by(combined.c.id).subquery()
+    return query.join(ranked, ranked.c.id == model.id), ranked.c.rank
@@ -0,0 +1,122 @@
+import math
+import os
+import threading
+from array import array
+from typing import Dict, Any, Iterable, List, Optional
+
+from metric_store import STORED_METRICS
+
+# Samples kept per server; memory per server is
+# capacity * 8 bytes * (1 timestamp column + one column per metric)
+DEFAULT_CAPACITY = int(os.getenv('RING_BUFFER_CAPACITY', 720))
+
+
+class ServerRing:
+    """Fixed-size circular buffer of recent samples for one server.
+
+    Timestamps (epoch milliseconds) live in one int64 column shared by all
+    metrics and every metric has its own float64 column, so a sample costs a
+    fixed number of bytes and no Python objects are kept per sample. Missing
+    values are stored as NaN.
+    """
+
+    __slots__ = ('capacity', 'metrics', '_times', '_columns', '_head', '_count')
+
+    def __init__(self, capacity: int, metrics: List[str]):
+        self.capacity = capacity
+        self.metrics = metrics
+        self._times = array('q', bytes(8 * capacity))
+        self._columns = {name: array('d', bytes(8 * capacity)) for name in metrics}
+        self._head = 0
+        self._count = 0
+
+    def append(self, timestamp_ms: int, values: Dict[str, Any]) -> None:
+        if self._count and timestamp_ms < self._times[(self._head - 1) % self.capacity]:
+            # Keep the buffer ordered; late samples belong in the SQL history
+            return
+        index = self._head
+        self._times[index] = timestamp_ms
+        for name, column in self._columns.items():
+            value = values.get(name)
+            column[index] = float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else math.nan
+        self._head = (index + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def window(self, since_ms: int, metrics: Iterable[str]) -> Dict[str, Any]:
+        """Samples newer than ``since_ms``, oldest first.
+
+        Walks backwards from the newest sample and stops at the first one
+        that is too old, so the cost is proportional to the window size.
+        """
+        metrics = [name for name in metrics if name in self._columns]
+        indexes = []
+        position = self._head
+        for _ in range(self._count):
+            position = (position - 1) % self.capacity
+            if self._times[position] < since_ms:
+                break
+            indexes.append(position)
+        indexes.reverse()
+        return {
+            'times': [self._times[i] for i in indexes],
+            'series': {name: [None if math.isnan(self._columns[name][i]) else self._columns[name][i]
+                              for i in indexes]
+                       for name in metrics}
+        }
+
+    @property
+    def nbytes(self) -> int:
+        return self._times.itemsize * self.capacity * (1 + len(self._columns))
+
+
+class RingBufferStore:
+    """Recent history for every monitored server, bounded per server"""
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, metrics: Optional[List[str]] = None):
+        self.capacity = capacity
+        self.metrics = list(metrics or STORED_METRICS)
+        self._rings: Dict[Any, ServerRing] = {}
+        self._lock = threading.Lock()
+
+    def append(self, server_id, metrics: Dict[str, Any], timestamp_ms: int) -> None:
+        with self._lock:
+            ring = self._rings.get(server_id)
+            if ring is None:
+                ring = self._rings[server_id] = ServerRing(self.capacity, self.metrics)
+            ring.append(timestamp_ms, metrics)
+
+    def window(self, server_id, since_ms: int, metrics: Iterable[str]) -> Dict[str, Any]:
+        with self._lock:
+            ring = self._rings.get(server_id)
+            if ring is None:
+                return {'times': [], 'series': {name: [] for name in metrics}}
+            return ring.window(since_ms, metrics)
+
+    def retain(self, server_ids: Iterable) -> None:
+        keep = set(server_ids)
+        with self._lock:
+            for server_id in [k for k in self._rings if k not in keep]:
+                del self._rings[server_id]
+
+    def discard(self, server_id) -> None:
+        with self._lock:
+            self._rings.pop(server_id, None)
+
+    def memory_bytes(self) -> int:
+        with self._lock:
+            return sum(ring.nbytes for ring in self._rings.values())
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'servers': len(self._rings),
+                'capacity': self.capacity,
+                'samples': sum(len(ring) for ring in self._rings.values()),
+                'bytes': sum(ring.nbytes for ring in self._rings.values())
+            }
+
+
+recent_history = RingBufferStore()
@@ -0,0 +1,46 @@
+"""Run a collector that polls its share of the registered database servers.
+
+Collectors started against the same DATABASE_URL (in several processes or on
+several hosts) split the servers between them and take over the servers of
+a collector that stops. For example, three collectors on one machine:
+
+    python run_collector.py --prometheus-port 9101 &
+    python run_collector.py --prometheus-port 9102 &
+    python run_collector.py --prometheus-port 9103 &
+"""
+import argparse
+import signal
+import threading
+
+from app import app, db, CollectorLease
+from monitor_service import MonitoringService, PROMETHEUS_PORT
+from sharding import ShardCoordinator
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Poll a share of the registered database servers')
+    parser.add_argument('--interval', type=float, default=60,
+                        help='Seconds between polls of servers without their own poll interval (default 60)')
+    parser.add_argument('--prometheus-port', type=int, default=PROMETHEUS_PORT,
+                        help=f'Port of the Prometheus endpoint, 0 to disable (default {PROMETHEUS_PORT})')
+    parser.add_argument('--collector-id', help='Name of this collector in the lease table (default host:pid:random)')
+    args = parser.parse_args()
+
+    shard = ShardCoordinator(app, db, CollectorLease, collector_id=args.collector_id)
+    service = MonitoringService(app, interval=args.interval, shard=shard, prometheus_port=args.prometheus_port)
+
+    stopping = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stopping.set())
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+
+    service.start()
+    print(f"Collector {shard.collector_id} started")
+    while not stopping.wait(1):
+        pass
+    print(f"Collector {shard.collector_id} stopping")
+    # Releases the lease, so the other collectors take over right away
+    service.stop()
+
+
+if __name__ == '__main__':
+    main()
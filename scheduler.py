@@ -0,0 +1,205 @@
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional
+
+from prometheus_client import Counter, Histogram
+
+# Threads that run due tasks; a slow task never delays the others
+SCHEDULER_MAX_WORKERS = int(os.getenv('SCHEDULER_MAX_WORKERS', 16))
+
+# Each run starts up to this fraction of its interval late, so servers with
+# the same interval are not polled in lockstep
+SCHEDULER_JITTER = float(os.getenv('SCHEDULER_JITTER', 0.1))
+
+schedule_lag = Histogram('dbmonitor_schedule_lag_seconds',
+                         'Seconds between when a scheduled task was due and when it was dispatched', ['group'],
+                         buckets=(0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60))
+skipped_ticks = Counter('dbmonitor_schedule_skipped_ticks',
+                        'Scheduled runs skipped, because the previous run was still busy (overrun) '
+                        'or the scheduler fell more than an interval behind (late)', ['group', 'reason'])
+
+
+class _Task:
+    def __init__(self, key, fn: Callable[[], Any], interval: float, jitter: float, group: str):
+        self.key = key
+        self.fn = fn
+        self.interval = interval
+        self.jitter = jitter
+        self.group = group
+        # Tick the next run belongs to; advanced by whole intervals, so run
+        # times never drift with how long the runs take
+        self.base = 0.0
+        # Id of the task's current heap entry; older entries are stale and skipped
+        self.entry = None
+        self.future: Optional[Future] = None
+
+
+class Scheduler:
+    """Runs recurring tasks at fixed rates from a heap of due times.
+
+    Every task has its own interval; its runs are due at ``start + n *
+    interval`` plus a random delay of up to ``jitter`` times the interval.
+    Due tasks are dispatched to a thread pool. A tick is skipped (and
+    counted in ``dbmonitor_schedule_skipped_ticks``) when the previous run
+    of the same task is still busy, or when the scheduler fell more than a
+    whole interval behind. Dispatch delays are observed in
+    ``dbmonitor_schedule_lag_seconds``. ``stop()`` wakes the loop at once.
+    """
+
+    def __init__(self, max_workers: int = SCHEDULER_MAX_WORKERS, jitter: float = SCHEDULER_JITTER):
+        self.max_workers = max_workers
+        self.jitter = jitter
+        self.thread: Optional[threading.Thread] = None
+        self._tasks: Dict[Hashable, _Task] = {}
+        self._heap: List = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def schedule(self, key: Hashable, fn: Callable[[], Any], interval: float, group: str = 'default',
+                 jitter: Optional[float] = None, delay: float = 0.0) -> None:
+        """Run ``fn`` every ``interval`` seconds; updates the task if ``key`` is scheduled already.
+
+        A new task first runs after ``delay`` seconds.
+        """
+        if interval <= 0:
+            raise ValueError('interval must be positive')
+        jitter = self.jitter if jitter is None else jitter
+        now = time.monotonic()
+        with self._lock:
+            task = self._tasks.get(key)
+            if task is None:
+                task = self._tasks[key] = _Task(key, fn, interval, jitter, group)
+                task.base = now + delay
+                self._push(task, task.base)
+            else:
+                task.fn = fn
+                task.group = group
+                if task.interval == interval and task.jitter == jitter:
+                    return
+                task.interval = interval
+                task.jitter = jitter
+                # Do not wait out the rest of a longer old interval
+                task.base = min(task.base, now + interval)
+                self._push(task, self._due(task))
+        self._wake.set()
+
+    def unschedule(self, key: Hashable) -> None:
+        with self._lock:
+            self._tasks.pop(key, None)
+
+    def retain(self, keys: Iterable[Hashable]) -> None:
+        """Drop every task whose key is not in ``keys``"""
+        keep = set(keys)
+        with self._lock:
+            for key in [k for k in self._tasks if k not in keep]:
+                del self._tasks[key]
+
+    def keys(self) -> List[Hashable]:
+        with self._lock:
+            return list(self._tasks)
+
+    def interval(self, key: Hashable) -> Optional[float]:
+        with self._lock:
+            task = self._tasks.get(key)
+            return task.interval if task is not None else None
+
+    def run_pending(self, now: Optional[float] = None) -> int:
+        """Dispatch every task that is due; returns how many were started"""
+        now = time.monotonic() if now is None else now
+        dispatched = 0
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                due, entry, key = heapq.heappop(self._heap)
+                task = self._tasks.get(key)
+                if task is None or task.entry != entry:
+                    continue
+                schedule_lag.labels(group=task.group).observe(max(0.0, now - due))
+
+                task.base += task.interval
+                if task.base <= now:
+                    # Runs that can no longer happen on time are dropped, not
+                    # bunched up behind each other
+                    missed = int((now - task.base) // task.interval) + 1
+                    task.base += missed * task.interval
+                    skipped_ticks.labels(group=task.group, reason='late').inc(missed)
+                self._push(task, self._due(task))
+
+                if task.future is not None and not task.future.done():
+                    skipped_ticks.labels(group=task.group, reason='overrun').inc()
+                    continue
+                task.future = self._pool().submit(self._execute, task, self._stopping)
+                dispatched += 1
+        return dispatched
+
+    def start(self) -> None:
+        if self.running:
+            return
+        # A new event per start: runs queued before the last stop keep the
+        # old, set one and return without running
+        self._stopping = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(self._stopping,), name='scheduler', daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop dispatching and wait up to ``timeout`` seconds for runs in progress"""
+        self._stopping.set()
+        self._wake.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        with self._lock:
+            executor, self._executor = self._executor, None
+            in_flight = [task.future for task in self._tasks.values() if task.future is not None]
+        if executor is not None:
+            # Runs that were queued but not started return without running
+            executor.shutdown(wait=False)
+            wait(in_flight, timeout=timeout)
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def _run(self, stopping: threading.Event) -> None:
+        while not stopping.is_set():
+            self._wake.clear()
+            try:
+                self.run_pending()
+            except Exception as e:
+                print(f"Error dispatching scheduled tasks: {str(e)}")
+            self._wake.wait(self._next_wait())
+
+    def _next_wait(self) -> Optional[float]:
+        with self._lock:
+            if not self._heap:
+                return None  # sleep until a task is scheduled
+            return max(0.0, self._heap[0][0] - time.monotonic())
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='scheduler')
+        return self._executor
+
+    def _push(self, task: _Task, due: float) -> None:
+        task.entry = next(self._seq)
+        heapq.heappush(self._heap, (due, task.entry, task.key))
+
+    @staticmethod
+    def _due(task: _Task) -> float:
+        return task.base + random.uniform(0.0, task.jitter * task.interval)
+
+    @staticmethod
+    def _execute(task: _Task, stopping: threading.Event) -> None:
+        if stopping.is_set():
+            return
+        try:
+            task.fn()
+        except Exception as e:
+            print(f"Error running scheduled task {task.key}: {str(e)}")
@@ -0,0 +1,170 @@
+import bisect
+import hashlib
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import timedelta
+from typing import Iterable, List, Optional
+
+from metric_store import utcnow
+
+# Seconds a collector's lease lasts without a heartbeat; its servers move to
+# the remaining collectors after this (plus at most one heartbeat interval)
+COLLECTOR_LEASE_TTL = float(os.getenv('COLLECTOR_LEASE_TTL', 30))
+
+# Seconds between lease renewals, which also pick up membership changes
+COLLECTOR_HEARTBEAT_INTERVAL = float(os.getenv('COLLECTOR_HEARTBEAT_INTERVAL', 10))
+
+# Seconds a process relies on its last check of whether any collector runs
+COLLECTOR_CHECK_INTERVAL = float(os.getenv('COLLECTOR_CHECK_INTERVAL', 5))
+
+# Points per collector on the hash ring; more points spread servers more evenly
+HASH_RING_REPLICAS = 64
+
+# Ring key of the history rollups and pruning, which exactly one collector runs
+MAINTENANCE_KEY = 'maintenance'
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """Consistent hash ring mapping keys (server ids) to members (collectors).
+
+    Adding a member only moves the keys it takes over; removing one only
+    moves the keys it had.
+    """
+
+    def __init__(self, members: Iterable[str], replicas: int = HASH_RING_REPLICAS):
+        self.members = sorted(set(members))
+        points = sorted((_hash(f'{member}#{i}'), member) for member in self.members for i in range(replicas))
+        self._hashes = [point for point, _ in points]
+        self._owners = [member for _, member in points]
+
+    def owner(self, key) -> Optional[str]:
+        if not self._hashes:
+            return None
+        index = bisect.bisect(self._hashes, _hash(str(key))) % len(self._hashes)
+        return self._owners[index]
+
+
+class ShardCoordinator:
+    """Splits the monitored servers between collectors through lease rows.
+
+    Every collector keeps a row in the metadata database alive with
+    heartbeats. The collectors whose lease has not expired form a
+    consistent hash ring, and each one polls the servers the ring assigns to
+    it. All collectors read the same rows, so they agree on the assignment
+    without talking to each other. Leases are compared against each host's
+    UTC clock, so collector hosts need synchronised clocks.
+    """
+
+    def __init__(self, app, db, model, collector_id: Optional[str] = None, ttl: float = COLLECTOR_LEASE_TTL,
+                 heartbeat_interval: float = COLLECTOR_HEARTBEAT_INTERVAL, replicas: int = HASH_RING_REPLICAS):
+        if heartbeat_interval >= ttl:
+            raise ValueError('heartbeat_interval must be shorter than the lease ttl')
+        self.app = app
+        self.db = db
+        self.model = model
+        self.collector_id = collector_id or f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.ttl = ttl
+        self.heartbeat_interval = heartbeat_interval
+        self.replicas = replicas
+        # Owns nothing until its first heartbeat has registered it
+        self._ring = HashRing([], replicas)
+        self._lock = threading.Lock()
+
+    def heartbeat(self) -> bool:
+        """Renew this collector's lease and re-read the members; True if they changed"""
+        now = utcnow()
+        expires_at = now + timedelta(seconds=self.ttl)
+        # Its own app context, so a heartbeat never commits a caller's session
+        with self.app.app_context():
+            session = self.db.session
+            try:
+                renewed = session.query(self.model).filter_by(collector_id=self.collector_id).update(
+                    {'heartbeat_at': now, 'expires_at': expires_at}, synchronize_session=False)
+                if not renewed:
+                    session.add(self.model(collector_id=self.collector_id, hostname=socket.gethostname(),
+                                           pid=os.getpid(), started_at=now, heartbeat_at=now,
+                                           expires_at=expires_at))
+                # Whoever notices first removes the leases of dead collectors
+                session.query(self.model).filter(self.model.expires_at <= now).delete(synchronize_session=False)
+                members = sorted(collector_id for (collector_id,) in session.query(self.model.collector_id))
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+
+        with self._lock:
+            changed = members != self._ring.members
+            if changed:
+                self._ring = HashRing(members, self.replicas)
+        return changed
+
+    def release(self) -> None:
+        """Give up the lease so the other collectors take over right away"""
+        with self.app.app_context():
+            session = self.db.session
+            try:
+                session.query(self.model).filter_by(collector_id=self.collector_id).delete(synchronize_session=False)
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+        with self._lock:
+            self._ring = HashRing([], self.replicas)
+
+    def owns(self, server_id) -> bool:
+        with self._lock:
+            return self._ring.owner(server_id) == self.collector_id
+
+    def owns_maintenance(self) -> bool:
+        """Whether this collector runs the jobs shared by all collectors"""
+        return self.owns(MAINTENANCE_KEY)
+
+    def members(self) -> List[str]:
+        with self._lock:
+            return list(self._ring.members)
+
+
+class CollectorWatch:
+    """Whether any collector holds a live lease, re-read at most every ``interval`` seconds.
+
+    Processes that serve the web app use it to tell whether the servers are
+    polled elsewhere, in which case they read the shared snapshots instead
+    of polling.
+    """
+
+    def __init__(self, app, db, model, interval: float = COLLECTOR_CHECK_INTERVAL):
+        self.app = app
+        self.db = db
+        self.model = model
+        self.interval = interval
+        self._active = False
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def active(self) -> bool:
+        with self._lock:
+            if self._checked_at is not None and time.monotonic() - self._checked_at < self.interval:
+                return self._active
+        return self.refresh()
+
+    def refresh(self) -> bool:
+        """Re-read the leases now"""
+        try:
+            with self.app.app_context():
+                active = self.db.session.query(self.model.collector_id).filter(
+                    self.model.expires_at > utcnow()).first() is not None
+        except Exception as e:
+            print(f"Error reading collector leases: {str(e)}")
+            with self._lock:
+                return self._active
+        with self._lock:
+            self._active = active
+            self._checked_at = time.monotonic()
+        return active
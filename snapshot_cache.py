@@ -0,0 +1,199 @@
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from collections import OrderedDict
+from typing import Dict, Any, Callable, Iterable, List, Optional, Union
+
+# Cached metrics of servers without their own poll interval are refreshed
+# on demand when older than this many seconds
+DEFAULT_MAX_AGE = float(os.getenv('METRICS_MAX_AGE', 60))
+
+# Freshest snapshot a request may ask for with ?max_age=, in seconds
+MIN_MAX_AGE = float(os.getenv('METRICS_MIN_AGE', 5))
+
+
+class Subscription:
+    """Server ids with a new snapshot that a stream subscriber has not seen yet.
+
+    Repeated updates of the same server before the subscriber reads them are
+    coalesced, so a slow client costs at most one pending entry per server.
+    """
+
+    def __init__(self, server_ids: Optional[Iterable] = None):
+        self.server_ids = set(server_ids) if server_ids is not None else None
+        self._pending: OrderedDict = OrderedDict()
+        self._cond = threading.Condition()
+
+    def wants(self, server_id) -> bool:
+        return self.server_ids is None or server_id in self.server_ids
+
+    def notify(self, server_id) -> None:
+        with self._cond:
+            self._pending[server_id] = True
+            self._pending.move_to_end(server_id)
+            self._cond.notify()
+
+    def get(self, timeout: float) -> List:
+        """Wait up to ``timeout`` seconds and return the updated server ids"""
+        with self._cond:
+            if not self._pending:
+                self._cond.wait(timeout)
+            updated = list(self._pending)
+            self._pending.clear()
+        return updated
+
+
+class SnapshotCache:
+    """Latest collection result per server, shared by the collector and the API.
+
+    MonitoringService writes every result it collects; the dashboard endpoints
+    read from here and, in a process without a running MonitoringService,
+    only go to the monitored server when the cached entry is older than the
+    ``max_age`` they accept.
+    """
+
+    def __init__(self):
+        self._entries: Dict[Any, Dict[str, Any]] = {}
+        self._inflight = set()
+        # MonitoringServices running in this process and writing here
+        self._collectors = set()
+        self._subscribers: List[Subscription] = []
+        self._cond = threading.Condition()
+
+    def put(self, server_id, result: Dict[str, Any], collected_at: Optional[float] = None) -> None:
+        entry = dict(result)
+        entry['collected_at'] = collected_at if collected_at is not None else time.time()
+        with self._cond:
+            current = self._entries.get(server_id)
+            if entry['status'] == 'open' and current is not None:
+                # The circuit breaker skipped the server, so nothing was
+                # collected: keep the last snapshot and its age, and only
+                # record why it is not being refreshed
+                entry = dict(current, status='open', error=entry['error'])
+            self._entries[server_id] = entry
+            subscribers = [sub for sub in self._subscribers if sub.wants(server_id)]
+        # One collection fans out to every interested stream
+        for subscription in subscribers:
+            subscription.notify(server_id)
+
+    def add_collector(self, collector) -> None:
+        with self._cond:
+            self._collectors.add(collector)
+
+    def remove_collector(self, collector) -> None:
+        with self._cond:
+            self._collectors.discard(collector)
+
+    def has_collector(self) -> bool:
+        """Whether a collector in this process keeps the entries current"""
+        with self._cond:
+            return bool(self._collectors)
+
+    def merge(self, entries: Dict[Any, Dict[str, Any]]) -> int:
+        """Put the entries (with ``collected_at`` in epoch seconds) newer than the cached ones"""
+        merged = 0
+        for server_id, entry in entries.items():
+            with self._cond:
+                current = self._entries.get(server_id)
+                if current is not None and current['collected_at'] >= entry['collected_at']:
+                    continue
+            result = {key: value for key, value in entry.items() if key != 'collected_at'}
+            self.put(server_id, result, entry['collected_at'])
+            merged += 1
+        return merged
+
+    def subscribe(self, server_ids: Optional[Iterable] = None) -> Subscription:
+        """Register for notifications about new snapshots (all servers if None)"""
+        subscription = Subscription(server_ids)
+        with self._cond:
+            self._subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._cond:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+
+    def subscriber_count(self) -> int:
+        with self._cond:
+            return len(self._subscribers)
+
+    def get(self, server_id) -> Optional[Dict[str, Any]]:
+        """Return a copy of the cached entry with its age, or None"""
+        with self._cond:
+            entry = self._entries.get(server_id)
+        if entry is None:
+            return None
+        entry = dict(entry)
+        collected_at = entry['collected_at']
+        entry['age_seconds'] = round(max(0.0, time.time() - collected_at), 3)
+        entry['collected_at'] = datetime.fromtimestamp(collected_at, timezone.utc).isoformat()
+        return entry
+
+    def age(self, server_id) -> Optional[float]:
+        with self._cond:
+            entry = self._entries.get(server_id)
+        return None if entry is None else time.time() - entry['collected_at']
+
+    def discard(self, server_id) -> None:
+        with self._cond:
+            self._entries.pop(server_id, None)
+
+    def retain(self, server_ids: Iterable) -> None:
+        """Forget servers that no longer exist"""
+        keep = set(server_ids)
+        with self._cond:
+            for server_id in [k for k in self._entries if k not in keep]:
+                del self._entries[server_id]
+
+    def clear(self) -> None:
+        with self._cond:
+            self._entries.clear()
+
+    def refresh(self, targets: Dict[Any, Dict[str, Any]], max_age: Union[float, Dict[Any, float]],
+                collect: Callable[[Dict[Any, Dict[str, Any]]], Dict[Any, Dict[str, Any]]],
+                wait_timeout: float = 30.0) -> Dict[Any, Dict[str, Any]]:
+        """Re-collect the targets whose cached entry is missing or older than max_age.
+
+        ``max_age`` is either one age for all targets or one per server id.
+        ``collect`` receives the subset of ``targets`` to refresh and returns
+        results keyed by server id. When another request is already refreshing
+        a server, this call waits for that refresh instead of starting its own.
+        Returns only the results collected by this call.
+        """
+        ages = max_age if isinstance(max_age, dict) else dict.fromkeys(targets, max_age)
+        now = time.time()
+        with self._cond:
+            stale = [server_id for server_id in targets
+                     if server_id not in self._entries
+                     or now - self._entries[server_id]['collected_at'] > ages[server_id]]
+            mine = {server_id: targets[server_id] for server_id in stale if server_id not in self._inflight}
+            others = [server_id for server_id in stale if server_id not in mine]
+            self._inflight.update(mine)
+
+        results = {}
+        try:
+            if mine:
+                results = collect(mine)
+                collected_at = time.time()
+                for server_id, result in results.items():
+                    self.put(server_id, result, collected_at)
+        finally:
+            with self._cond:
+                self._inflight.difference_update(mine)
+                self._cond.notify_all()
+
+        if others:
+            deadline = time.monotonic() + wait_timeout
+            with self._cond:
+                while any(server_id in self._inflight for server_id in others):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+        return results
+
+
+snapshots = SnapshotCache()
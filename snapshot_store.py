@@ -0,0 +1,114 @@
+import json
+import os
+import threading
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import sqlalchemy as sa
+
+# Rows collected up to this many seconds before the newest one seen are
+# read again, so a collection committed late is not skipped
+SNAPSHOT_SYNC_MARGIN = float(os.getenv('SNAPSHOT_SYNC_MARGIN', 15))
+
+
+class SnapshotStore:
+    """Latest collection result per server in the metadata database.
+
+    The process that collects queues every result with ``add`` and writes
+    the queue in one transaction per ``flush``, so SQLite sees one writer
+    per flush rather than one per server poll. The others copy new rows
+    into their SnapshotCache with ``sync_into``, reading only rows
+    collected since their previous sync.
+    """
+
+    def __init__(self, app, db, model, margin: float = SNAPSHOT_SYNC_MARGIN):
+        self.app = app
+        self.db = db
+        self.model = model
+        self.margin = margin
+        self._watermark = 0.0
+        # Result and collection time waiting for the next flush, by server id
+        self._pending: Dict[Any, Tuple[Dict[str, Any], float]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _row(server_id, result: Dict[str, Any], collected_at: float) -> Dict[str, Any]:
+        return {
+            'server_id': server_id,
+            'status': result['status'],
+            'error': result['error'],
+            'metrics': json.dumps(result['metrics']) if result['metrics'] is not None else None,
+            'queries': json.dumps(result['queries']),
+            'duration_seconds': result.get('duration_seconds'),
+            'collected_at': collected_at
+        }
+
+    def add(self, results: Dict[Any, Dict[str, Any]], collected_at: float) -> None:
+        """Queue collect_many results collected at ``collected_at`` (epoch seconds) for the next ``flush``.
+
+        A newer result replaces a queued one of the same server.
+        """
+        with self._lock:
+            for server_id, result in results.items():
+                self._pending[server_id] = (result, collected_at)
+
+    def flush(self) -> int:
+        """Store every queued result in one transaction; returns how many"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        # Serialised here, off the collection path
+        rows = [self._row(server_id, result, collected_at) for server_id, (result, collected_at) in pending.items()]
+        if not rows:
+            return 0
+        with self.app.app_context():
+            session = self.db.session
+            try:
+                existing = {server_id for (server_id,) in session.query(self.model.server_id).filter(
+                    self.model.server_id.in_([row['server_id'] for row in rows]))}
+                updates = [row for row in rows if row['server_id'] in existing]
+                inserts = [row for row in rows if row['server_id'] not in existing]
+                if updates:
+                    session.execute(sa.update(self.model), updates)
+                if inserts:
+                    session.execute(sa.insert(self.model), inserts)
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+        return len(rows)
+
+    def retain(self, server_ids: Iterable) -> None:
+        """Drop queued results of servers this process no longer collects"""
+        keep = set(server_ids)
+        with self._lock:
+            for server_id in [k for k in self._pending if k not in keep]:
+                del self._pending[server_id]
+
+    def load(self, server_ids: Optional[Iterable] = None, since: Optional[float] = None) -> Dict[Any, Dict[str, Any]]:
+        """Stored results by server id, optionally only those collected after ``since``"""
+        with self.app.app_context():
+            query = self.db.session.query(self.model)
+            if server_ids is not None:
+                query = query.filter(self.model.server_id.in_(list(server_ids)))
+            if since is not None:
+                query = query.filter(self.model.collected_at > since)
+            return {row.server_id: {
+                'status': row.status,
+                'error': row.error,
+                'metrics': json.loads(row.metrics) if row.metrics is not None else None,
+                'queries': json.loads(row.queries) if row.queries else [],
+                'duration_seconds': row.duration_seconds,
+                'collected_at': row.collected_at
+            } for row in query}
+
+    def sync_into(self, cache) -> int:
+        """Copy rows collected since the previous sync into ``cache``; returns how many were newer"""
+        with self._lock:
+            since = self._watermark - self.margin if self._watermark else None
+            entries = self.load(since=since)
+            if entries:
+                self._watermark = max(self._watermark, max(entry['collected_at'] for entry in entries.values()))
+        return cache.merge(entries)
+
+    def discard(self, server_id) -> None:
+        """Remove a deleted server's row; runs in the caller's session"""
+        self.model.query.filter_by(server_id=server_id).delete(synchronize_session=False)
@@ -0,0 +1,189 @@
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Any, Iterable, List, Optional
+
+from metric_store import utcnow
+from query_fingerprint import fingerprint_query
+
+# Statements stored per server and snapshot, by time spent in the interval
+STATEMENT_TOP_N = int(os.getenv('STATEMENT_TOP_N', 200))
+
+# Hours of per-interval statement statistics kept
+STATEMENT_RETENTION_HOURS = float(os.getenv('STATEMENT_RETENTION_HOURS', 24))
+
+ORDERINGS = ('total_time', 'calls', 'mean_time', 'rows')
+
+
+class StatementDiffer:
+    """Per-interval statement statistics from consecutive cumulative snapshots.
+
+    Keeps the previous snapshot per server, as tuples of (calls, time, rows)
+    keyed by statement. A statement whose counters went backwards was evicted
+    and re-added, so its current values are the interval delta. A changed
+    reset epoch, or most statements going backwards at once, means the
+    statistics were reset and every current value is a delta.
+    """
+
+    def __init__(self):
+        self._previous: Dict[Any, tuple] = {}
+        self._lock = threading.Lock()
+
+    def diff(self, key, snapshot: Dict[str, Any], timestamp: float) -> Optional[Dict[str, Any]]:
+        """Return ``{'elapsed', 'reset', 'changes'}``, or None for the first snapshot"""
+        statements = snapshot['statements']
+        current = {name: (s['calls'], s['total_time_ms'], s['rows']) for name, s in statements.items()}
+        epoch = snapshot.get('epoch')
+        with self._lock:
+            previous = self._previous.get(key)
+            if previous is not None and timestamp <= previous[0]:
+                return None
+            self._previous[key] = (timestamp, epoch, current)
+        if previous is None:
+            return None
+
+        previous_time, previous_epoch, before = previous
+        shared = [name for name in current if name in before]
+        went_back = sum(1 for name in shared if current[name][0] < before[name][0])
+        reset = ((epoch is not None and previous_epoch is not None and epoch != previous_epoch)
+                 or (shared and went_back * 2 > len(shared)))
+
+        changes = []
+        for name, (calls, total_time, rows) in current.items():
+            old = None if reset else before.get(name)
+            if old is not None and calls >= old[0]:
+                calls, total_time, rows = calls - old[0], total_time - old[1], rows - old[2]
+            if calls <= 0:
+                continue
+            statement = statements[name]
+            changes.append({
+                'statement_key': name,
+                'query': statement['query'],
+                'database': statement['database'],
+                'calls': calls,
+                'total_time_ms': max(0.0, total_time),
+                'rows': max(0, rows)
+            })
+        return {'elapsed': timestamp - previous_time, 'reset': bool(reset), 'changes': changes}
+
+    def forget(self, key) -> None:
+        with self._lock:
+            self._previous.pop(key, None)
+
+    def retain(self, keys: Iterable) -> None:
+        keep = set(keys)
+        with self._lock:
+            for key in [k for k in self._previous if k not in keep]:
+                del self._previous[key]
+
+
+class StatementStore:
+    """Writer and reader for per-interval statement statistics.
+
+    Only statements that ran during an interval are stored, capped at
+    ``top_n`` per snapshot, and statement texts are stored once per server.
+    """
+
+    def __init__(self, db, sample_model, text_model, top_n: int = STATEMENT_TOP_N,
+                 retention_hours: float = STATEMENT_RETENTION_HOURS):
+        self.db = db
+        self.sample_model = sample_model
+        self.text_model = text_model
+        self.top_n = top_n
+        self.retention_hours = retention_hours
+
+    def record(self, server_id, changes: List[Dict[str, Any]], elapsed: float,
+               collected_at: Optional[datetime] = None) -> int:
+        """Store the busiest changed statements of one interval; requires an app context"""
+        if not changes:
+            return 0
+        collected_at = collected_at or utcnow()
+        changes = sorted(changes, key=lambda c: c['total_time_ms'], reverse=True)[:self.top_n]
+        keys = [change['statement_key'] for change in changes]
+
+        known = {key for (key,) in self.db.session.query(self.text_model.statement_key).filter(
+            self.text_model.server_id == server_id, self.text_model.statement_key.in_(keys))}
+        try:
+            self.db.session.bulk_insert_mappings(self.text_model, [{
+                'server_id': server_id,
+                'statement_key': change['statement_key'],
+                'fingerprint': fingerprint_query(change['query']),
+                'database_name': change['database'],
+                'query_text': change['query'] or '',
+                'first_seen': collected_at
+            } for change in changes if change['statement_key'] not in known])
+            self.db.session.bulk_insert_mappings(self.sample_model, [{
+                'server_id': server_id,
+                'statement_key': change['statement_key'],
+                'collected_at': collected_at,
+                'interval_seconds': elapsed,
+                'calls': change['calls'],
+                'total_time_ms': change['total_time_ms'],
+                'row_count': change['rows']
+            } for change in changes])
+            self.db.session.commit()
+        except Exception:
+            self.db.session.rollback()
+            raise
+        return len(changes)
+
+    def top(self, since: datetime, server_id=None, order: str = 'total_time', limit: int = 20) -> List[Dict[str, Any]]:
+        """Statements with the most activity since ``since``, summed over their intervals"""
+        order = order if order in ORDERINGS else 'total_time'
+        sample, text = self.sample_model, self.text_model
+        calls = self.db.func.sum(sample.calls)
+        total_time = self.db.func.sum(sample.total_time_ms)
+        rows = self.db.func.sum(sample.row_count)
+        ordering = {
+            'total_time': total_time,
+            'calls': calls,
+            'rows': rows,
+            'mean_time': total_time / self.db.func.nullif(calls, 0)
+        }[order]
+
+        query = self.db.session.query(
+            sample.server_id, sample.statement_key,
+            calls.label('calls'), total_time.label('total_time_ms'), rows.label('row_count')
+        ).filter(sample.collected_at >= since)
+        if server_id is not None:
+            query = query.filter(sample.server_id == server_id)
+        grouped = query.group_by(sample.server_id, sample.statement_key).order_by(
+            ordering.desc()).limit(limit).subquery()
+
+        results = self.db.session.query(
+            grouped, text.query_text, text.database_name, text.fingerprint
+        ).outerjoin(text, (text.server_id == grouped.c.server_id)
+                    & (text.statement_key == grouped.c.statement_key)).all()
+
+        statements = [{
+            'server_id': row.server_id,
+            'statement_key': row.statement_key,
+            'query': row.query_text,
+            'database': row.database_name,
+            'fingerprint': row.fingerprint,
+            'calls': int(row.calls or 0),
+            'total_time_ms': float(row.total_time_ms or 0),
+            'mean_time_ms': float(row.total_time_ms or 0) / row.calls if row.calls else None,
+            'rows': int(row.row_count or 0)
+        } for row in results]
+        # The join does not keep the subquery's order
+        key = {'total_time': 'total_time_ms', 'mean_time': 'mean_time_ms'}.get(order, order)
+        statements.sort(key=lambda s: s[key] or 0, reverse=True)
+        return statements
+
+    def prune(self, now: Optional[datetime] = None) -> None:
+        """Delete intervals past retention and texts no interval refers to"""
+        now = now or utcnow()
+        sample, text = self.sample_model, self.text_model
+        sample.query.filter(
+            sample.collected_at < now - timedelta(hours=self.retention_hours)
+        ).delete(synchronize_session=False)
+        referenced = self.db.session.query(sample.id).filter(
+            sample.server_id == text.server_id, sample.statement_key == text.statement_key).exists()
+        text.query.filter(~referenced).delete(synchronize_session=False)
+        self.db.session.commit()
+
+    def purge_server(self, server_id) -> None:
+        """Remove all statement statistics of a server (called before the server is deleted)"""
+        self.sample_model.query.filter_by(server_id=server_id).delete(synchronize_session=False)
+        self.text_model.query.filter_by(server_id=server_id).delete(synchronize_session=False)
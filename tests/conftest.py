@@ -0,0 +1,31 @@
+import os
+import shutil
+import tempfile
+
+# app.py binds its engine when it is imported, so the tests' database has to
+# be chosen before that; a throwaway file keeps the developer's database out
+# of reach of the fixtures' drop_all()
+_database_dir = tempfile.mkdtemp(prefix='dbmonitor-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_database_dir, 'dbmonitor.db')
+
+import pytest
+from app import app as flask_app, db
+from query_search import drop_search_index
+
+
+@pytest.fixture
+def app():
+    flask_app.config['TESTING'] = True
+    flask_app.config['WTF_CSRF_ENABLED'] = False
+
+    with flask_app.app_context():
+        db.create_all()
+        yield flask_app
+        db.session.remove()
+        with db.engine.begin() as connection:
+            drop_search_index(connection)
+        db.drop_all()
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(_database_dir, ignore_errors=True)
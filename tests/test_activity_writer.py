@@ -0,0 +1,78 @@
+import time
+
+import pytest
+from app import db, ActivityLog, User
+from activity_writer import ActivityWriter
+
+
+@pytest.fixture
+def user(app):
+    user = User(username='test_user', email='test@example.com', role='user')
+    user.set_password('test_password')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def record(user, action, **values):
+    return dict(dict(user_id=user.id, access_ip='127.0.0.1', menu_accessed=action, user_agent='test'), **values)
+
+
+def logged_actions():
+    db.session.expire_all()
+    return sorted(log.menu_accessed for log in ActivityLog.query)
+
+
+def test_flush_writes_queued_records(app, user):
+    writer = ActivityWriter(app, db, ActivityLog, batch_size=100, flush_interval=60)
+    for i in range(3):
+        assert writer.submit(record(user, f'action {i}'))
+    assert writer.pending() == 3
+    assert logged_actions() == []
+
+    assert writer.flush() == 3
+    assert logged_actions() == ['action 0', 'action 1', 'action 2']
+    writer.close()
+
+
+def test_full_batch_is_written_without_waiting_for_interval(app, user):
+    writer = ActivityWriter(app, db, ActivityLog, batch_size=5, flush_interval=60)
+    for i in range(5):
+        writer.submit(record(user, f'action {i}'))
+
+    deadline = time.monotonic() + 5
+    while writer.pending() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    writer.flush()
+    assert len(logged_actions()) == 5
+    writer.close()
+
+
+def test_full_queue_drops_after_timeout(app, user):
+    writer = ActivityWriter(app, db, ActivityLog, batch_size=100, flush_interval=60,
+                            max_queue=2, enqueue_timeout=0.01)
+    # Hold the writer back so the queue stays full
+    with writer._write_lock:
+        assert writer.submit(record(user, 'first'))
+        assert writer.submit(record(user, 'second'))
+        assert not writer.submit(record(user, 'third'))
+    writer.close()
+    assert logged_actions() == ['first', 'second']
+
+
+def test_bad_record_does_not_lose_its_batch(app, user):
+    writer = ActivityWriter(app, db, ActivityLog, batch_size=100, flush_interval=60)
+    writer.submit(record(user, 'before'))
+    writer.submit(record(user, 'broken', access_ip=None))
+    writer.submit(record(user, 'after'))
+
+    assert writer.flush() == 2
+    assert logged_actions() == ['after', 'before']
+    writer.close()
+
+
+def test_close_writes_remaining_records(app, user):
+    writer = ActivityWriter(app, db, ActivityLog, batch_size=100, flush_interval=60)
+    writer.submit(record(user, 'last'))
+    writer.close()
+    assert logged_actions() == ['last']
@@ -1,16 +1,20 @@
 import unittest
-from app import app, db, User, DatabaseServer
+from app import app, db, User, DatabaseServer, QueryHistory
 from flask import url_for
 import json
 import os
+import time
 from unittest.mock import patch
+from connection_pool import pool as connection_pool
+from snapshot_cache import snapshots
 
 class TestApp(unittest.TestCase):
     def setUp(self):
         app.config['TESTING'] = True
-        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
         app.config['WTF_CSRF_ENABLED'] = False
         self.client = app.test_client()
+        connection_pool.close_all()
+        snapshots.clear()
         
         with app.app_context():
             db.create_all()
@@ -97,6 +101,125 @@ class TestApp(unittest.TestCase):
         self.assertIn('disk_usage', metrics)
         self.assertIn('active_connections', metrics)
 
+    def test_metrics_stream_sends_snapshots(self):
+        self.login()
+        with app.app_context():
+            server = DatabaseServer.query.first()
+            server_id = server.id
+        snapshots.put(server_id, {'status': 'connected', 'error': None,
+                                  'metrics': {'active_connections': 3}, 'queries': []})
+
+        response = self.client.get(f'/api/metrics/stream?db_id={server_id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+
+        chunks = response.iter_encoded()
+        self.assertTrue(next(chunks).startswith(b'retry:'))
+        event = next(chunks).decode()
+        response.close()
+
+        self.assertTrue(event.startswith('event: metrics\n'))
+        payload = json.loads(event.split('data: ', 1)[1])
+        self.assertEqual(payload['id'], server_id)
+        self.assertEqual(payload['metrics']['active_connections'], 3)
+        self.assertEqual(snapshots.subscriber_count(), 0)
+
+    def test_api_metrics_refreshes_once_per_poll_interval(self):
+        self.login()
+        with app.app_context():
+            server = DatabaseServer.query.first()
+            server.poll_interval = 300
+            db.session.commit()
+            server_id = server.id
+        snapshots.put(server_id, {'status': 'connected', 'error': None,
+                                  'metrics': {'active_connections': 4}, 'queries': []}, time.time() - 120)
+
+        with patch('app.collect_many', side_effect=AssertionError('polled within the poll interval')):
+            response = self.client.get(f'/api/metrics?db_id={server_id}')
+        self.assertEqual(json.loads(response.data)['servers'][0]['metrics'], {'active_connections': 4})
+
+    def test_api_metrics_honours_a_lower_max_age_down_to_the_floor(self):
+        self.login()
+        with app.app_context():
+            server_id = DatabaseServer.query.first().id
+        fresh = {'status': 'connected', 'error': None, 'metrics': {'active_connections': 5}, 'queries': []}
+        snapshots.put(server_id, {'status': 'connected', 'error': None,
+                                  'metrics': {'active_connections': 4}, 'queries': []}, time.time() - 30)
+
+        with patch('app.collect_many', return_value={server_id: fresh}) as collect:
+            response = self.client.get(f'/api/metrics?db_id={server_id}&max_age=10')
+        collect.assert_called_once()
+        self.assertEqual(json.loads(response.data)['servers'][0]['metrics'], {'active_connections': 5})
+
+        # Just collected; max_age=0 is raised to METRICS_MIN_AGE
+        with patch('app.collect_many', side_effect=AssertionError('polled below the floor')):
+            response = self.client.get(f'/api/metrics?db_id={server_id}&max_age=0')
+        self.assertEqual(json.loads(response.data)['servers'][0]['metrics'], {'active_connections': 5})
+
+    def test_api_metrics_never_polls_next_to_a_running_collector(self):
+        self.login()
+        with app.app_context():
+            server_id = DatabaseServer.query.first().id
+        snapshots.put(server_id, {'status': 'connected', 'error': None,
+                                  'metrics': {'active_connections': 4}, 'queries': []}, time.time() - 3600)
+
+        collector = object()
+        snapshots.add_collector(collector)
+        try:
+            with patch('app.collect_many', side_effect=AssertionError('polled next to a collector')):
+                response = self.client.get(f'/api/metrics?db_id={server_id}')
+        finally:
+            snapshots.remove_collector(collector)
+        self.assertEqual(json.loads(response.data)['servers'][0]['metrics'], {'active_connections': 4})
+
+    def test_api_metrics_bounds_active_queries(self):
+        self.login()
+        with app.app_context():
+            server_id = DatabaseServer.query.first().id
+        queries = [{'pid': pid, 'query': 'SELECT ' + 'x' * 100, 'query_truncated': False} for pid in (1, 2, 3)]
+        snapshots.put(server_id, {'status': 'connected', 'error': None,
+                                  'metrics': {'active_connections': 3}, 'queries': queries})
+
+        response = self.client.get(f'/api/metrics?db_id={server_id}&max_age=3600&query_limit=2&query_chars=10')
+        served = json.loads(response.data)['servers'][0]['queries']
+
+        self.assertEqual([query['pid'] for query in served], [1, 2])
+        self.assertEqual(served[0]['query'], 'SELECT xxx')
+        self.assertTrue(served[0]['query_truncated'])
+        # The cached snapshot keeps the texts as collected
+        self.assertEqual(len(snapshots.get(server_id)['queries'][0]['query']), 107)
+
+    def test_server_query_text(self):
+        self.login()
+        with app.app_context():
+            server_id = DatabaseServer.query.first().id
+
+        with patch('db_monitor.DatabaseMonitor.connect'), \
+                patch('db_monitor.DatabaseMonitor.get_query_text', return_value='SELECT 1') as get_text:
+            response = self.client.get(f'/api/server/{server_id}/queries/42')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(json.loads(response.data)['query'], 'SELECT 1')
+            get_text.assert_called_once_with(42)
+
+            get_text.return_value = None
+            response = self.client.get(f'/api/server/{server_id}/queries/43')
+            self.assertEqual(response.status_code, 404)
+
+    def test_query_history_groups_by_fingerprint(self):
+        self.login()
+        with app.app_context():
+            server = DatabaseServer.query.first()
+            user = User.query.filter_by(username='test_user').first()
+            for text in ('SELECT * FROM t WHERE id = 1', 'select * from t where id = 2', 'DELETE FROM t'):
+                db.session.add(QueryHistory(server_id=server.id, user_id=user.id, query_text=text))
+            db.session.commit()
+
+        response = self.client.get('/api/query_history/groups')
+        self.assertEqual(response.status_code, 200)
+        groups = json.loads(response.data)
+        self.assertEqual([group['count'] for group in groups], [2, 1])
+        self.assertEqual(groups[0]['query'], 'select * from t where id = ?')
+
     def test_server_metrics(self):
         # Login first
         self.login()
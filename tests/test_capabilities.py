@@ -0,0 +1,52 @@
+import unittest
+from unittest.mock import Mock
+
+from capabilities import CapabilityCache
+
+
+class TestCapabilityCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = CapabilityCache()
+        self.config = {'db_type': 'postgresql', 'host': 'db', 'port': 5432}
+        self.monitor = Mock(capabilities=None)
+        self.monitor.probe_capabilities.return_value = {
+            'version': '16.2', 'version_num': 160002, 'extensions': [], 'views': [], 'permissions': [],
+            'features': {'statements': False, 'statements_exec_time': False, 'statements_info': False}
+        }
+
+    def test_server_is_probed_once(self):
+        self.cache.attach(1, self.config, self.monitor)
+        self.cache.attach(1, self.config, self.monitor)
+
+        self.assertEqual(self.monitor.probe_capabilities.call_count, 1)
+        self.assertFalse(self.monitor.capabilities['features']['statements'])
+
+    def test_supports_is_unknown_until_probed(self):
+        self.assertIsNone(self.cache.supports(1, self.config, 'statements'))
+        self.cache.attach(1, self.config, self.monitor)
+        self.assertIs(self.cache.supports(1, self.config, 'statements'), False)
+
+    def test_changed_settings_probe_again(self):
+        self.cache.attach(1, self.config, self.monitor)
+        # Collection options such as the connect timeout do not count
+        self.cache.attach(1, dict(self.config, connect_timeout=3), self.monitor)
+        self.assertEqual(self.monitor.probe_capabilities.call_count, 1)
+
+        moved = dict(self.config, host='replica')
+        self.assertIsNone(self.cache.supports(1, moved, 'statements'))
+        self.cache.attach(1, moved, self.monitor)
+        self.assertEqual(self.monitor.probe_capabilities.call_count, 2)
+
+    def test_forget_and_retain(self):
+        for key in (1, 2, 3):
+            self.cache.attach(key, self.config, self.monitor)
+        self.cache.forget(1)
+        self.cache.retain([2])
+
+        self.assertIsNone(self.cache.get(1, self.config))
+        self.assertIsNotNone(self.cache.get(2, self.config))
+        self.assertIsNone(self.cache.get(3, self.config))
+
+
+if __name__ == '__main__':
+    unittest.main()
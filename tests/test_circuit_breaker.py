@@ -0,0 +1,109 @@
+import time
+import unittest
+from unittest.mock import patch
+
+from prometheus_client import REGISTRY, generate_latest
+
+from circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN, breaker
+from collector import collect_many
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker(threshold=3, base_delay=10, max_delay=40)
+
+    def trip(self, key=1):
+        for _ in range(3):
+            self.breaker.failure(key, 'refused')
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.failure(1, 'refused')
+        self.breaker.failure(1, 'refused')
+        self.breaker.success(1)
+        self.breaker.failure(1, 'refused')
+        self.assertEqual(self.breaker.state(1)['state'], CLOSED)
+
+        self.trip()
+        self.assertEqual(self.breaker.state(1)['state'], OPEN)
+        self.assertFalse(self.breaker.allow(1))
+        self.assertIn('last error: refused', self.breaker.rejection(1))
+
+    def test_half_open_lets_one_trial_through(self):
+        self.trip()
+        self.breaker._circuits[1].retry_at = time.monotonic()
+
+        self.assertTrue(self.breaker.allow(1))
+        self.assertEqual(self.breaker.state(1)['state'], HALF_OPEN)
+        self.assertFalse(self.breaker.allow(1))
+
+        self.breaker.success(1)
+        self.assertEqual(self.breaker.state(1)['state'], CLOSED)
+        self.assertTrue(self.breaker.allow(1))
+
+    def test_failed_trials_back_off_with_jitter(self):
+        self.trip()
+        delays = []
+        for _ in range(4):
+            retry_in = self.breaker._circuits[1].retry_at - time.monotonic()
+            delays.append(retry_in)
+            self.breaker._circuits[1].retry_at = time.monotonic()
+            self.assertTrue(self.breaker.allow(1))
+            self.breaker.failure(1, 'refused')
+
+        # Between half and all of 10, 20, 40, 40 seconds
+        for retry_in, delay in zip(delays, [10, 20, 40, 40]):
+            self.assertGreaterEqual(retry_in, delay * 0.5 - 0.1)
+            self.assertLessEqual(retry_in, delay)
+
+    def test_changed_settings_reset_the_circuit(self):
+        config = {'host': 'db1'}
+        for _ in range(3):
+            self.breaker.failure(1, 'refused', config)
+        self.assertFalse(self.breaker.allow(1, config))
+        # connect_timeout is not part of the settings
+        self.assertFalse(self.breaker.allow(1, dict(config, connect_timeout=5)))
+        self.assertTrue(self.breaker.allow(1, {'host': 'db2'}))
+
+    def test_retain_drops_series_of_removed_servers(self):
+        self.trip(9001)
+        self.assertFalse(self.breaker.allow(9001))
+        self.trip(9002)
+        exposition = generate_latest(REGISTRY).decode()
+        self.assertIn('dbmonitor_circuit_rejected_total{server_id="9001"}', exposition)
+
+        self.breaker.retain([9002])
+        exposition = generate_latest(REGISTRY).decode()
+        self.assertNotIn('server_id="9001"', exposition)
+        self.assertIn('server_id="9002"', exposition)
+
+        self.breaker.reset()
+        self.assertNotIn('server_id="9002"', generate_latest(REGISTRY).decode())
+
+
+class TestCollectorFailsFast(unittest.TestCase):
+    def setUp(self):
+        breaker.reset()
+
+    def tearDown(self):
+        breaker.reset()
+
+    def test_open_circuit_skips_collection(self):
+        calls = []
+
+        def refused(server_id, config):
+            calls.append(server_id)
+            raise ConnectionError('connection refused')
+
+        targets = {7: {'host': 'down'}}
+        with patch('collector.collect_server', side_effect=refused):
+            for _ in range(5):
+                results = collect_many(targets, timeout=1)
+
+        self.assertEqual(calls, [7, 7, 7])
+        self.assertEqual(results[7]['status'], 'open')
+        self.assertIn('connection refused', results[7]['error'])
+        self.assertEqual(breaker.state(7)['state'], OPEN)
+
+
+if __name__ == '__main__':
+    unittest.main()
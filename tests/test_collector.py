@@ -0,0 +1,116 @@
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock, patch
+
+from collector import capabilities, collect_many, collect_statements
+
+
+class TestCollectMany(unittest.TestCase):
+    def setUp(self):
+        self.targets = {
+            1: {'db_type': 'postgresql', 'host': 'fast'},
+            2: {'db_type': 'mysql', 'host': 'slow'},
+            3: {'db_type': 'postgresql', 'host': 'broken'}
+        }
+
+    def fake_collect(self, server_id, config):
+        if config['host'] == 'slow':
+            time.sleep(1)
+        if config['host'] == 'broken':
+            raise ConnectionError('connection refused')
+        return {'metrics': {'active_connections': server_id}, 'queries': []}
+
+    def test_statuses(self):
+        with patch('collector.collect_server', side_effect=self.fake_collect):
+            results = collect_many(self.targets, timeout=0.2)
+
+        self.assertEqual(results[1]['status'], 'connected')
+        self.assertEqual(results[1]['metrics'], {'active_connections': 1})
+        self.assertEqual(results[2]['status'], 'timeout')
+        self.assertIsNone(results[2]['metrics'])
+        self.assertEqual(results[3]['status'], 'error')
+        self.assertEqual(results[3]['error'], 'connection refused')
+
+    def test_slow_server_does_not_delay_response_past_deadline(self):
+        with patch('collector.collect_server', side_effect=self.fake_collect):
+            started = time.monotonic()
+            collect_many(self.targets, timeout=0.2)
+            elapsed = time.monotonic() - started
+
+        self.assertLess(elapsed, 0.8)
+
+    def test_servers_are_collected_concurrently(self):
+        def slow_collect(server_id, config):
+            time.sleep(0.2)
+            return {'metrics': {}, 'queries': []}
+
+        targets = {server_id: {'host': 'db'} for server_id in range(5)}
+        with patch('collector.collect_server', side_effect=slow_collect):
+            started = time.monotonic()
+            results = collect_many(targets, timeout=5)
+            elapsed = time.monotonic() - started
+
+        self.assertTrue(all(r['status'] == 'connected' for r in results.values()))
+        self.assertLess(elapsed, 0.6)
+
+    def test_connect_timeout_is_passed_to_driver(self):
+        seen = {}
+
+        def record(server_id, config):
+            seen[server_id] = config
+            return {'metrics': {}, 'queries': []}
+
+        with patch('collector.collect_server', side_effect=record):
+            collect_many({1: {'host': 'db'}}, timeout=2.5)
+
+        self.assertEqual(seen[1]['connect_timeout'], 3)
+        self.assertEqual(seen[1]['query_timeout'], 2.5)
+
+    def test_hung_server_does_not_block_the_next_fan_out(self):
+        release = threading.Event()
+
+        def collect(server_id, config):
+            if config['host'] == 'hung':
+                release.wait(5)
+            return {'metrics': {}, 'queries': []}
+
+        targets = {1: {'host': 'hung'}, 2: {'host': 'db'}, 3: {'host': 'db'}}
+        # Two workers: a hung server resubmitted every round would take both
+        executor = ThreadPoolExecutor(max_workers=2)
+        try:
+            with patch('collector._executor', executor), \
+                    patch('collector.collect_server', side_effect=collect) as collect_server:
+                for _ in range(3):
+                    results = collect_many(targets, timeout=0.3)
+                    self.assertEqual(results[1]['status'], 'timeout')
+                    self.assertEqual(results[2]['status'], 'connected')
+                    self.assertEqual(results[3]['status'], 'connected')
+                hung_calls = [call for call in collect_server.call_args_list if call[0][0] == 1]
+        finally:
+            release.set()
+            executor.shutdown(wait=True)
+
+        self.assertEqual(len(hung_calls), 1)
+
+
+class TestCollectStatements(unittest.TestCase):
+    def test_servers_without_statement_statistics_are_not_contacted(self):
+        config = {'db_type': 'postgresql', 'host': 'db'}
+        monitor = Mock(capabilities=None)
+        monitor.probe_capabilities.return_value = {'version': '16.2', 'features': {'statements': False}}
+        capabilities.attach(7, config, monitor)
+        try:
+            with patch('collector.collect_statement_stats') as collect:
+                results = collect_statements({7: config}, timeout=1)
+        finally:
+            capabilities.forget(7)
+
+        collect.assert_not_called()
+        self.assertEqual(results[7]['status'], 'unsupported')
+        self.assertIsNone(results[7]['interval'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch, MagicMock
+
+from connection_pool import ConnectionPool, PoolTimeoutError
+
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.config = {
+            'db_type': 'postgresql',
+            'host': 'localhost',
+            'port': 5432,
+            'database': 'postgres',
+            'username': 'test_user',
+            'password': 'test_pass'
+        }
+        patcher = patch('connection_pool.DatabaseMonitor')
+        self.mock_monitor_cls = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_monitor_cls.side_effect = lambda config: MagicMock(config=config)
+
+    def test_connection_is_reused(self):
+        pool = ConnectionPool(max_size=2)
+
+        with pool.monitor(1, self.config) as first:
+            first.connect.assert_called_once()
+        with pool.monitor(1, self.config) as second:
+            pass
+
+        self.assertIs(first, second)
+        self.assertEqual(self.mock_monitor_cls.call_count, 1)
+        self.assertEqual(pool.stats()[1], {'idle': 1, 'in_use': 0})
+
+    def test_failed_block_discards_connection(self):
+        pool = ConnectionPool()
+
+        with self.assertRaises(RuntimeError):
+            with pool.monitor(1, self.config) as monitor:
+                raise RuntimeError('query failed')
+
+        monitor.close.assert_called_once()
+        self.assertEqual(pool.stats()[1], {'idle': 0, 'in_use': 0})
+
+    def test_config_change_drops_old_connections(self):
+        pool = ConnectionPool()
+
+        with pool.monitor(1, self.config) as old:
+            pass
+        with pool.monitor(1, dict(self.config, password='new_pass')) as new:
+            pass
+
+        self.assertIsNot(old, new)
+        old.close.assert_called_once()
+
+    def test_invalidate_closes_idle_connections(self):
+        pool = ConnectionPool()
+
+        with pool.monitor(1, self.config) as monitor:
+            pass
+        pool.invalidate(1)
+
+        monitor.close.assert_called_once()
+        self.assertNotIn(1, pool.stats())
+
+    def test_invalidate_while_borrowed(self):
+        pool = ConnectionPool()
+
+        with pool.monitor(1, self.config) as monitor:
+            pool.invalidate(1)
+            monitor.close.assert_not_called()
+
+        monitor.close.assert_called_once()
+
+    def test_dead_connection_is_replaced_on_checkout(self):
+        pool = ConnectionPool()
+
+        with pool.monitor(1, self.config) as dead:
+            dead.ping.return_value = False
+        with pool.monitor(1, self.config, validate=True) as fresh:
+            pass
+
+        dead.close.assert_called_once()
+        self.assertIsNot(dead, fresh)
+
+    def test_idle_eviction(self):
+        pool = ConnectionPool(idle_timeout=0)
+
+        with pool.monitor(1, self.config) as monitor:
+            pass
+
+        self.assertEqual(pool.evict_idle(), 1)
+        monitor.close.assert_called_once()
+
+    def test_checkin_closes_other_servers_idle_connections(self):
+        pool = ConnectionPool(idle_timeout=60)
+        with pool.monitor(1, self.config) as idle:
+            pass
+
+        # Nobody calls evict_idle; using another server sweeps the pool
+        with patch('connection_pool.time.monotonic', return_value=time.monotonic() + 61):
+            with pool.monitor(2, self.config):
+                pass
+        idle.close.assert_called_once()
+        self.assertEqual(pool.stats()[1]['idle'], 0)
+
+    def test_pool_is_bounded(self):
+        pool = ConnectionPool(max_size=1, checkout_timeout=0.05)
+
+        with pool.monitor(1, self.config):
+            with self.assertRaises(PoolTimeoutError):
+                with pool.monitor(1, self.config):
+                    pass
+
+    def test_waiter_gets_returned_connection(self):
+        pool = ConnectionPool(max_size=1, checkout_timeout=5)
+        borrowed = []
+        released = threading.Event()
+
+        def borrow():
+            with pool.monitor(1, self.config) as monitor:
+                borrowed.append(monitor)
+
+        with pool.monitor(1, self.config) as first:
+            worker = threading.Thread(target=borrow)
+            worker.start()
+            released.wait(0.05)
+        worker.join(5)
+
+        self.assertEqual(borrowed, [first])
+
+    def test_unsaved_server_is_not_pooled(self):
+        pool = ConnectionPool()
+
+        with pool.monitor(None, self.config) as monitor:
+            pass
+
+        monitor.close.assert_called_once()
+        self.assertEqual(pool.stats(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import unittest
+
+from counter_deltas import CounterDeltaEngine, apply_rates
+
+
+def pg_metrics(commit, rollback, read, hit, epoch=(1000.0, 500.0)):
+    return {
+        'cache_hit_ratio': hit / (hit + read) * 100,
+        'transaction_rate': commit + rollback,
+        'counters': {'xact_commit': commit, 'xact_rollback': rollback, 'blks_read': read, 'blks_hit': hit},
+        'counter_epoch': list(epoch)
+    }
+
+
+class TestCounterDeltaEngine(unittest.TestCase):
+    def setUp(self):
+        self.engine = CounterDeltaEngine()
+
+    def test_first_sample_has_no_delta(self):
+        self.assertIsNone(self.engine.update(1, {'a': 10}, 100.0))
+
+    def test_delta_between_samples(self):
+        self.engine.update(1, {'a': 10, 'b': 5}, 100.0)
+        sample = self.engine.update(1, {'a': 30, 'b': 5}, 110.0)
+
+        self.assertEqual(sample, {'elapsed': 10.0, 'deltas': {'a': 20, 'b': 0}})
+
+    def test_counter_going_backwards_is_a_reset(self):
+        self.engine.update(1, {'a': 100}, 100.0)
+        self.assertIsNone(self.engine.update(1, {'a': 3}, 110.0))
+
+        # The post-reset sample is the new baseline
+        sample = self.engine.update(1, {'a': 13}, 120.0)
+        self.assertEqual(sample['deltas'], {'a': 10})
+
+    def test_epoch_change_is_a_reset(self):
+        self.engine.update(1, {'a': 10}, 100.0, epoch=[1, 1])
+        self.assertIsNone(self.engine.update(1, {'a': 50}, 110.0, epoch=[2, 1]))
+
+    def test_out_of_order_sample_is_ignored(self):
+        self.engine.update(1, {'a': 10}, 100.0)
+        self.assertIsNone(self.engine.update(1, {'a': 5}, 90.0))
+
+        sample = self.engine.update(1, {'a': 20}, 110.0)
+        self.assertEqual(sample['deltas'], {'a': 10})
+
+    def test_servers_are_independent(self):
+        self.engine.update(1, {'a': 10}, 100.0)
+        self.assertIsNone(self.engine.update(2, {'a': 10}, 105.0))
+
+    def test_retain(self):
+        self.engine.update(1, {'a': 10}, 100.0)
+        self.engine.retain([2])
+        self.assertIsNone(self.engine.update(1, {'a': 20}, 110.0))
+
+
+class TestApplyRates(unittest.TestCase):
+    def setUp(self):
+        self.engine = CounterDeltaEngine()
+
+    def test_postgres_rates(self):
+        first = pg_metrics(1000, 10, 100, 900)
+        apply_rates(self.engine, 1, 'postgresql', first, 100.0)
+        self.assertIsNone(first['transaction_rate'])
+        self.assertEqual(first['cache_hit_ratio'], 90.0)
+
+        second = pg_metrics(1190, 20, 150, 1100)
+        apply_rates(self.engine, 1, 'postgresql', second, 110.0)
+
+        self.assertEqual(second['transaction_rate'], 20.0)
+        self.assertEqual(second['blocks_read_per_sec'], 5.0)
+        self.assertEqual(second['cache_hit_ratio'], 80.0)
+        # Lifetime ratio of the same pg_stat_database counters
+        self.assertEqual(second['cache_hit_ratio_lifetime'], 88.0)
+
+    def test_postgres_stats_reset(self):
+        apply_rates(self.engine, 1, 'postgresql', pg_metrics(1000, 10, 100, 900), 100.0)
+        after_reset = pg_metrics(1500, 10, 100, 900, epoch=(2000.0, 500.0))
+        apply_rates(self.engine, 1, 'postgresql', after_reset, 110.0)
+
+        self.assertIsNone(after_reset['transaction_rate'])
+
+    def test_mysql_rates(self):
+        def mysql_metrics(commit, questions, reads, requests, uptime):
+            return {
+                'buffer_pool_hit_ratio': 99.9,
+                'counters': {'com_commit': commit, 'com_rollback': 0, 'questions': questions,
+                             'innodb_buffer_pool_reads': reads,
+                             'innodb_buffer_pool_read_requests': requests, 'uptime': uptime}
+            }
+
+        apply_rates(self.engine, 1, 'mysql', mysql_metrics(100, 1000, 10, 1000, 50), 100.0)
+        second = mysql_metrics(150, 1500, 20, 1100, 60)
+        apply_rates(self.engine, 1, 'mysql', second, 110.0)
+
+        self.assertEqual(second['transaction_rate'], 5.0)
+        self.assertEqual(second['queries_per_sec'], 50.0)
+        self.assertEqual(second['innodb_reads_per_sec'], 1.0)
+        self.assertEqual(second['buffer_pool_hit_ratio'], 90.0)
+
+        # Server restart: uptime goes backwards
+        restarted = mysql_metrics(5, 20, 1, 30, 3)
+        apply_rates(self.engine, 1, 'mysql', restarted, 120.0)
+        self.assertIsNone(restarted['transaction_rate'])
+
+
+if __name__ == '__main__':
+    unittest.main()
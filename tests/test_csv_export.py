@@ -0,0 +1,57 @@
+import csv
+import gzip
+from io import StringIO
+
+import pytest
+from app import app as flask_app, db, DatabaseServer, QueryHistory, User
+from csv_export import csv_chunks, gzip_chunks
+
+
+@pytest.fixture
+def history(app):
+    user = User(username='test_user', email='test@example.com', role='admin')
+    user.set_password('test_password')
+    server = DatabaseServer(name='test_server', db_type='postgresql', host='localhost',
+                            port=5432, username='test', password='test')
+    db.session.add_all([user, server])
+    db.session.commit()
+    db.session.add_all([
+        QueryHistory(server_id=server.id, user_id=user.id, query_text=f'SELECT {i}',
+                     status='completed' if i % 2 else 'error')
+        for i in range(25)
+    ])
+    db.session.commit()
+    return server
+
+
+def test_csv_chunks_are_batched(history):
+    chunks = list(csv_chunks(QueryHistory.query.order_by(QueryHistory.id), ['Query'],
+                             lambda q: [q.query_text], batch_size=10))
+
+    # Header + 10 rows, 10 rows, the last 5 rows
+    assert len(chunks) == 3
+    rows = list(csv.reader(StringIO(''.join(chunks))))
+    assert rows[0] == ['Query']
+    assert [row[0] for row in rows[1:]] == [f'SELECT {i}' for i in range(25)]
+
+
+def test_gzip_chunks_form_one_stream():
+    data = b''.join(gzip_chunks(['a,b\r\n', '1,2\r\n', '']))
+    assert gzip.decompress(data) == b'a,b\r\n1,2\r\n'
+
+
+def test_export_streams_with_screen_filters(history):
+    client = flask_app.test_client()
+    client.post('/login', data={'username': 'test_user', 'password': 'test_password'})
+
+    response = client.get(f'/query_history?export=1&status=error&server={history.id}')
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.mimetype == 'text/csv'
+    rows = list(csv.reader(StringIO(response.get_data(as_text=True))))
+    assert len(rows) == 1 + 13
+    assert {row[4] for row in rows[1:]} == {'error'}
+
+    response = client.get('/query_history?export=1', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert len(list(csv.reader(StringIO(gzip.decompress(response.get_data()).decode())))) == 26
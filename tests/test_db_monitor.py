@@ -1,5 +1,8 @@
+import hashlib
 import unittest
+import psycopg2
 from db_monitor import DatabaseMonitor
+from query_fingerprint import fingerprint_query
 from unittest.mock import patch, MagicMock
 
 class TestDatabaseMonitor(unittest.TestCase):
@@ -41,6 +44,30 @@ class TestDatabaseMonitor(unittest.TestCase):
             password='test_pass'
         )
 
+    @patch('psycopg2.connect')
+    def test_query_timeout_postgres(self, mock_connect):
+        monitor = DatabaseMonitor(dict(self.postgres_config, connect_timeout=3, query_timeout=2.5))
+        monitor.connect()
+        
+        options = mock_connect.call_args[1]
+        self.assertEqual(options['options'], '-c statement_timeout=2500')
+        self.assertEqual(options['keepalives_idle'], 2)
+        # Already set while connecting; only a different deadline is sent
+        monitor.set_query_timeout(2.5)
+        mock_connect.return_value.cursor.assert_not_called()
+        monitor.set_query_timeout(10)
+        mock_connect.return_value.cursor.return_value.execute.assert_called_once_with(
+            'SET SESSION statement_timeout = 10000')
+
+    @patch('mysql.connector.connect')
+    def test_query_timeout_mysql(self, mock_connect):
+        monitor = DatabaseMonitor(dict(self.mysql_config, connect_timeout=3, query_timeout=2.5))
+        monitor.connect()
+        
+        self.assertEqual(mock_connect.call_args[1]['connection_timeout'], 3)
+        mock_connect.return_value.cursor.return_value.execute.assert_called_once_with(
+            'SET SESSION max_execution_time = 2500')
+
     @patch('mysql.connector.connect')
     def test_mysql_connection(self, mock_connect):
         # Setup mock
@@ -85,6 +112,235 @@ class TestDatabaseMonitor(unittest.TestCase):
         self.assertIn('memory_percent', metrics)
         self.assertIn('disk_usage', metrics)
 
+    @patch('psycopg2.connect')
+    def test_performance_metrics_single_round_trip_postgres(self, mock_connect):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_conn.cursor.return_value = mock_cursor
+        mock_connect.return_value = mock_conn
+        
+        # active connections, size, table cache hit ratio, transaction
+        # counter, commits, rollbacks, blocks read, blocks hit
+        mock_cursor.fetchone.return_value = (7, 512, 99.5, 12345, 12000, 345, 10, 990)
+        
+        monitor = DatabaseMonitor(self.postgres_config)
+        monitor.connect()
+        metrics = monitor.get_performance_metrics()
+        
+        # Every scalar metric comes from one statement
+        self.assertEqual(mock_cursor.execute.call_count, 1)
+        self.assertEqual(metrics['active_connections'], 7)
+        self.assertEqual(metrics['database_size_mb'], 512.0)
+        self.assertEqual(metrics['table_cache_hit_ratio'], 99.5)
+        # From pg_stat_database, like the per-interval ratio
+        self.assertEqual(metrics['cache_hit_ratio'], 99.0)
+        self.assertEqual(metrics['transaction_rate'], 12345.0)
+
+    @patch('psycopg2.connect')
+    def test_performance_metrics_fast_tier_skips_expensive_queries(self, mock_connect):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_conn.cursor.return_value = mock_cursor
+        mock_connect.return_value = mock_conn
+        
+        # active connections, transaction counter
+        mock_cursor.fetchone.return_value = (7, 12345)
+        
+        monitor = DatabaseMonitor(self.postgres_config)
+        monitor.connect()
+        metrics = monitor.get_performance_metrics({'fast'})
+        
+        sql = mock_cursor.execute.call_args[0][0]
+        self.assertNotIn('pg_database_size', sql)
+        self.assertNotIn('pg_statio_user_tables', sql)
+        self.assertEqual(metrics['active_connections'], 7)
+        self.assertEqual(metrics['transaction_rate'], 12345.0)
+        self.assertNotIn('database_size_mb', metrics)
+        self.assertNotIn('table_cache_hit_ratio', metrics)
+
+    @patch('mysql.connector.connect')
+    def test_performance_metrics_fast_tier_skips_table_sizes_mysql(self, mock_connect):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_conn.cursor.return_value = mock_cursor
+        mock_connect.return_value = mock_conn
+        mock_cursor.fetchall.return_value = [('active_connections', '3')]
+        
+        monitor = DatabaseMonitor(self.mysql_config)
+        monitor.connect()
+        metrics = monitor.get_performance_metrics({'fast'})
+        
+        self.assertNotIn('information_schema.tables', mock_cursor.execute.call_args[0][0])
+        self.assertEqual(metrics['active_connections'], 3)
+        self.assertNotIn('database_size_mb', metrics)
+
+    @patch('mysql.connector.connect')
+    def test_performance_metrics_single_round_trip_mysql(self, mock_connect):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_conn.cursor.return_value = mock_cursor
+        mock_connect.return_value = mock_conn
+        
+        mock_cursor.fetchall.return_value = [
+            ('active_connections', '3'),
+            ('database_size_mb', '250.5'),
+            ('INNODB_BUFFER_POOL_READS', '50'),
+            ('INNODB_BUFFER_POOL_READ_REQUESTS', '1000')
+        ]
+        
+        monitor = DatabaseMonitor(self.mysql_config)
+        monitor.connect()
+        metrics = monitor.get_performance_metrics()
+        
+        self.assertEqual(mock_cursor.execute.call_count, 1)
+        self.assertIn('performance_schema.global_status', mock_cursor.execute.call_args[0][0])
+        self.assertEqual(metrics['active_connections'], 3)
+        self.assertEqual(metrics['database_size_mb'], 250.5)
+        self.assertEqual(metrics['buffer_pool_hit_ratio'], 95.0)
+
+    @patch('psycopg2.connect')
+    def test_probe_capabilities_postgres(self, mock_connect):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_conn.cursor.return_value = mock_cursor
+        mock_connect.return_value = mock_conn
+        mock_cursor.fetchone.return_value = ('12.4', 120004, ['plpgsql'], False, False, False, ['pg_monitor'])
+        
+        monitor = DatabaseMonitor(self.postgres_config)
+        monitor.connect()
+        capabilities = monitor.probe_capabilities()
+        
+        self.assertEqual(mock_cursor.execute.call_count, 1)
+        self.assertEqual(capabilities['version_num'], 120004)
+        self.assertEqual(capabilities['extensions'], ['plpgsql'])
+        self.assertEqual(capabilities['permissions'], ['pg_monitor'])
+        self.assertFalse(capabilities['features']['statements'])
+        
+        # Without the extension no statement is sent for it
+        monitor.capabilities = capabilities
+        with self.assertRaises(RuntimeError):
+            monitor.get_statement_stats()
+        self.assertEqual(mock_cursor.execute.call_count, 1)
+
+    @patch('psycopg2.connect')
+    def test_statements_query_follows_probed_columns(self, mock_connect):
+        monitor = DatabaseMonitor(self.postgres_config)
+        monitor.connect()
+        monitor.capabilities = {'features': {'statements': True, 'statements_exec_time': False,
+                                             'statements_info': False}}
+        
+        sql = monitor._statements_query()
+        self.assertIn('s.total_time AS', sql)
+        self.assertNotIn('pg_stat_statements_info', sql)
+
+    @patch('mysql.connector.connect')
+    def test_probe_capabilities_mysql(self, mock_connect):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_conn.cursor.return_value = mock_cursor
+        mock_connect.return_value = mock_conn
+        mock_cursor.fetchone.return_value = ('8.0.36', 0, 0, 'performance_schema.global_status', 'PROCESS')
+        
+        monitor = DatabaseMonitor(self.mysql_config)
+        monitor.connect()
+        monitor.capabilities = monitor.probe_capabilities()
+        features = monitor.capabilities['features']
+        
+        # performance_schema is switched off and the server has no TIME_MS
+        self.assertFalse(features['statements'])
+        self.assertIsNone(features['status_table'])
+        self.assertFalse(features['time_ms'])
+        self.assertEqual(monitor.capabilities['permissions'], ['PROCESS'])
+        
+        mock_cursor.fetchall.return_value = [('active_connections', '3')]
+        monitor.get_performance_metrics()
+        self.assertNotIn('global_status', mock_cursor.execute.call_args[0][0].lower())
+        
+        mock_cursor.description = [('ID',), ('query',)]
+        mock_cursor.fetchall.return_value = []
+        monitor.get_active_queries()
+        self.assertNotIn('TIME_MS', mock_cursor.execute.call_args[0][0])
+
+    @patch('psycopg2.connect')
+    def test_collection_statements_are_prepared_once_postgres(self, mock_connect):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_conn.cursor.return_value = mock_cursor
+        mock_connect.return_value = mock_conn
+        mock_cursor.fetchone.return_value = (7, 12345)
+        
+        monitor = DatabaseMonitor(self.postgres_config)
+        monitor.connect()
+        monitor.get_performance_metrics({'fast'})
+        monitor.get_performance_metrics({'fast'})
+        
+        first, second = [call[0][0] for call in mock_cursor.execute.call_args_list]
+        self.assertTrue(first.startswith('PREPARE dbmonitor_'))
+        self.assertIn('pg_stat_database', first)
+        self.assertEqual(second, 'EXECUTE ' + first.split()[1])
+
+    @patch('psycopg2.connect')
+    def test_dropped_prepared_statement_is_prepared_again(self, mock_connect):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_conn.cursor.return_value = mock_cursor
+        mock_connect.return_value = mock_conn
+        mock_cursor.fetchone.return_value = (7, 12345)
+        
+        monitor = DatabaseMonitor(self.postgres_config)
+        monitor.connect()
+        monitor.get_performance_metrics({'fast'})
+        
+        class InvalidStatementName(psycopg2.Error):
+            pgcode = '26000'
+        mock_cursor.execute.side_effect = [InvalidStatementName('gone'), None]
+        metrics = monitor.get_performance_metrics({'fast'})
+        
+        self.assertTrue(mock_cursor.execute.call_args[0][0].startswith('PREPARE dbmonitor_'))
+        self.assertEqual(metrics['active_connections'], 7)
+
+    @patch('mysql.connector.connect')
+    def test_collection_statements_reuse_prepared_cursor_mysql(self, mock_connect):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_conn.cursor.return_value = mock_cursor
+        mock_connect.return_value = mock_conn
+        mock_cursor.fetchall.return_value = [(b'active_connections', '3')]
+        
+        monitor = DatabaseMonitor(self.mysql_config)
+        monitor.connect()
+        monitor.get_performance_metrics()
+        metrics = monitor.get_performance_metrics()
+        
+        mock_conn.cursor.assert_called_once_with(prepared=True)
+        first, second = [call[0][0] for call in mock_cursor.execute.call_args_list]
+        # mysql.connector only skips re-preparing for the identical string
+        self.assertIs(first, second)
+        self.assertEqual(metrics['active_connections'], 3)
+
+    @patch('psycopg2.connect')
+    def test_get_statement_stats_postgres(self, mock_connect):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_conn.cursor.return_value = mock_cursor
+        mock_conn.server_version = 120005
+        mock_connect.return_value = mock_conn
+        mock_cursor.fetchall.return_value = [
+            ('1:10:42', 'app', 'SELECT $1', 5, 12.5, 5, None)
+        ]
+        
+        monitor = DatabaseMonitor(self.postgres_config)
+        monitor.connect()
+        stats = monitor.get_statement_stats()
+        
+        # PostgreSQL 12 has neither total_exec_time nor pg_stat_statements_info
+        sql = mock_cursor.execute.call_args[0][0]
+        self.assertIn('s.total_time AS', sql)
+        self.assertNotIn('pg_stat_statements_info', sql)
+        self.assertIsNone(stats['epoch'])
+        self.assertEqual(stats['statements']['1:10:42'],
+                         {'query': 'SELECT $1', 'database': 'app', 'calls': 5, 'total_time_ms': 12.5, 'rows': 5})
+
     def test_connection_error(self):
         # Test with invalid config
         invalid_config = {
@@ -130,6 +386,70 @@ class TestDatabaseMonitor(unittest.TestCase):
         self.assertEqual(queries[0]['query'], 'SELECT * FROM table1')
         self.assertEqual(queries[1]['usename'], 'user2')
 
+    @patch('psycopg2.connect')
+    def test_active_queries_are_bounded_by_the_server(self, mock_connect):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_conn.cursor.return_value = mock_cursor
+        mock_connect.return_value = mock_conn
+        mock_cursor.description = [('pid',), ('query',), ('query_truncated',)]
+        mock_cursor.fetchall.return_value = [(1, 'SELECT 12345', True)]
+        
+        monitor = DatabaseMonitor(self.postgres_config)
+        monitor.connect()
+        queries = monitor.get_active_queries(limit=10, text_limit=12)
+        
+        sql = mock_cursor.execute.call_args[0][0]
+        self.assertIn('left(query, 12)', sql)
+        self.assertIn('LIMIT 10', sql)
+        # Sessions without a query_start must not crowd out the longest-running ones
+        self.assertIn('ORDER BY duration_seconds DESC NULLS LAST', sql)
+        self.assertIs(queries[0]['query_truncated'], True)
+
+    @patch('psycopg2.connect')
+    def test_truncated_queries_are_fingerprinted_from_a_server_side_digest(self, mock_connect):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_conn.cursor.return_value = mock_cursor
+        mock_connect.return_value = mock_conn
+        prefix = 'SELECT * FROM orders WHERE region = 1 AND '
+        first, second = prefix + 'status = 2', prefix + 'customer_id = 3'
+        digest = lambda text: hashlib.md5(text.encode()).hexdigest()
+        mock_cursor.description = [('pid',), ('query',), ('query_truncated',), ('query_digest',)]
+        mock_cursor.fetchall.return_value = [(1, prefix[:20], True, digest(first)),
+                                             (2, prefix[:20], True, digest(second)),
+                                             (3, 'SELECT 1', False, None)]
+        
+        monitor = DatabaseMonitor(self.postgres_config)
+        monitor.connect()
+        queries = monitor.get_active_queries(text_limit=20)
+        
+        sql = mock_cursor.execute.call_args[0][0]
+        self.assertIn('THEN md5(query) END as query_digest', sql)
+        # Only the cut text travels; the full text comes from get_query_text
+        self.assertNotIn('THEN query END', sql)
+        self.assertNotEqual(queries[0]['fingerprint'], queries[1]['fingerprint'])
+        self.assertEqual(len(queries[0]['fingerprint']), 16)
+        self.assertEqual(queries[2]['fingerprint'], fingerprint_query('SELECT 1'))
+        self.assertNotIn('query_digest', queries[0])
+        self.assertEqual(queries[0]['query'], prefix[:20])
+
+    @patch('mysql.connector.connect')
+    def test_get_query_text_mysql(self, mock_connect):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_conn.cursor.return_value = mock_cursor
+        mock_connect.return_value = mock_conn
+        mock_cursor.fetchone.return_value = ('SELECT * FROM big_table',)
+        
+        monitor = DatabaseMonitor(self.mysql_config)
+        monitor.connect()
+        
+        self.assertEqual(monitor.get_query_text(42), 'SELECT * FROM big_table')
+        self.assertEqual(mock_cursor.execute.call_args[0][1], (42,))
+        mock_cursor.fetchone.return_value = None
+        self.assertIsNone(monitor.get_query_text(43))
+
     @patch('mysql.connector.connect')
     def test_get_active_queries_mysql(self, mock_connect):
         # Setup mock
@@ -159,6 +479,7 @@ class TestDatabaseMonitor(unittest.TestCase):
         self.assertEqual(queries[0]['ID'], 1)
         self.assertEqual(queries[0]['query'], 'SELECT * FROM table1')
         self.assertEqual(queries[1]['USER'], 'user2')
+        self.assertEqual(len(queries[0]['fingerprint']), 16)
 
     @patch('mysql.connector.connect')
     def test_get_database_size_mysql(self, mock_connect):
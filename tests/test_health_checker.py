@@ -0,0 +1,99 @@
+import time
+from unittest.mock import patch
+
+import pytest
+from app import app as flask_app, db, health_checker, DatabaseServer, User
+from health_checker import HealthChecker
+
+
+@pytest.fixture
+def servers(app):
+    servers = [DatabaseServer(name=f'server_{i}', db_type='postgresql', host='localhost',
+                              port=5432, username='test', password='test') for i in range(2)]
+    db.session.add_all(servers)
+    db.session.commit()
+    return servers
+
+
+class FakeProbe:
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.calls = []
+
+    def __call__(self, targets, timeout):
+        self.calls.append(sorted(targets))
+        return {server_id: {'status': 'error', 'error': 'refused', 'latency_ms': None}
+                if server_id in self.failing else {'status': 'connected', 'error': None, 'latency_ms': 1.5}
+                for server_id in targets}
+
+
+def test_only_due_servers_are_probed(app):
+    probe = FakeProbe(failing={2})
+    checker = HealthChecker(app, db, DatabaseServer, probe=probe, interval=10, max_interval=40)
+    targets = {1: {}, 2: {}}
+
+    checker.check(targets)
+    assert probe.calls == [[1, 2]]
+    assert checker.get(1)['status'] == 'connected'
+    assert checker.get(2) == dict(checker.get(2), status='error', error='refused')
+
+    # Nothing is due right after a round
+    assert checker.check(targets) == {}
+    assert len(probe.calls) == 1
+
+
+def test_failing_servers_back_off(app):
+    checker = HealthChecker(app, db, DatabaseServer, probe=FakeProbe(failing={1}), interval=10, max_interval=40)
+    delays = []
+    for _ in range(4):
+        checker.check({1: {}}, force=True)
+        delays.append(round(checker._due[1] - time.monotonic()))
+    assert delays == [10, 20, 40, 40]
+
+    checker.record(1, 'connected')
+    assert round(checker._due[1] - time.monotonic()) == 10
+
+
+def test_write_stores_changed_statuses_in_one_batch(servers):
+    checker = HealthChecker(flask_app, db, DatabaseServer, probe=FakeProbe(failing={servers[1].id}))
+    checker.check({**{server.id: {} for server in servers}, 999: {}})
+
+    assert checker.write() == 2
+    assert checker.write() == 0
+    db.session.expire_all()
+    assert servers[0].last_check is not None and servers[0].last_error is None
+    assert servers[1].last_error == 'refused'
+
+
+def test_status_falls_back_to_stored_columns(servers):
+    checker = HealthChecker(flask_app, db, DatabaseServer, probe=FakeProbe())
+    assert checker.status_of(servers[0])['status'] == 'unknown'
+
+    servers[0].last_check = servers[1].last_check = servers[0].created_at
+    servers[1].last_error = 'refused'
+    assert checker.status_of(servers[0])['status'] == 'connected'
+    assert checker.status_of(servers[1])['status'] == 'error'
+    assert not servers[1].is_connected
+
+
+def test_pages_never_connect(servers):
+    user = User(username='test_user', email='test@example.com', role='admin')
+    user.set_password('test_password')
+    db.session.add(user)
+    db.session.commit()
+    # Ids are reused between tests; drop statuses recorded by earlier ones
+    health_checker.retain([])
+    health_checker.record(servers[0].id, 'timeout', 'No response within 5 seconds')
+
+    client = flask_app.test_client()
+    client.post('/login', data={'username': 'test_user', 'password': 'test_password'})
+    with patch('connection_pool.DatabaseMonitor', side_effect=AssertionError('connected while rendering')):
+        response = client.get('/database_servers')
+        assert response.status_code == 200
+        assert b'Timeout' in response.data
+        assert b'Not checked' in response.data
+
+        health = {item['name']: item for item in client.get('/api/servers/health').get_json()}
+    assert health['server_0']['status'] == 'timeout'
+    assert health['server_1']['status'] == 'unknown'
+    health_checker.retain([])
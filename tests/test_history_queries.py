@@ -0,0 +1,78 @@
+from contextlib import contextmanager
+
+import pytest
+from flask import g
+from sqlalchemy import event
+from app import app as flask_app, db, activity_writer, history_queries, ActivityLog, DatabaseServer, QueryHistory, User
+from pagination import paginate_keyset
+
+
+@pytest.fixture
+def rows(app):
+    """60 queries and activity logs spread over three users and three servers"""
+    users, servers = [], []
+    for i in range(3):
+        user = User(username=f'user_{i}', email=f'user_{i}@example.com', role='admin')
+        user.set_password('test_password')
+        users.append(user)
+        servers.append(DatabaseServer(name=f'server_{i}', db_type='postgresql', host='localhost',
+                                      port=5432, username='test', password='test'))
+    db.session.add_all(users + servers)
+    db.session.commit()
+    for i in range(60):
+        db.session.add(QueryHistory(server_id=servers[i % 3].id, user_id=users[i % 3].id, query_text=f'SELECT {i}'))
+        db.session.add(ActivityLog(user_id=users[i % 3].id, access_ip='127.0.0.1', menu_accessed=f'page {i}'))
+    db.session.commit()
+    # Start from an empty identity map, as a new request would
+    db.session.expunge_all()
+    return users
+
+
+@contextmanager
+def count_statements():
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+
+
+def test_query_history_page_loads_servers_with_rows(rows):
+    query, rank = history_queries.query_history()
+    with count_statements() as statements:
+        page = paginate_keyset(query, [QueryHistory.start_time, QueryHistory.id], 50)
+        names = [q.server.name for q in page]
+
+    assert len(names) == 50
+    assert len(statements) <= 3
+
+
+def test_activity_log_page_loads_users_with_rows(rows):
+    query = history_queries.activity_logs()
+    with count_statements() as statements:
+        page = paginate_keyset(query, [ActivityLog.access_time, ActivityLog.id], 50)
+        names = [log.user.username for log in page]
+
+    assert len(names) == 50
+    assert len(statements) <= 3
+
+
+@pytest.mark.parametrize('url', ['/api/query_history', '/api/activity_logs'])
+def test_statements_do_not_grow_with_page_size(rows, url):
+    client = flask_app.test_client()
+    client.post('/login', data={'username': 'user_0', 'password': 'test_password'})
+    # Write the login record now rather than during a measured request
+    activity_writer.flush()
+
+    counts = []
+    for per_page in (1, 50):
+        # The test keeps one app context, and so one session, across requests; start each one cold
+        db.session.expunge_all()
+        g.pop('_login_user', None)
+        with count_statements() as statements:
+            response = client.get(f'{url}?per_page={per_page}')
+        assert response.status_code == 200
+        counts.append(len(statements))
+    assert counts[0] == counts[1]
@@ -0,0 +1,159 @@
+import time
+from datetime import timedelta
+from unittest.mock import PropertyMock, patch
+
+from app import (app as flask_app, db, collector_election, collector_leases, snapshot_store, CollectorLease,
+                 DatabaseServer, LeaderLease, ServerSnapshot, User)
+from leader_election import LeaderElection
+from metric_store import utcnow
+from snapshot_cache import SnapshotCache, snapshots
+
+
+def election(holder, events):
+    return LeaderElection(flask_app, db, LeaderLease, 'test', holder=holder, ttl=10, interval=2,
+                          on_elected=lambda: events.append((holder, 'elected')),
+                          on_deposed=lambda: events.append((holder, 'deposed')))
+
+
+def result(active_connections):
+    return {'status': 'connected', 'error': None, 'queries': [{'pid': '1', 'query': 'SELECT 1'}],
+            'metrics': {'active_connections': active_connections}, 'duration_seconds': 0.1}
+
+
+def test_only_one_process_is_elected(app):
+    events = []
+    first, second = election('first', events), election('second', events)
+    assert first.poll()
+    assert not second.poll()
+    assert first.poll()
+    assert events == [('first', 'elected')]
+
+
+def test_clean_exit_hands_over_at_once(app):
+    events = []
+    first, second = election('first', events), election('second', events)
+    first.poll()
+    first.stop()
+    assert second.poll()
+    assert events == [('first', 'elected'), ('first', 'deposed'), ('second', 'elected')]
+
+
+def test_expired_lease_is_taken_over(app):
+    events = []
+    first, second = election('first', events), election('second', events)
+    first.poll()
+
+    # The first leader has not renewed for a whole lease period
+    LeaderLease.query.filter_by(name='test').update({'expires_at': utcnow() - timedelta(seconds=1)})
+    db.session.commit()
+    assert second.poll()
+    assert not first.poll()
+    assert events[-2:] == [('second', 'elected'), ('first', 'deposed')]
+
+
+def test_leader_steps_down_when_it_cannot_renew(app):
+    events = []
+    leader = election('first', events)
+    leader.poll()
+    with patch.object(LeaderElection, '_try_acquire', side_effect=RuntimeError('database is locked')):
+        assert leader.poll()
+        leader._renewed_at = time.monotonic() - leader.ttl
+        assert not leader.poll()
+    assert events == [('first', 'elected'), ('first', 'deposed')]
+
+
+def test_shared_snapshots_reach_other_processes(app):
+    server = DatabaseServer(name='shared', db_type='postgresql', host='localhost', port=5432,
+                            username='test', password='test')
+    db.session.add(server)
+    db.session.commit()
+    cache = SnapshotCache()
+
+    collected_at = time.time() - 3
+    snapshot_store.add({server.id: result(7)}, collected_at)
+    snapshot_store.flush()
+    assert snapshot_store.sync_into(cache) == 1
+    entry = cache.get(server.id)
+    assert entry['metrics'] == {'active_connections': 7}
+    assert entry['queries'] == [{'pid': '1', 'query': 'SELECT 1'}]
+    assert entry['age_seconds'] >= 3
+
+    # Rows already merged are not put again; newer ones replace them
+    assert snapshot_store.sync_into(cache) == 0
+    snapshot_store.add({server.id: result(9)}, time.time())
+    snapshot_store.flush()
+    assert snapshot_store.sync_into(cache) == 1
+    assert cache.get(server.id)['metrics'] == {'active_connections': 9}
+    assert db.session.query(ServerSnapshot).count() == 1
+
+
+def test_queued_snapshots_are_written_in_one_flush(app):
+    servers = [DatabaseServer(name=f'queued_{i}', db_type='postgresql', host='localhost', port=5432,
+                              username='test', password='test') for i in range(3)]
+    db.session.add_all(servers)
+    db.session.commit()
+    cache = SnapshotCache()
+
+    for server in servers:
+        snapshot_store.add({server.id: result(1)}, time.time())
+    snapshot_store.add({servers[0].id: result(2)}, time.time())
+    snapshot_store.retain([server.id for server in servers[:2]])
+    assert db.session.query(ServerSnapshot).count() == 0
+
+    with patch.object(db.session, 'commit', wraps=db.session.commit) as commit:
+        assert snapshot_store.flush() == 2
+    assert commit.call_count == 1
+    snapshot_store.sync_into(cache)
+    assert cache.get(servers[0].id)['metrics'] == {'active_connections': 2}
+    assert cache.get(servers[2].id) is None
+    assert snapshot_store.flush() == 0
+
+
+def test_followers_serve_shared_snapshots_without_polling(app):
+    user = User(username='test_user', email='test@example.com', role='admin')
+    user.set_password('test_password')
+    server = DatabaseServer(name='shared', db_type='postgresql', host='localhost', port=5432,
+                            username='test', password='test')
+    db.session.add_all([user, server])
+    db.session.commit()
+    snapshots.discard(server.id)
+    snapshot_store.add({server.id: result(11)}, time.time())
+    snapshot_store.flush()
+
+    client = flask_app.test_client()
+    client.post('/login', data={'username': 'test_user', 'password': 'test_password'})
+    with patch.object(LeaderElection, 'following', new_callable=PropertyMock, return_value=True), \
+            patch('connection_pool.DatabaseMonitor', side_effect=AssertionError('a follower polled a server')):
+        data = client.get('/api/metrics').get_json()
+    assert data['servers'][0]['status'] == 'connected'
+    assert data['servers'][0]['metrics'] == {'active_connections': 11}
+    assert not collector_election.started
+    snapshots.discard(server.id)
+
+
+def test_web_workers_read_shared_snapshots_while_collectors_run(app):
+    user = User(username='test_user', email='test@example.com', role='admin')
+    user.set_password('test_password')
+    server = DatabaseServer(name='sharded', db_type='postgresql', host='localhost', port=5432,
+                            username='test', password='test')
+    now = utcnow()
+    lease = CollectorLease(collector_id='dedicated', hostname='collector', pid=1, started_at=now,
+                           heartbeat_at=now, expires_at=now + timedelta(seconds=30))
+    db.session.add_all([user, server, lease])
+    db.session.commit()
+    snapshots.discard(server.id)
+    snapshot_store.add({server.id: result(13)}, time.time())
+    snapshot_store.flush()
+    assert collector_leases.refresh()
+
+    client = flask_app.test_client()
+    client.post('/login', data={'username': 'test_user', 'password': 'test_password'})
+    try:
+        with patch('connection_pool.DatabaseMonitor', side_effect=AssertionError('a web worker polled a server')):
+            data = client.get('/api/metrics').get_json()
+        assert data['servers'][0]['metrics'] == {'active_connections': 13}
+    finally:
+        db.session.delete(lease)
+        db.session.commit()
+        collector_leases.refresh()
+        snapshots.discard(server.id)
@@ -0,0 +1,111 @@
+import pytest
+from datetime import datetime, timedelta
+from app import db, DatabaseServer, MetricSample, MetricRollup
+from metric_store import MetricStore
+
+
+@pytest.fixture
+def server(app):
+    server = DatabaseServer(
+        name='test_server',
+        db_type='postgresql',
+        host='localhost',
+        port=5432,
+        username='test',
+        password='test'
+    )
+    db.session.add(server)
+    db.session.commit()
+    return server
+
+
+@pytest.fixture
+def store(app):
+    return MetricStore(db, MetricSample, MetricRollup, batch_size=3)
+
+
+NOW = datetime(2026, 1, 10, 12, 0, 0)
+
+
+def test_samples_are_written_in_batches(store, server):
+    store.add(server.id, {'active_connections': 5, 'cpu_percent': 10.5, 'transaction_rate': None})
+
+    # Non-numeric and missing values are skipped
+    assert store.pending() == 2
+    assert MetricSample.query.count() == 0
+
+    store.add(server.id, {'active_connections': 6})
+    assert store.flush_if_due() == 3
+    assert MetricSample.query.count() == 3
+    assert store.pending() == 0
+
+
+def test_rollup_to_minutes_and_hours(store, server):
+    start = NOW - timedelta(hours=2)
+    for minute in range(90):
+        for second, value in ((0, minute), (30, minute + 10)):
+            store.add(server.id, {'active_connections': value},
+                      start + timedelta(minutes=minute, seconds=second))
+    store.flush()
+
+    store.rollup(NOW)
+
+    first = MetricRollup.query.filter_by(resolution='1m', bucket_start=start).one()
+    assert (first.min_value, first.max_value, first.avg_value, first.last_value) == (0, 10, 5, 10)
+    assert first.sample_count == 2
+    assert MetricRollup.query.filter_by(resolution='1m').count() == 60
+
+    # Hours are only built from completed minute buckets
+    hour = MetricRollup.query.filter_by(resolution='1h').one()
+    assert hour.bucket_start == start
+    assert hour.sample_count == 120
+    assert hour.min_value == 0
+    assert hour.max_value == 69
+    assert hour.last_value == 69
+
+    # The next run continues where the previous one stopped
+    store.rollup(NOW)
+    assert MetricRollup.query.filter_by(resolution='1m').count() == 90
+
+
+def test_rollup_skips_gaps(store, server):
+    store.add(server.id, {'active_connections': 1}, NOW - timedelta(days=1))
+    store.add(server.id, {'active_connections': 2}, NOW - timedelta(minutes=10))
+    store.flush()
+
+    store.rollup(NOW)
+    store.rollup(NOW)
+
+    assert MetricRollup.query.filter_by(resolution='1m').count() == 2
+
+
+def test_prune_applies_retention(store, server):
+    store.add(server.id, {'active_connections': 1}, NOW - timedelta(days=30))
+    store.add(server.id, {'active_connections': 2}, NOW)
+    store.flush()
+
+    store.prune(NOW)
+
+    assert [s.value for s in MetricSample.query.all()] == [2]
+
+
+def test_choose_resolution():
+    assert MetricStore.choose_resolution(NOW - timedelta(hours=1), 10, NOW) == 'raw'
+    assert MetricStore.choose_resolution(NOW - timedelta(hours=6), 120, NOW) == '1m'
+    assert MetricStore.choose_resolution(NOW - timedelta(days=30), 8640, NOW) == '1h'
+    assert MetricStore.choose_resolution(NOW - timedelta(days=365), 86400 * 2, NOW) == '1d'
+    # Raw data is gone after two days, so fine steps fall back to minutes
+    assert MetricStore.choose_resolution(NOW - timedelta(days=5), 10, NOW) == '1m'
+
+
+def test_history_downsamples_to_step(store, server):
+    start = datetime.utcnow().replace(microsecond=0) - timedelta(minutes=30)
+    for second in range(0, 600, 10):
+        store.add(server.id, {'active_connections': second}, start + timedelta(seconds=second))
+    store.flush()
+
+    history = store.history(server.id, 'active_connections', start, start + timedelta(minutes=10), 30)
+
+    assert history['resolution'] == 'raw'
+    assert len(history['points']) in (20, 21)
+    assert all(p['min'] <= p['avg'] <= p['max'] for p in history['points'])
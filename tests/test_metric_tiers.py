@@ -0,0 +1,55 @@
+import unittest
+
+from metric_tiers import TierCache, tier_intervals
+
+
+class TestTierIntervals(unittest.TestCase):
+    def test_overrides_replace_defaults(self):
+        intervals = tier_intervals({'slow': 3600})
+        self.assertEqual(intervals['slow'], 3600.0)
+        self.assertEqual(intervals['fast'], 0.0)
+
+    def test_invalid_overrides_are_rejected(self):
+        for overrides in ({'hourly': 10}, {'fast': 10}, {'medium': -1}):
+            with self.assertRaises(ValueError):
+                tier_intervals(overrides)
+
+
+class TestTierCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = TierCache({'database_size_mb': 'slow', 'table_cache_hit_ratio': 'medium'})
+        self.intervals = {'fast': 0, 'medium': 60, 'slow': 900}
+
+    def test_first_poll_collects_every_tier(self):
+        self.assertEqual(self.cache.due(1, self.intervals, 0), {'fast', 'medium', 'slow'})
+
+    def test_tiers_become_due_after_their_interval(self):
+        self.cache.apply(1, {'fast', 'medium', 'slow'}, {}, 0)
+        self.assertEqual(self.cache.due(1, self.intervals, 30), {'fast'})
+        self.assertEqual(self.cache.due(1, self.intervals, 60), {'fast', 'medium'})
+        self.assertEqual(self.cache.due(1, self.intervals, 900), {'fast', 'medium', 'slow'})
+
+    def test_skipped_tiers_are_filled_in_with_their_age(self):
+        self.cache.apply(1, {'fast', 'medium', 'slow'},
+                         {'active_connections': 3, 'table_cache_hit_ratio': 99.0, 'database_size_mb': 512.0}, 0)
+        metrics = {'active_connections': 5}
+        self.cache.apply(1, {'fast'}, metrics, 30)
+
+        self.assertEqual(metrics['active_connections'], 5)
+        self.assertEqual(metrics['table_cache_hit_ratio'], 99.0)
+        self.assertEqual(metrics['database_size_mb'], 512.0)
+        self.assertEqual(metrics['tier_ages'], {'fast': 0, 'medium': 30, 'slow': 30})
+
+    def test_forget_and_retain(self):
+        for key in (1, 2, 3):
+            self.cache.apply(key, {'fast', 'medium', 'slow'}, {}, 0)
+        self.cache.forget(1)
+        self.cache.retain([2])
+
+        self.assertEqual(self.cache.due(1, self.intervals, 1), {'fast', 'medium', 'slow'})
+        self.assertEqual(self.cache.due(2, self.intervals, 1), {'fast'})
+        self.assertEqual(self.cache.due(3, self.intervals, 1), {'fast', 'medium', 'slow'})
+
+
+if __name__ == '__main__':
+    unittest.main()
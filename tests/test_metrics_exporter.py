@@ -0,0 +1,63 @@
+import time
+import unittest
+
+from prometheus_client import CollectorRegistry, generate_latest
+
+from metrics_exporter import SnapshotCollector
+from snapshot_cache import SnapshotCache
+
+
+class TestSnapshotCollector(unittest.TestCase):
+    def setUp(self):
+        self.cache = SnapshotCache()
+        self.servers = [
+            {'id': 1, 'name': 'primary', 'type': 'postgresql'},
+            {'id': 2, 'name': 'replica', 'type': 'mysql'}
+        ]
+        self.registry = CollectorRegistry()
+        self.registry.register(SnapshotCollector(self.cache, lambda: self.servers))
+
+    def sample(self, name, server_name):
+        return self.registry.get_sample_value(name, {'db_name': server_name, 'db_type': {
+            'primary': 'postgresql', 'replica': 'mysql', 'renamed': 'postgresql'}[server_name]})
+
+    def test_renders_current_snapshot(self):
+        collected_at = time.time() - 5
+        self.cache.put(1, {'status': 'connected', 'error': None, 'queries': [], 'duration_seconds': 0.25,
+                           'metrics': {'active_connections': 12, 'cache_hit_ratio': None}}, collected_at)
+        self.cache.put(2, {'status': 'timeout', 'error': 'No response', 'queries': [], 'metrics': None,
+                           'duration_seconds': 10.0})
+
+        self.assertEqual(self.sample('db_active_connections', 'primary'), 12.0)
+        self.assertIsNone(self.sample('db_cache_hit_ratio', 'primary'))
+        self.assertEqual(self.sample('dbmonitor_server_up', 'primary'), 1.0)
+        self.assertEqual(self.sample('dbmonitor_server_up', 'replica'), 0.0)
+        self.assertEqual(self.sample('dbmonitor_collection_duration_seconds', 'replica'), 10.0)
+        self.assertGreaterEqual(self.sample('dbmonitor_snapshot_age_seconds', 'primary'), 5.0)
+
+        # Samples carry the collection time in milliseconds
+        line = [l for l in generate_latest(self.registry).decode().splitlines()
+                if l.startswith('db_active_connections{')][0]
+        self.assertAlmostEqual(int(line.split()[-1]), collected_at * 1000, delta=10)
+
+    def test_removed_and_renamed_servers_disappear(self):
+        for server in self.servers:
+            self.cache.put(server['id'], {'status': 'connected', 'error': None, 'queries': [],
+                                          'metrics': {'active_connections': 1}})
+        self.assertEqual(self.sample('db_active_connections', 'replica'), 1.0)
+
+        self.servers = [dict(self.servers[0], name='renamed')]
+        self.assertIsNone(self.sample('db_active_connections', 'replica'))
+        self.assertIsNone(self.sample('db_active_connections', 'primary'))
+        self.assertEqual(self.sample('db_active_connections', 'renamed'), 1.0)
+
+    def test_scrape_reports_only_stored_snapshots(self):
+        self.cache.put(1, {'status': 'connected', 'error': None, 'queries': [], 'metrics': {'active_connections': 1}})
+        generate_latest(self.registry)
+
+        self.assertEqual(self.sample('db_active_connections', 'primary'), 1.0)
+        self.assertIsNone(self.sample('dbmonitor_server_up', 'replica'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,27 +1,26 @@
 import pytest
 from unittest.mock import Mock, patch
-from contextlib import ExitStack
-from monitor_service import MonitoringService
-from app import app as flask_app, DatabaseServer, db
+from prometheus_client import REGISTRY, generate_latest
+from monitor_service import ElectedCollector, MonitoringService
+from connection_pool import pool as connection_pool
+from collector import capabilities
+from snapshot_cache import snapshots
+from app import app as flask_app, collector_election, DatabaseServer, StatementSample, db
 import threading
 import time
 
-@pytest.fixture
-def app():
-    flask_app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
-    flask_app.config['TESTING'] = True
-    
-    with flask_app.app_context():
-        db.create_all()
-        yield flask_app
-        db.session.remove()
-        db.drop_all()
-
 @pytest.fixture
 def mock_db_monitor():
-    with patch('monitor_service.DatabaseMonitor') as mock:
+    connection_pool.close_all()
+    capabilities.retain([])
+    with patch('connection_pool.DatabaseMonitor') as mock:
         monitor = Mock()
-        monitor.connection = None
+        monitor.connection = Mock()
+        monitor.probe_capabilities.return_value = {
+            'version': '16.2', 'version_num': 160002, 'extensions': ['pg_stat_statements'],
+            'views': ['pg_stat_statements'], 'permissions': [],
+            'features': {'statements': True, 'statements_exec_time': True, 'statements_info': True}
+        }
         monitor.get_performance_metrics.return_value = {
             'active_connections': 10,
             'database_size_mb': 1000,
@@ -33,31 +32,13 @@ def mock_db_monitor():
         }
         mock.return_value = monitor
         yield mock
+    connection_pool.close_all()
 
 @pytest.fixture
 def mock_prometheus():
-    # Create a mock for the labeled gauge
-    labeled_gauge = Mock()
-    labeled_gauge.set = Mock()
-    
-    # Create a mock for the gauge itself
-    gauge = Mock()
-    gauge.labels.return_value = labeled_gauge
-    
-    patches = [
-        patch('monitor_service.start_http_server'),
-        patch('monitor_service.db_active_connections', gauge),
-        patch('monitor_service.db_size', gauge),
-        patch('monitor_service.db_cpu_usage', gauge),
-        patch('monitor_service.db_memory_usage', gauge),
-        patch('monitor_service.db_disk_usage', gauge),
-        patch('monitor_service.db_cache_hit_ratio', gauge),
-        patch('monitor_service.db_transaction_rate', gauge)
-    ]
-    
-    with ExitStack() as stack:
-        mocks = [stack.enter_context(p) for p in patches]
-        yield mocks[0], labeled_gauge
+    # Gauges are rendered from the snapshot cache; only the port is patched
+    with patch('monitor_service.start_http_server') as mock_server:
+        yield mock_server
 
 @pytest.fixture
 def test_server(app):
@@ -91,8 +72,25 @@ def test_monitoring_service_lifecycle(mock_prometheus):
     service.stop()
     assert not service.running
     
-    mock_server, _ = mock_prometheus
-    mock_server.assert_called_once_with(9090)
+    mock_prometheus.assert_called_once_with(9090)
+
+def test_port_in_use_does_not_stop_collection(mock_prometheus):
+    mock_prometheus.side_effect = OSError(98, 'Address already in use')
+    service = MonitoringService(flask_app, interval=1)
+    
+    with patch.object(flask_app.logger, 'error') as log_error:
+        service.start()
+        assert service.running
+        service.stop()
+    assert 'port 9090' in log_error.call_args[0][0]
+
+def test_elected_collector_leaves_the_port_to_the_app(app, mock_prometheus):
+    service = ElectedCollector(flask_app, collector_election).service
+    assert service.prometheus_port == 0
+    
+    service.start()
+    service.stop()
+    mock_prometheus.assert_not_called()
 
 def test_metrics_collection(mock_db_monitor, mock_prometheus, test_server):
     """Test collecting metrics from a database server"""
@@ -109,11 +107,15 @@ def test_metrics_collection(mock_db_monitor, mock_prometheus, test_server):
     monitor.connect.assert_called()  # Allow multiple calls
     monitor.get_performance_metrics.assert_called()
     
-    # Verify Prometheus metrics were updated
-    _, labeled_gauge = mock_prometheus
+    # Verify Prometheus renders the collected metrics
+    exposition = generate_latest(REGISTRY).decode()
+    assert 'db_active_connections{db_name="test_server",db_type="postgresql"} 10.0' in exposition
     
-    # Verify that metrics were set
-    assert labeled_gauge.set.called
+    # The result was published for the dashboard API
+    with flask_app.app_context():
+        snapshot = snapshots.get(test_server.id)
+    assert snapshot['status'] == 'connected'
+    assert snapshot['metrics']['active_connections'] == 10
 
 def test_error_handling(mock_db_monitor, mock_prometheus, test_server):
     """Test error handling during metrics collection"""
@@ -134,8 +136,9 @@ def test_error_handling(mock_db_monitor, mock_prometheus, test_server):
     monitor.get_performance_metrics.assert_called()
     monitor.close.assert_called()
     
-    # The monitor should have been removed from service.monitors
-    assert len(service.monitors) == 0
+    # The failed connection must not have been returned to the pool
+    with flask_app.app_context():
+        assert connection_pool.stats()[test_server.id]['idle'] == 0
 
 def test_multiple_servers(mock_db_monitor, mock_prometheus, test_server):
     """Test monitoring multiple servers"""
@@ -166,3 +169,46 @@ def test_multiple_servers(mock_db_monitor, mock_prometheus, test_server):
     with flask_app.app_context():
         db.session.delete(server2)
         db.session.commit()
+
+def test_statement_snapshots_store_intervals(mock_db_monitor, test_server):
+    """Only statements that ran between two snapshots are stored"""
+    monitor = mock_db_monitor.return_value
+    def stats(calls):
+        return {'epoch': None, 'statements': {
+            'q1': {'query': 'SELECT 1', 'database': 'app', 'calls': calls, 'total_time_ms': calls * 2.0, 'rows': calls},
+            'q2': {'query': 'SELECT 2', 'database': 'app', 'calls': 7, 'total_time_ms': 1.0, 'rows': 0}
+        }}
+    monitor.get_statement_stats.side_effect = [stats(10), stats(15)]
+    
+    service = MonitoringService(flask_app, interval=1)
+    with flask_app.app_context():
+        snapshots.put(test_server.id, {'status': 'connected', 'error': None, 'metrics': {}, 'queries': []})
+        service._collect_statements()
+        assert StatementSample.query.count() == 0
+        service._collect_statements()
+        
+        samples = StatementSample.query.all()
+        assert [(s.statement_key, s.calls, s.total_time_ms) for s in samples] == [('q1', 5, 10.0)]
+
+
+def test_servers_are_scheduled_with_their_own_interval(mock_db_monitor, test_server):
+    """Every server gets its own metrics task; deleted servers are unscheduled"""
+    with flask_app.app_context():
+        server2 = DatabaseServer(name='test_server2', db_type='mysql', host='localhost', port=3306,
+                                 username='test', password='test', poll_interval=5)
+        db.session.add(server2)
+        db.session.commit()
+        server2_id = server2.id
+    
+    service = MonitoringService(flask_app, interval=30)
+    service._sync()
+    assert service.scheduler.interval(('metrics', test_server.id)) == 30
+    assert service.scheduler.interval(('metrics', server2_id)) == 5
+    assert service.scheduler.interval(('statements', server2_id)) == service.statement_interval
+    
+    with flask_app.app_context():
+        db.session.delete(db.session.get(DatabaseServer, server2_id))
+        db.session.commit()
+    service._sync()
+    assert ('metrics', server2_id) not in service.scheduler.keys()
+    assert ('metrics', test_server.id) in service.scheduler.keys()
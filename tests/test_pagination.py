@@ -0,0 +1,82 @@
+from datetime import datetime
+
+import pytest
+from app import app as flask_app, db, DatabaseServer, QueryHistory, User
+from pagination import encode_cursor, decode_cursor, paginate_keyset, estimate_count, InvalidCursor
+
+
+@pytest.fixture
+def history(app):
+    """25 queries, five per start time, so pages split rows with equal timestamps"""
+    user = User(username='test_user', email='test@example.com', role='admin')
+    user.set_password('test_password')
+    server = DatabaseServer(name='test_server', db_type='postgresql', host='localhost',
+                            port=5432, username='test', password='test')
+    db.session.add_all([user, server])
+    db.session.commit()
+    db.session.add_all([
+        QueryHistory(server_id=server.id, user_id=user.id, query_text=f'SELECT {i}',
+                     start_time=datetime(2026, 1, 1, 12, i // 5))
+        for i in range(25)
+    ])
+    db.session.commit()
+    return [row.id for row in QueryHistory.query.order_by(QueryHistory.start_time.desc(), QueryHistory.id.desc())]
+
+
+KEYS = [QueryHistory.start_time, QueryHistory.id]
+
+
+def test_cursor_round_trip():
+    values = [datetime(2026, 1, 1, 12, 30, 15, 250), 42]
+    assert decode_cursor(encode_cursor('prev', values), 2) == ('prev', values)
+
+    with pytest.raises(InvalidCursor):
+        decode_cursor('not-a-cursor', 2)
+    with pytest.raises(InvalidCursor):
+        decode_cursor(encode_cursor('next', [1]), 2)
+
+
+def test_pages_walk_forward_and_back(history):
+    pages = []
+    page = paginate_keyset(QueryHistory.query, KEYS, 10)
+    assert not page.has_prev
+    while True:
+        pages.append([row.id for row in page])
+        if not page.has_next:
+            break
+        page = paginate_keyset(QueryHistory.query, KEYS, 10, page.next_cursor)
+
+    assert [len(ids) for ids in pages] == [10, 10, 5]
+    assert sum(pages, []) == history
+
+    # Going back from the last page returns the middle page again
+    back = paginate_keyset(QueryHistory.query, KEYS, 10, page.prev_cursor)
+    assert [row.id for row in back] == pages[1]
+    assert back.has_prev and back.has_next
+
+    first = paginate_keyset(QueryHistory.query, KEYS, 10, back.prev_cursor)
+    assert [row.id for row in first] == pages[0]
+    assert not first.has_prev
+
+
+def test_estimate_count(history):
+    assert estimate_count(QueryHistory.query) == 25
+    assert estimate_count(QueryHistory.query.filter(QueryHistory.query_text == 'SELECT 3')) == 1
+
+
+def test_query_history_api(history):
+    client = flask_app.test_client()
+    client.post('/login', data={'username': 'test_user', 'password': 'test_password'})
+
+    response = client.get('/api/query_history?per_page=20&count=1')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert [item['id'] for item in data['items']] == history[:20]
+    assert data['total_estimate'] == 25
+    assert data['prev_cursor'] is None
+
+    data = client.get(f"/api/query_history?per_page=20&cursor={data['next_cursor']}").get_json()
+    assert [item['id'] for item in data['items']] == history[20:]
+    assert data['next_cursor'] is None and data['total_estimate'] is None
+
+    assert client.get('/api/query_history?cursor=bogus').status_code == 400
@@ -0,0 +1,73 @@
+import unittest
+
+from query_fingerprint import FingerprintCache, fingerprint_query, normalize_query
+
+
+class TestNormalizeQuery(unittest.TestCase):
+    def test_literals_become_placeholders(self):
+        self.assertEqual(
+            normalize_query("SELECT * FROM users WHERE id = 42 AND name = 'O''Brien' AND score > -1.5e3"),
+            'select * from users where id = ? and name = ? and score > ?'
+        )
+
+    def test_whitespace_case_and_comments(self):
+        self.assertEqual(
+            normalize_query("select *\n  FROM Users /* hint */ where ID=7; -- trailing"),
+            'select * from users where id = ?'
+        )
+
+    def test_in_and_values_lists_are_collapsed(self):
+        self.assertEqual(normalize_query('SELECT a FROM t WHERE x IN (1, 2, 3)'),
+                         'select a from t where x in (...)')
+        self.assertEqual(normalize_query("INSERT INTO t (a, b) VALUES (1, 'x'), (2, 'y')"),
+                         'insert into t (a, b) values (...)')
+
+    def test_postgres_specific_syntax(self):
+        self.assertEqual(
+            normalize_query("SELECT x::int, j #>> '{a}', $$body$$ FROM t WHERE s = E'\\n'"),
+            'select x :: int, j #>> ?, ? from t where s = ?'
+        )
+
+    def test_empty_query(self):
+        self.assertIsNone(normalize_query(None))
+        self.assertIsNone(fingerprint_query(''))
+
+
+class TestFingerprintQuery(unittest.TestCase):
+    def test_same_statement_with_different_literals(self):
+        self.assertEqual(fingerprint_query('SELECT * FROM t WHERE id = 1'),
+                         fingerprint_query('select *   from t where id=2'))
+
+    def test_grouping_across_dialects(self):
+        raw = fingerprint_query("SELECT * FROM orders WHERE id IN (1, 2) AND status = 'new'")
+        postgres = fingerprint_query('SELECT * FROM orders WHERE id IN ($1, $2, $3) AND status = $4')
+        mysql = fingerprint_query('SELECT * FROM `orders` WHERE `id` IN (...) AND `status` = ?')
+        self.assertEqual(raw, postgres)
+        self.assertEqual(raw, mysql)
+
+    def test_different_statements_differ(self):
+        self.assertNotEqual(fingerprint_query('SELECT a FROM t'), fingerprint_query('SELECT b FROM t'))
+
+    def test_fingerprint_is_64_bit_hex(self):
+        fingerprint = fingerprint_query('SELECT 1')
+        self.assertEqual(len(fingerprint), 16)
+        int(fingerprint, 16)
+
+
+class TestFingerprintCache(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = FingerprintCache(size=2)
+        cache.lookup('SELECT 1')
+        cache.lookup('SELECT 2')
+        cache.lookup('SELECT 1')
+        cache.lookup('SELECT 3')
+
+        self.assertEqual(cache.stats()['size'], 2)
+        cache.lookup('SELECT 1')
+        self.assertEqual(cache.stats()['hits'], 2)
+        cache.lookup('SELECT 2')
+        self.assertEqual(cache.stats()['misses'], 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
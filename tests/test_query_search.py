@@ -0,0 +1,79 @@
+import pytest
+from app import db, DatabaseServer, QueryHistory, User
+from query_fingerprint import fingerprint_query
+from query_search import create_search_index, search_queries
+
+
+@pytest.fixture
+def history(app):
+    user = User(username='test_user', email='test@example.com', role='user')
+    user.set_password('test_password')
+    server = DatabaseServer(name='test_server', db_type='postgresql', host='localhost',
+                            port=5432, username='test', password='test')
+    db.session.add_all([user, server])
+    db.session.commit()
+
+    def add(text):
+        row = QueryHistory(server_id=server.id, user_id=user.id, query_text=text)
+        db.session.add(row)
+        db.session.commit()
+        return row.id
+    return add
+
+
+def search(text):
+    query, rank = search_queries(QueryHistory.query, QueryHistory, db.session, text)
+    return [row.query_text for row in query.order_by(rank, QueryHistory.id)]
+
+
+def test_existing_rows_are_indexed(history):
+    history('SELECT * FROM orders WHERE customer_id = 1')
+    with db.engine.begin() as connection:
+        create_search_index(connection)
+
+    assert search('customer_id') == ['SELECT * FROM orders WHERE customer_id = 1']
+
+
+def test_index_follows_inserts_and_deletes(history):
+    with db.engine.begin() as connection:
+        create_search_index(connection)
+    first = history('SELECT * FROM orders')
+    history('SELECT * FROM invoices')
+
+    assert search('orders') == ['SELECT * FROM orders']
+    # The last token matches as a prefix
+    assert search('invo') == ['SELECT * FROM invoices']
+
+    db.session.delete(db.session.get(QueryHistory, first))
+    db.session.commit()
+    assert search('orders') == []
+
+
+def test_results_are_ranked(history):
+    with db.engine.begin() as connection:
+        create_search_index(connection)
+    history('SELECT name FROM users JOIN accounts ON accounts.user_id = users.id WHERE users.active AND orders > 0')
+    history('SELECT * FROM orders JOIN orders_archive USING (id) WHERE orders.id = 3')
+    history('SELECT * FROM t WHERE id = 3')
+
+    assert search('orders') == [
+        'SELECT * FROM orders JOIN orders_archive USING (id) WHERE orders.id = 3',
+        'SELECT name FROM users JOIN accounts ON accounts.user_id = users.id WHERE users.active AND orders > 0'
+    ]
+    # The same statement shape comes first
+    assert search('select * from t where id = 99') == ['SELECT * FROM t WHERE id = 3']
+
+
+def test_fingerprint_search(history):
+    history('SELECT * FROM t WHERE id = 1')
+    history('SELECT * FROM t WHERE id = 2')
+    history('DELETE FROM t')
+
+    assert len(search(fingerprint_query('select * from t where id = 5'))) == 2
+
+
+def test_without_index_falls_back_to_substring(history):
+    history('SELECT * FROM orders')
+    history('SELECT * FROM invoices')
+
+    assert search('invoices') == ['SELECT * FROM invoices']
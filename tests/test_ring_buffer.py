@@ -0,0 +1,85 @@
+import unittest
+
+from ring_buffer import ServerRing, RingBufferStore
+
+
+class TestServerRing(unittest.TestCase):
+    def test_window_returns_oldest_first(self):
+        ring = ServerRing(capacity=5, metrics=['a'])
+        for second in range(3):
+            ring.append(second * 1000, {'a': second})
+
+        window = ring.window(0, ['a'])
+
+        self.assertEqual(window['times'], [0, 1000, 2000])
+        self.assertEqual(window['series']['a'], [0.0, 1.0, 2.0])
+
+    def test_wraps_around_at_capacity(self):
+        ring = ServerRing(capacity=3, metrics=['a'])
+        for second in range(7):
+            ring.append(second * 1000, {'a': second})
+
+        window = ring.window(0, ['a'])
+
+        self.assertEqual(len(ring), 3)
+        self.assertEqual(window['times'], [4000, 5000, 6000])
+        self.assertEqual(window['series']['a'], [4.0, 5.0, 6.0])
+
+    def test_window_stops_at_since(self):
+        ring = ServerRing(capacity=10, metrics=['a'])
+        for second in range(10):
+            ring.append(second * 1000, {'a': second})
+
+        self.assertEqual(ring.window(7000, ['a'])['times'], [7000, 8000, 9000])
+
+    def test_missing_values_are_none(self):
+        ring = ServerRing(capacity=2, metrics=['a', 'b'])
+        ring.append(1000, {'a': 1, 'b': None})
+
+        window = ring.window(0, ['a', 'b', 'unknown'])
+
+        self.assertEqual(window['series'], {'a': [1.0], 'b': [None]})
+
+    def test_out_of_order_sample_is_dropped(self):
+        ring = ServerRing(capacity=3, metrics=['a'])
+        ring.append(2000, {'a': 2})
+        ring.append(1000, {'a': 1})
+
+        self.assertEqual(ring.window(0, ['a'])['times'], [2000])
+
+    def test_memory_is_fixed_by_capacity(self):
+        ring = ServerRing(capacity=100, metrics=['a', 'b'])
+        before = ring.nbytes
+        for second in range(500):
+            ring.append(second, {'a': 1, 'b': 2})
+
+        self.assertEqual(before, 100 * 8 * 3)
+        self.assertEqual(ring.nbytes, before)
+
+
+class TestRingBufferStore(unittest.TestCase):
+    def test_memory_scales_with_servers(self):
+        metrics = ['m%d' % i for i in range(10)]
+        store = RingBufferStore(capacity=60, metrics=metrics)
+        for server_id in range(2000):
+            store.append(server_id, {'m0': 1.0}, 1000)
+
+        stats = store.stats()
+
+        self.assertEqual(stats['servers'], 2000)
+        self.assertEqual(stats['bytes'], 2000 * 60 * 8 * 11)
+        self.assertEqual(store.memory_bytes(), stats['bytes'])
+
+    def test_retain_and_unknown_server(self):
+        store = RingBufferStore(capacity=4, metrics=['a'])
+        store.append(1, {'a': 1}, 1000)
+        store.append(2, {'a': 2}, 1000)
+
+        store.retain([2])
+
+        self.assertEqual(store.window(1, 0, ['a']), {'times': [], 'series': {'a': []}})
+        self.assertEqual(store.window(2, 0, ['a'])['series']['a'], [2.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
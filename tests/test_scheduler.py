@@ -0,0 +1,124 @@
+import threading
+import time
+
+from prometheus_client import REGISTRY
+
+from scheduler import Scheduler
+
+
+def skipped(group, reason):
+    return REGISTRY.get_sample_value('dbmonitor_schedule_skipped_ticks_total',
+                                     {'group': group, 'reason': reason}) or 0.0
+
+
+def run(scheduler, now):
+    dispatched = scheduler.run_pending(now)
+    for task in scheduler._tasks.values():
+        if task.future is not None:
+            task.future.result(timeout=5)
+    return dispatched
+
+
+def test_runs_stay_on_their_fixed_rate():
+    scheduler = Scheduler(jitter=0)
+    calls = []
+    scheduler.schedule('a', lambda: calls.append('a'), 10, group='test')
+    start = scheduler._tasks['a'].base
+
+    assert run(scheduler, start) == 1
+    # A late dispatch does not push back the following runs
+    assert run(scheduler, start + 13) == 1
+    assert scheduler._tasks['a'].base == start + 20
+    assert run(scheduler, start + 19.9) == 0
+    assert run(scheduler, start + 20) == 1
+    assert calls == ['a', 'a', 'a']
+    scheduler.stop()
+
+
+def test_each_task_has_its_own_interval():
+    scheduler = Scheduler(jitter=0)
+    calls = []
+    scheduler.schedule('fast', lambda: calls.append('fast'), 1, group='test')
+    scheduler.schedule('slow', lambda: calls.append('slow'), 3, group='test', delay=0.5)
+    start = scheduler._tasks['fast'].base
+
+    for step in range(7):
+        run(scheduler, start + step + 0.6)
+    assert calls.count('fast') == 7
+    assert calls.count('slow') == 3
+    scheduler.stop()
+
+
+def test_busy_task_skips_its_tick():
+    scheduler = Scheduler(jitter=0)
+    release = threading.Event()
+    scheduler.schedule('slow', release.wait, 5, group='overrun-test')
+    start = scheduler._tasks['slow'].base
+    before = skipped('overrun-test', 'overrun')
+
+    assert scheduler.run_pending(start) == 1
+    assert scheduler.run_pending(start + 5) == 0
+    assert skipped('overrun-test', 'overrun') == before + 1
+    release.set()
+    scheduler._tasks['slow'].future.result(timeout=5)
+    assert run(scheduler, start + 10) == 1
+    scheduler.stop()
+
+
+def test_missed_ticks_are_dropped_and_counted():
+    scheduler = Scheduler(jitter=0)
+    calls = []
+    scheduler.schedule('a', lambda: calls.append('a'), 10, group='late-test')
+    start = scheduler._tasks['a'].base
+    before = skipped('late-test', 'late')
+
+    run(scheduler, start)
+    assert run(scheduler, start + 45) == 1
+    assert calls == ['a', 'a']
+    assert skipped('late-test', 'late') == before + 3
+    assert scheduler._tasks['a'].base == start + 50
+    scheduler.stop()
+
+
+def test_unscheduled_tasks_never_run():
+    scheduler = Scheduler(jitter=0)
+    calls = []
+    scheduler.schedule('a', lambda: calls.append('a'), 10)
+    scheduler.schedule('b', lambda: calls.append('b'), 10)
+    start = scheduler._tasks['b'].base
+    scheduler.retain(['b'])
+
+    run(scheduler, start)
+    assert calls == ['b']
+    scheduler.stop()
+
+
+def test_stop_returns_without_waiting_for_the_next_run():
+    scheduler = Scheduler()
+    ran = threading.Event()
+    scheduler.schedule('a', ran.set, 3600)
+    scheduler.start()
+    assert ran.wait(5)
+
+    started = time.monotonic()
+    scheduler.stop()
+    assert time.monotonic() - started < 1
+    assert not scheduler.running
+
+
+def test_runs_queued_before_a_restart_do_not_run():
+    scheduler = Scheduler(max_workers=1, jitter=0)
+    release = threading.Event()
+    calls = []
+    scheduler.schedule('slow', lambda: release.wait(5), 60, group='test')
+    scheduler.schedule('queued', lambda: calls.append('queued'), 60, group='test')
+    # The slow run holds the only worker, so the other one waits in the queue
+    assert scheduler.run_pending(time.monotonic()) == 2
+
+    queued = scheduler._tasks['queued'].future
+    scheduler.stop(timeout=0)
+    scheduler.start()
+    release.set()
+    queued.result(timeout=5)
+    scheduler.stop()
+    assert calls == []
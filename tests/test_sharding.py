@@ -0,0 +1,133 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from app import app as flask_app, db, CollectorLease, DatabaseServer, LeaderLease, snapshot_store
+from leader_election import LeaderElection
+from metric_store import utcnow
+from monitor_service import ElectedCollector, MonitoringService
+from sharding import HashRing, ShardCoordinator
+
+
+def coordinator(name):
+    return ShardCoordinator(flask_app, db, CollectorLease, collector_id=name, ttl=30, heartbeat_interval=10)
+
+
+def test_ring_assigns_every_key_to_one_member():
+    ring = HashRing(['a', 'b', 'c'])
+    owners = [ring.owner(key) for key in range(3000)]
+    assert set(owners) == {'a', 'b', 'c'}
+    # Roughly even: no collector gets twice its share
+    assert max(owners.count(member) for member in 'abc') < 2000
+    assert HashRing(['c', 'b', 'a']).owner(42) == ring.owner(42)
+    assert HashRing([]).owner(42) is None
+
+
+def test_adding_a_member_moves_only_its_keys():
+    before = HashRing(['a', 'b', 'c'])
+    after = HashRing(['a', 'b', 'c', 'd'])
+    moved = [key for key in range(3000) if before.owner(key) != after.owner(key)]
+    assert all(after.owner(key) == 'd' for key in moved)
+    assert 0 < len(moved) < 3000 * 0.4
+
+
+def test_collectors_split_the_servers(app):
+    first, second = coordinator('first'), coordinator('second')
+    assert first.heartbeat()
+    assert second.heartbeat()
+    assert first.heartbeat()
+    assert not first.heartbeat()
+    assert first.members() == second.members() == ['first', 'second']
+
+    owned = [(first.owns(server_id), second.owns(server_id)) for server_id in range(1, 201)]
+    assert all(mine != theirs for mine, theirs in owned)
+    assert 0 < sum(mine for mine, _ in owned) < 200
+
+
+def test_servers_of_a_dead_collector_are_taken_over(app):
+    first, second = coordinator('first'), coordinator('second')
+    first.heartbeat()
+    second.heartbeat()
+    first.heartbeat()
+
+    # The second collector stopped heartbeating a lease period ago
+    CollectorLease.query.filter_by(collector_id='second').update({'expires_at': utcnow() - timedelta(seconds=1)})
+    db.session.commit()
+    assert first.heartbeat()
+    assert first.members() == ['first']
+    assert all(first.owns(server_id) for server_id in range(1, 201))
+    assert db.session.get(CollectorLease, 'second') is None
+
+
+def test_released_lease_hands_servers_over(app):
+    first, second = coordinator('first'), coordinator('second')
+    first.heartbeat()
+    second.heartbeat()
+    first.heartbeat()
+    second.release()
+    assert not second.owns(1) and not second.owns(2)
+    assert first.heartbeat()
+    assert first.owns(1) and first.owns(2)
+
+
+def test_monitoring_services_schedule_disjoint_servers(app):
+    servers = [DatabaseServer(name=f'server_{i}', db_type='postgresql', host='localhost', port=5432,
+                              username='test', password='test') for i in range(20)]
+    db.session.add_all(servers)
+    db.session.commit()
+
+    services = [MonitoringService(flask_app, shard=coordinator(name)) for name in ('first', 'second')]
+    for service in services:
+        service.shard.heartbeat()
+    for service in services:
+        service._heartbeat()
+        service._sync()
+    scheduled = [{key[1] for key in service.scheduler.keys() if key[0] == 'metrics'} for service in services]
+    assert scheduled[0].isdisjoint(scheduled[1])
+    assert scheduled[0] | scheduled[1] == {server.id for server in servers}
+
+
+def test_one_collector_runs_the_maintenance(app):
+    services = [MonitoringService(flask_app, shard=coordinator(name)) for name in ('first', 'second')]
+    for service in services:
+        service.shard.heartbeat()
+    for service in services:
+        service._heartbeat()
+
+    with patch('monitor_service.metric_store') as store, patch('monitor_service.statement_store') as statements:
+        for service in services:
+            service._sync()
+    assert store.flush_if_due.call_count == 2
+    assert store.maintain_if_due.call_count == 1
+    assert statements.prune.call_count == 1
+
+
+def test_elected_collector_polls_its_share_next_to_a_dedicated_collector(app):
+    servers = [DatabaseServer(name=f'server_{i}', db_type='postgresql', host='localhost', port=5432,
+                              username='test', password='test') for i in range(20)]
+    db.session.add_all(servers)
+    db.session.commit()
+
+    dedicated = MonitoringService(flask_app, shard=coordinator('dedicated'))
+    elected = ElectedCollector(flask_app, LeaderElection(flask_app, db, LeaderLease, 'test', holder='worker')).service
+    services = [dedicated, elected]
+    for service in services:
+        service.shard.heartbeat()
+    for service in services:
+        service._heartbeat()
+        service._sync()
+
+    polled = []
+
+    def collect(targets):
+        polled.extend(targets)
+        return {server_id: {'status': 'error', 'error': 'down', 'metrics': None, 'queries': []}
+                for server_id in targets}
+
+    # One interval: every scheduled metrics task runs once
+    with patch('monitor_service.collect_many', side_effect=collect):
+        for service in services:
+            for key in service.scheduler.keys():
+                if key[0] == 'metrics':
+                    service._collect_metrics([key[1]])
+    snapshot_store.retain([])
+    assert sorted(polled) == sorted(server.id for server in servers)
@@ -0,0 +1,128 @@
+import threading
+import time
+import unittest
+
+from snapshot_cache import SnapshotCache
+
+
+def result(value):
+    return {'status': 'connected', 'metrics': {'active_connections': value}, 'queries': [], 'error': None}
+
+
+class TestSnapshotCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = SnapshotCache()
+        self.calls = []
+
+    def collect(self, targets):
+        self.calls.append(sorted(targets))
+        return {server_id: result(server_id) for server_id in targets}
+
+    def test_get_reports_age(self):
+        self.cache.put(1, result(5), collected_at=time.time() - 10)
+
+        entry = self.cache.get(1)
+
+        self.assertEqual(entry['metrics'], {'active_connections': 5})
+        self.assertGreaterEqual(entry['age_seconds'], 10)
+        self.assertIsInstance(entry['collected_at'], str)
+        self.assertIsNone(self.cache.get(2))
+
+    def test_open_circuit_keeps_the_last_snapshot(self):
+        collected_at = time.time() - 30
+        self.cache.put(1, result(1), collected_at)
+
+        self.cache.put(1, {'status': 'open', 'error': 'Circuit open after 3 failures', 'queries': [],
+                           'metrics': None})
+
+        entry = self.cache.get(1)
+        self.assertEqual(entry['status'], 'open')
+        self.assertEqual(entry['error'], 'Circuit open after 3 failures')
+        self.assertEqual(entry['metrics'], {'active_connections': 1})
+        self.assertGreaterEqual(entry['age_seconds'], 30)
+
+    def test_refresh_only_stale_entries(self):
+        self.cache.put(1, result(1))
+        self.cache.put(2, result(2), collected_at=time.time() - 120)
+
+        refreshed = self.cache.refresh({1: {}, 2: {}, 3: {}}, max_age=60, collect=self.collect)
+
+        self.assertEqual(self.calls, [[2, 3]])
+        self.assertEqual(sorted(refreshed), [2, 3])
+        self.assertLess(self.cache.age(2), 60)
+
+    def test_refresh_with_an_age_per_server(self):
+        self.cache.put(1, result(1), collected_at=time.time() - 120)
+        self.cache.put(2, result(2), collected_at=time.time() - 120)
+
+        self.cache.refresh({1: {}, 2: {}}, max_age={1: 300, 2: 60}, collect=self.collect)
+
+        self.assertEqual(self.calls, [[2]])
+
+    def test_fresh_cache_does_not_collect(self):
+        self.cache.put(1, result(1))
+
+        self.cache.refresh({1: {}}, max_age=60, collect=self.collect)
+
+        self.assertEqual(self.calls, [])
+
+    def test_concurrent_refreshes_are_shared(self):
+        started = threading.Event()
+
+        def slow_collect(targets):
+            started.set()
+            time.sleep(0.2)
+            return self.collect(targets)
+
+        first = threading.Thread(target=self.cache.refresh, args=({1: {}}, 0, slow_collect))
+        first.start()
+        started.wait(1)
+        refreshed = self.cache.refresh({1: {}}, max_age=0, collect=self.collect)
+        first.join()
+
+        self.assertEqual(self.calls, [[1]])
+        self.assertEqual(refreshed, {})
+        self.assertIsNotNone(self.cache.get(1))
+
+    def test_retain_drops_removed_servers(self):
+        self.cache.put(1, result(1))
+        self.cache.put(2, result(2))
+
+        self.cache.retain([2])
+
+        self.assertIsNone(self.cache.get(1))
+        self.assertIsNotNone(self.cache.get(2))
+
+    def test_subscribers_are_notified_of_their_servers(self):
+        everything = self.cache.subscribe()
+        only_two = self.cache.subscribe([2])
+
+        self.cache.put(1, result(1))
+        self.cache.put(2, result(2))
+        self.cache.put(1, result(1))
+
+        # Repeated updates of a server are coalesced
+        self.assertEqual(everything.get(0), [2, 1])
+        self.assertEqual(only_two.get(0), [2])
+        self.assertEqual(everything.get(0), [])
+
+    def test_subscription_wakes_up_on_put(self):
+        subscription = self.cache.subscribe([1])
+        threading.Timer(0.05, self.cache.put, args=(1, result(1))).start()
+
+        started = time.monotonic()
+        self.assertEqual(subscription.get(5), [1])
+        self.assertLess(time.monotonic() - started, 5)
+
+    def test_unsubscribe_stops_notifications(self):
+        subscription = self.cache.subscribe()
+        self.cache.unsubscribe(subscription)
+
+        self.cache.put(1, result(1))
+
+        self.assertEqual(subscription.get(0), [])
+        self.assertEqual(self.cache.subscriber_count(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
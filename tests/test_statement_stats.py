@@ -0,0 +1,108 @@
+import pytest
+from datetime import datetime, timedelta
+from app import db, DatabaseServer, StatementSample, StatementText
+from statement_stats import StatementDiffer, StatementStore
+
+
+def snapshot(statements, epoch=None):
+    return {'epoch': epoch, 'statements': {
+        key: {'query': f'SELECT {key}', 'database': 'app', 'calls': calls, 'total_time_ms': time, 'rows': rows}
+        for key, (calls, time, rows) in statements.items()
+    }}
+
+
+def by_key(interval):
+    return {change['statement_key']: (change['calls'], change['total_time_ms'], change['rows'])
+            for change in interval['changes']}
+
+
+class TestStatementDiffer:
+    def setup_method(self):
+        self.differ = StatementDiffer()
+
+    def test_first_snapshot_is_baseline(self):
+        assert self.differ.diff(1, snapshot({'a': (10, 100.0, 10)}), 100.0) is None
+
+    def test_only_changed_statements_are_reported(self):
+        self.differ.diff(1, snapshot({'a': (10, 100.0, 10), 'b': (5, 50.0, 5)}), 100.0)
+        interval = self.differ.diff(1, snapshot({'a': (15, 160.0, 12), 'b': (5, 50.0, 5), 'c': (2, 4.0, 0)}), 160.0)
+
+        assert interval['elapsed'] == 60.0
+        assert interval['reset'] is False
+        assert by_key(interval) == {'a': (5, 60.0, 2), 'c': (2, 4.0, 0)}
+
+    def test_reset_epoch_uses_current_values(self):
+        self.differ.diff(1, snapshot({'a': (10, 100.0, 10)}, epoch=1000.0), 100.0)
+        interval = self.differ.diff(1, snapshot({'a': (12, 30.0, 3)}, epoch=2000.0), 160.0)
+
+        assert interval['reset'] is True
+        assert by_key(interval) == {'a': (12, 30.0, 3)}
+
+    def test_reset_detected_without_epoch(self):
+        self.differ.diff(1, snapshot({'a': (10, 100.0, 10), 'b': (20, 10.0, 1)}), 100.0)
+        interval = self.differ.diff(1, snapshot({'a': (1, 5.0, 1), 'b': (2, 1.0, 0)}), 160.0)
+
+        assert interval['reset'] is True
+        assert by_key(interval) == {'a': (1, 5.0, 1), 'b': (2, 1.0, 0)}
+
+    def test_evicted_statement_counts_from_zero(self):
+        self.differ.diff(1, snapshot({'a': (10, 100.0, 10), 'b': (20, 10.0, 1), 'c': (3, 3.0, 3)}), 100.0)
+        interval = self.differ.diff(1, snapshot({'a': (2, 4.0, 2), 'b': (25, 12.0, 1), 'c': (3, 3.0, 3)}), 160.0)
+
+        assert interval['reset'] is False
+        assert by_key(interval) == {'a': (2, 4.0, 2), 'b': (5, 2.0, 0)}
+
+
+@pytest.fixture
+def server(app):
+    server = DatabaseServer(name='test_server', db_type='postgresql', host='localhost',
+                            port=5432, username='test', password='test')
+    db.session.add(server)
+    db.session.commit()
+    return server
+
+
+@pytest.fixture
+def store(app):
+    return StatementStore(db, StatementSample, StatementText, top_n=2, retention_hours=1)
+
+
+NOW = datetime(2026, 1, 10, 12, 0, 0)
+
+
+def change(key, calls, time, rows=0):
+    return {'statement_key': key, 'query': f'SELECT * FROM t WHERE id = {calls}', 'database': 'app',
+            'calls': calls, 'total_time_ms': time, 'rows': rows}
+
+
+def test_record_keeps_top_n_and_texts_once(store, server):
+    store.record(server.id, [change('a', 1, 10.0), change('b', 1, 30.0), change('c', 1, 20.0)], 60, NOW)
+    store.record(server.id, [change('b', 2, 5.0)], 60, NOW + timedelta(minutes=1))
+
+    assert StatementSample.query.count() == 3
+    assert sorted(t.statement_key for t in StatementText.query.all()) == ['b', 'c']
+    assert StatementText.query.filter_by(statement_key='b').one().fingerprint is not None
+
+
+def test_top_sums_intervals_in_window(store, server):
+    store.record(server.id, [change('a', 10, 100.0, 5), change('b', 1, 50.0)], 60, NOW - timedelta(minutes=30))
+    store.record(server.id, [change('a', 2, 4.0, 1), change('b', 1, 20.0)], 60, NOW - timedelta(minutes=5))
+    store.record(server.id, [change('b', 3, 30.0)], 60, NOW - timedelta(minutes=1))
+
+    top = store.top(NOW - timedelta(minutes=15))
+    assert [(s['statement_key'], s['calls'], s['total_time_ms']) for s in top] == [('b', 4, 50.0), ('a', 2, 4.0)]
+    assert top[0]['mean_time_ms'] == 12.5
+    assert top[0]['database'] == 'app'
+
+    by_calls = store.top(NOW - timedelta(hours=1), server_id=server.id, order='calls')
+    assert [s['statement_key'] for s in by_calls] == ['a', 'b']
+
+
+def test_prune_removes_old_intervals_and_orphan_texts(store, server):
+    store.record(server.id, [change('a', 1, 10.0)], 60, NOW - timedelta(hours=2))
+    store.record(server.id, [change('b', 1, 10.0)], 60, NOW)
+
+    store.prune(NOW)
+
+    assert [s.statement_key for s in StatementSample.query.all()] == ['b']
+    assert [t.statement_key for t in StatementText.query.all()] == ['b']